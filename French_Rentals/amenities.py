@@ -0,0 +1,167 @@
+"""
+Single-pass extraction of floor, amenities and numeric hints from listing text.
+
+All keywords of the dictionaries below are compiled into one regex whose
+alternation is factored as a trie (Aho-Corasick style: shared prefixes are
+tested once, leftmost-longest match wins), so a description is scanned once,
+left to right, in the regex engine instead of once per keyword. Numeric
+hints hang off anchor keywords ('étage', 'chambres', ...): their pattern is
+only tried on a few characters around an anchor hit. Text and keywords are
+accent-folded and lowercased, and a keyword directly preceded by "sans",
+"pas de" or "ni" does not count.
+
+To extend it, add synonyms to AMENITIES / FLOOR_KEYWORDS, or anchors and a
+pattern (its first non-empty group is the value) to NUMERIC_HINTS.
+
+Usage:
+    from French_Rentals.amenities import extract
+    extract("Bel appartement au 3ème étage avec ascenseur, colocation de 4")
+    # {'floor': '3ème étage', 'amenities': ['ascenseur'], 'roommates': 4, ...}
+"""
+
+import re
+
+
+AMENITIES = {
+    "balcon": ["balcon", "balcons", "loggia"],
+    "terrasse": ["terrasse"],
+    "ascenseur": ["ascenseur"],
+    "lave_linge": ["lave-linge", "lave linge", "machine à laver", "buanderie"],
+    "lave_vaisselle": ["lave-vaisselle", "lave vaisselle"],
+    "parking": ["parking", "garage", "place de stationnement", "box fermé"],
+    "cave": ["cave", "cellier"],
+    "jardin": ["jardin"],
+    "piscine": ["piscine"],
+    "salle_de_sport": ["salle de sport", "salle de fitness", "salle de musculation"],
+    "internet": ["wifi", "wi-fi", "internet", "fibre"],
+    "climatisation": ["climatisation", "climatisé", "climatisée"],
+    "cuisine_equipee": ["cuisine équipée", "cuisine aménagée", "cuisine entièrement équipée"],
+    "local_velo": ["local vélo", "local vélos", "local à vélos"],
+    "gardien": ["gardien", "gardienne", "concierge"],
+}
+
+# Spelled-out floors, in precedence order (as in the original parse_ad)
+FLOOR_KEYWORDS = {
+    "Rez-de-chaussée": ["rdc", "rez-de-chaussée", "rez de chaussée"],
+    "Duplex": ["duplex"],
+    "Dernier étage": ["dernier étage"],
+}
+
+# field: (anchor keywords, pattern on folded text containing the anchor)
+NUMERIC_HINTS = {
+    "floor": (["étage"], r"(?<!\d)(\d{1,2}) ?(?:er|ere|eme|e)? etage"),
+    "roommates": (["colocation", "colocataires"],
+                  r"colocation (?:de|a) (\d{1,2})\b|(?<!\d)(\d{1,2}) colocataires"),
+    "bedrooms": (["chambre", "chambres"], r"(?<!\d)(\d{1,2}) chambres?\b"),
+    "bathrooms": (["salle de bain", "salles de bain", "salle de bains", "salles de bains",
+                   "salle d'eau", "salles d'eau"],
+                  r"(?<!\d)(\d) salles? (?:de bains?|d'eau)\b"),
+}
+
+# Characters around an anchor in which its pattern is tried
+HINT_WINDOW = 16
+
+NUMERIC_FIELDS = ("roommates", "bedrooms", "bathrooms")
+
+# Accents and typographic apostrophes folded before matching
+FOLD = list(zip("àâäéèêëîïôöùûüÿç’", "aaaeeeeiioouuuyc'"))
+
+NEGATION_RE = re.compile(r"(?:\bsans|\bpas d(?:e |')|\bni) ?$")
+
+
+def fold(text: str) -> str:
+    # One str.replace per character present: several times faster than str.translate,
+    # which goes through a per-character dict lookup for non-ASCII tables
+    text = text.lower()
+    if text.isascii():
+        return text
+    for accented, plain in FOLD:
+        if accented in text:
+            text = text.replace(accented, plain)
+    return text
+
+
+def trie_pattern(words: list[str]) -> str:
+    """Regex alternation of words factored by common prefix: ['cave', 'cellier'] -> 'c(?:ave|ellier)'."""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def render(node: dict) -> str:
+        branches = [re.escape(ch) + render(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f"(?:{body})?" if "" in node else body
+
+    return render(trie)
+
+
+class KeywordExtractor:
+    """Compiled keyword dictionary with anchored numeric hints; see extract()."""
+
+    def __init__(self, amenities: dict = AMENITIES, floors: dict = FLOOR_KEYWORDS,
+                 hints: dict = NUMERIC_HINTS):
+        self.labels = {}    # folded keyword -> ("amenity" | "floor" | "hint", label)
+        for kind, table in (("hint", {f: a for f, (a, _) in hints.items()}),
+                            ("amenity", amenities), ("floor", floors)):
+            for label, words in table.items():
+                for word in words:
+                    self.labels[fold(word)] = (kind, label)
+        self.floor_rank = {label: rank for rank, label in enumerate(floors)}
+        self.hints = {field: re.compile(pattern) for field, (_, pattern) in hints.items()}
+        self.regex = re.compile(rf"\b{trie_pattern(sorted(self.labels))}\b")
+
+    def hint(self, field: str, text: str, start: int, end: int) -> str:
+        """Value of the field's pattern if it matches around text[start:end]."""
+        lo = max(0, start - HINT_WINDOW)
+        for m in self.hints[field].finditer(text, lo, end + HINT_WINDOW):
+            if m.start() <= start and m.end() >= end:
+                return next(g for g in m.groups() if g is not None)
+        return None
+
+    def extract(self, text: str) -> dict:
+        """{'floor': str, 'amenities': [labels], 'roommates': int, 'bedrooms': int, 'bathrooms': int}."""
+        result = {"floor": None, "amenities": [], **dict.fromkeys(NUMERIC_FIELDS)}
+        if not text:
+            return result
+        text = fold(text)
+        amenities = set()
+        floor_word = floor_number = None
+        for m in self.regex.finditer(text):
+            kind, label = self.labels[m.group()]
+            if kind == "hint":
+                # First match of each hint wins
+                if label == "floor" and floor_number is None:
+                    floor_number = self.hint(label, text, m.start(), m.end())
+                elif label != "floor" and result[label] is None:
+                    value = self.hint(label, text, m.start(), m.end())
+                    result[label] = int(value) if value is not None else None
+                continue
+            if NEGATION_RE.search(text, max(0, m.start() - 8), m.start()):
+                continue
+            if kind == "amenity":
+                amenities.add(label)
+            elif floor_word is None or self.floor_rank[label] < self.floor_rank[floor_word]:
+                floor_word = label
+
+        if floor_word:
+            result["floor"] = floor_word
+        elif floor_number:
+            result["floor"] = f"{floor_number}{'er' if floor_number == '1' else 'ème'} étage"
+        result["amenities"] = sorted(amenities)
+        return result
+
+
+_default = None
+
+
+def extract(text: str) -> dict:
+    """Extract with the default dictionaries (compiled on first use)."""
+    global _default
+    if _default is None:
+        _default = KeywordExtractor()
+    return _default.extract(text)
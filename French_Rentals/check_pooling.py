@@ -0,0 +1,208 @@
+"""
+Check the pooled impersonation handler against a local TLS stand-in server.
+
+A threaded HTTPS server (self-signed certificate, HTTP/1.1 keep-alive) counts
+the TCP/TLS connections it accepts and the Cookie headers it receives. The
+same crawl of REQUESTS pages, impersonating safari15_5, is run in a child
+process through scrapy_impersonate's ImpersonateDownloadHandler and through
+French_Rentals.handlers.PooledImpersonateDownloadHandler (compare()).
+
+The checks are the pytest tests of tests/test_pooling.py: the pooled handler
+opens one connection for the whole crawl (one per request before), reports
+every later request as reused with a handshake time below the first one,
+returns the same pages and does not replay cookies from its session jar
+(Scrapy's cookie handling is switched off here, so no Cookie header may
+reach the server). This script runs them and prints the baseline vs pooled
+comparison.
+
+Usage (from the repository root):
+    python -m French_Rentals.check_pooling [--requests 30]
+    python -m pytest tests/test_pooling.py -s
+"""
+
+import datetime
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+HANDLERS = {
+    "baseline": "scrapy_impersonate.ImpersonateDownloadHandler",
+    "pooled": "French_Rentals.handlers.PooledImpersonateDownloadHandler",
+}
+FINGERPRINT = "safari15_5"
+REQUESTS = 30
+
+TESTS = Path(__file__).resolve().parent.parent / "tests" / "test_pooling.py"
+
+
+def make_certificate(directory: Path) -> tuple[Path, Path]:
+    """Self-signed certificate for 127.0.0.1 (cryptography ships with Scrapy)."""
+    import ipaddress
+
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name)
+            .public_key(key.public_key()).serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .add_extension(x509.SubjectAlternativeName(
+                [x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+            .sign(key, hashes.SHA256()))
+    cert_path, key_path = directory / "cert.pem", directory / "key.pem"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(serialization.Encoding.PEM,
+                                           serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, cert: Path, key: Path):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.connections = self.cookies = 0
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        if self.headers.get("Cookie"):
+            with self.server.lock:
+                self.server.cookies += 1
+        body = f"<html><p id='path'>{self.path}</p></html>".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Set-Cookie", "session=stand-in; Path=/")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def crawl(handler: str, port: int, n: int) -> dict:
+    """Child process: crawl n pages through `handler`, return per-request timings."""
+    import scrapy
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    results = {"pages": [], "timings": []}
+
+    class CheckSpider(scrapy.Spider):
+        name = "check_pooling"
+
+        async def start(self):
+            for i in range(n):
+                yield scrapy.Request(f"https://127.0.0.1:{port}/page/{i}", dont_filter=True,
+                                     meta={"impersonate": FINGERPRINT,
+                                           "impersonate_args": {"verify": False}})
+
+        def parse(self, response):
+            results["pages"].append(response.css("#path::text").get())
+            results["timings"].append(response.meta.get("impersonate_timing"))
+
+    settings = get_project_settings()
+    settings.setdict({
+        "DOWNLOAD_HANDLERS": {"http": handler, "https": handler},
+        "DOWNLOAD_DELAY": 0, "CONCURRENT_REQUESTS_PER_DOMAIN": 1, "COOKIES_ENABLED": False,
+        "SPIDER_MIDDLEWARES": {}, "EXTENSIONS": {}, "LOG_LEVEL": "WARNING",
+    }, priority="cmdline")
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(CheckSpider)
+    start = time.perf_counter()
+    process.crawl(crawler)
+    process.start()
+    results["wall"] = time.perf_counter() - start
+    results["stats"] = {k: v for k, v in crawler.stats.get_stats().items()
+                        if k.startswith("impersonate/")}
+    return results
+
+
+def run_child(mode: str, port: int, n: int) -> dict:
+    out = subprocess.run([sys.executable, "-m", "French_Rentals.check_pooling", "--child", mode,
+                          "--port", str(port), "--requests", str(n)],
+                         capture_output=True, text=True, cwd=Path(__file__).resolve().parent.parent)
+    if out.returncode:
+        raise RuntimeError(f"{mode} crawl failed:\n{out.stderr[-3000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def compare(n: int = REQUESTS) -> dict:
+    """Run the crawl through both handlers: {mode: results + server-side counts}."""
+    with tempfile.TemporaryDirectory() as tmp:
+        server = StandInServer(*make_certificate(Path(tmp)))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+        runs = {}
+        try:
+            for mode in HANDLERS:
+                server.reset()
+                result = run_child(mode, port, n)
+                result["connections"], result["cookies"] = server.connections, server.cookies
+                runs[mode] = result
+        finally:
+            server.shutdown()
+    return runs
+
+
+def print_comparison(runs: dict, n: int):
+    print(f"{n} sequential requests to a local TLS server, impersonating {FINGERPRINT}\n")
+    print(f"{'handler':10s} {'wall s':>7s} {'connections':>11s} {'handshake ms':>12s} "
+          f"{'transfer ms':>11s}")
+    for mode, r in runs.items():
+        timings = [t for t in r["timings"] if t]
+        hs = sum(t["handshake_ms"] for t in timings) / len(timings) if timings else float("nan")
+        tr = sum(t["transfer_ms"] for t in timings) / len(timings) if timings else float("nan")
+        print(f"{mode:10s} {r['wall']:7.2f} {r['connections']:11d} {hs:12.2f} {tr:11.2f}")
+
+
+def main(argv: list[str] = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pooled impersonation handler check")
+    parser.add_argument("--requests", type=int, default=REQUESTS)
+    parser.add_argument("--child", choices=list(HANDLERS), help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "French_Rentals.settings")
+        print(json.dumps(crawl(HANDLERS[args.child], args.port, args.requests)))
+        return
+
+    import pytest
+
+    os.environ["POOLING_REQUESTS"] = str(args.requests)
+    sys.exit(pytest.main([str(TESTS), "-q", "-s", "-p", "no:cacheprovider"]))
+
+
+if __name__ == "__main__":
+    main()
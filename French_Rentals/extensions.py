@@ -0,0 +1,92 @@
+# Scrapy hooks for the shared stage instrumentation (data_analysis/instrumentation.py)
+#
+# Both are inert unless RENTALS_PROFILE is set, as a Scrapy setting or in the
+# environment:
+#     scrapy crawl studapart_spider -s RENTALS_PROFILE=1
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/extensions.html
+
+import os
+
+from scrapy import Request, signals
+from scrapy.exceptions import NotConfigured
+
+from data_analysis import instrumentation
+
+
+def _enable_from_settings(settings) -> None:
+    value = settings.get(instrumentation.ENV_VAR) or os.environ.get(instrumentation.ENV_VAR)
+    enabled, cprofile = instrumentation.parse_mode(value)
+    if not enabled:
+        raise NotConfigured
+    instrumentation.enable(cprofile, settings.get("RENTALS_PROFILE_DIR"))
+
+
+class InstrumentationExtension:
+    """Records the whole crawl as the '<spider>.crawl' stage, counting scraped items."""
+
+    def __init__(self):
+        self.crawl = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        _enable_from_settings(crawler.settings)
+        ext = cls()
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        self.crawl = instrumentation.Stage(f"{spider.name}.crawl", records=0).start()
+
+    def item_scraped(self, item, response, spider):
+        self.crawl.records += 1
+
+    def spider_closed(self, spider, reason):
+        self.crawl.stop()
+
+
+class InstrumentationSpiderMiddleware:
+    """
+    Times spider callbacks as '<spider>.<callback>' stages. Callback output
+    is consumed lazily, so each step of the output iterator is one timed call
+    and each yielded item one record.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        _enable_from_settings(crawler.settings)
+        return cls(crawler)
+
+    def _stage_name(self, response) -> str:
+        callback = response.request.callback if response.request else None
+        return f"{self.crawler.spider.name}.{getattr(callback, '__name__', 'parse')}"
+
+    def process_spider_output(self, response, result):
+        name = self._stage_name(response)
+        iterator = iter(result)
+        while True:
+            with instrumentation.stage(name) as s:
+                try:
+                    output = next(iterator)
+                except StopIteration:
+                    return
+                s.records = 0 if isinstance(output, Request) else 1
+            yield output
+
+    async def process_spider_output_async(self, response, result):
+        name = self._stage_name(response)
+        iterator = result.__aiter__()
+        while True:
+            with instrumentation.stage(name) as s:
+                try:
+                    output = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                s.records = 0 if isinstance(output, Request) else 1
+            yield output
@@ -0,0 +1,44 @@
+# Feed storage writing compressed, rotating JSON Lines shards plus a manifest
+# (data_analysis/shard_feed.py), registered as the shards:// scheme:
+#
+#     scrapy crawl studapart_spider -O shards://output_all:jsonl
+#     scrapy crawl studapart_spider -O shards://output_all:jsonl -s FEED_SHARD_ITEMS=2000
+#
+# Shards are published as the crawl goes, so merge_data.py --follow can start
+# on them before it ends. Rotation: FEED_SHARD_ITEMS / FEED_SHARD_BYTES
+# settings, or the shard_items / shard_bytes feed options in FEEDS.
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/feed-exports.html#storages
+
+from scrapy.exceptions import NotConfigured
+
+from data_analysis import shard_feed
+
+SCHEME = "shards://"
+LINE_FORMATS = ("jsonl", "jsonlines")
+
+
+class ShardedFeedStorage:
+    def __init__(self, uri: str, *, feed_options: dict = None,
+                 max_items: int = shard_feed.MAX_ITEMS, max_bytes: int = shard_feed.MAX_BYTES):
+        feed_options = feed_options or {}
+        if feed_options.get("format", "jsonl") not in LINE_FORMATS:
+            raise NotConfigured(f"{SCHEME} feeds need a JSON Lines format, e.g. {uri}:jsonl")
+        self.path = uri[len(SCHEME):] if uri.startswith(SCHEME) else uri
+        self.max_items = int(feed_options.get("shard_items", max_items))
+        self.max_bytes = int(feed_options.get("shard_bytes", max_bytes))
+        self.overwrite = feed_options.get("overwrite", False)
+
+    @classmethod
+    def from_crawler(cls, crawler, uri: str, *, feed_options: dict = None):
+        settings = crawler.settings
+        return cls(uri, feed_options=feed_options,
+                   max_items=settings.getint("FEED_SHARD_ITEMS", shard_feed.MAX_ITEMS),
+                   max_bytes=settings.getint("FEED_SHARD_BYTES", shard_feed.MAX_BYTES))
+
+    def open(self, spider):
+        return shard_feed.ShardWriter(self.path, self.max_items, self.max_bytes, self.overwrite)
+
+    def store(self, file):
+        file.close()
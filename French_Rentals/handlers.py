@@ -0,0 +1,173 @@
+# Pooled download handler around scrapy_impersonate, with connection metrics
+#
+# scrapy_impersonate opens a new curl_cffi AsyncSession for every request, so
+# each listing pays DNS, TCP and a TLS handshake. This handler keeps one
+# session (libcurl connection cache, keep-alive, HTTP/2 when the server
+# negotiates it) per scheme, host, port and browser fingerprint, and records
+# from libcurl's timers, per request and per host:
+#
+#     handshake = DNS + TCP connect + TLS (0 on a reused connection)
+#     transfer  = request sent -> last byte (server time and download)
+#
+# Per-request numbers are in response.meta["impersonate_timing"]; totals in
+# the crawl stats (impersonate/connections_new, .../handshake_ms, ...) and a
+# per-host table is logged when the spider closes. Check it against a local
+# TLS server with `python -m French_Rentals.check_pooling`.
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/download-handlers.html
+
+import logging
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from curl_cffi import CurlInfo
+from curl_cffi.requests import AsyncSession
+from scrapy.http.headers import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.defer import deferred_from_coro
+from scrapy_impersonate.handler import ASYNC_HANDLER_API, ImpersonateDownloadHandler
+from scrapy_impersonate.parser import CurlOptionsParser, RequestParser
+
+logger = logging.getLogger(__name__)
+
+TIMING_INFOS = [
+    CurlInfo.NAMELOOKUP_TIME, CurlInfo.CONNECT_TIME, CurlInfo.APPCONNECT_TIME,
+    CurlInfo.PRETRANSFER_TIME, CurlInfo.STARTTRANSFER_TIME, CurlInfo.TOTAL_TIME,
+    CurlInfo.NUM_CONNECTS,
+]
+
+# CURLINFO_HTTP_VERSION values
+HTTP_VERSIONS = {1: "HTTP/1.0", 2: "HTTP/1.1", 3: "HTTP/2", 30: "HTTP/3"}
+
+
+def request_timing(infos: dict) -> dict:
+    """Milliseconds per phase from libcurl's cumulative timers."""
+    dns = infos[CurlInfo.NAMELOOKUP_TIME]
+    connect = infos[CurlInfo.CONNECT_TIME]
+    tls = infos[CurlInfo.APPCONNECT_TIME]
+    pretransfer = infos[CurlInfo.PRETRANSFER_TIME]
+    total = infos[CurlInfo.TOTAL_TIME]
+    return {
+        "reused": infos[CurlInfo.NUM_CONNECTS] == 0,
+        "dns_ms": dns * 1000,
+        "connect_ms": max(0.0, connect - dns) * 1000,
+        "tls_ms": max(0.0, tls - connect) * 1000 if tls else 0.0,
+        "handshake_ms": (tls or connect) * 1000,
+        "ttfb_ms": max(0.0, infos[CurlInfo.STARTTRANSFER_TIME] - pretransfer) * 1000,
+        "transfer_ms": max(0.0, total - pretransfer) * 1000,
+    }
+
+
+class HostMetrics:
+    def __init__(self):
+        self.requests = self.new_connections = 0
+        self.handshake_ms = self.transfer_ms = 0.0
+        self.versions = defaultdict(int)
+
+    def add(self, timing: dict, version: str):
+        self.requests += 1
+        self.new_connections += not timing["reused"]
+        self.handshake_ms += timing["handshake_ms"]
+        self.transfer_ms += timing["transfer_ms"]
+        self.versions[version] += 1
+
+
+class PooledImpersonateDownloadHandler(ImpersonateDownloadHandler):
+    def __init__(self, crawler) -> None:
+        super().__init__(crawler)
+        settings = crawler.settings
+        self.pool_size = settings.getint("IMPERSONATE_POOL_SIZE") or max(
+            1, settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN"))
+        self.sessions = {}
+        self.metrics = defaultdict(HostMetrics)
+
+    def _session(self, request, curl_options: dict) -> AsyncSession:
+        """Persistent session for the request's origin, fingerprint and curl options."""
+        url = urlsplit(request.url)
+        key = (url.scheme, url.hostname, url.port, request.meta.get("impersonate"),
+               tuple(sorted((int(k), repr(v)) for k, v in curl_options.items())))
+        session = self.sessions.get(key)
+        if session is None:
+            session = AsyncSession(max_clients=self.pool_size, curl_options=curl_options,
+                                   curl_infos=TIMING_INFOS)
+            self.sessions[key] = session
+        return session
+
+    async def _download_request(self, request):
+        # Same request handling as ImpersonateDownloadHandler._download_request,
+        # on a pooled session instead of a new one per request
+        request_copy = request.copy()
+        curl_options = CurlOptionsParser(request_copy).as_dict()
+        client = self._session(request, curl_options)
+
+        request_args = RequestParser(request_copy).as_dict()
+        # Cookies stay with Scrapy's CookiesMiddleware, not the session's jar
+        request_args.setdefault("discard_cookies", True)
+        start_time = time.time()
+        response = await client.request(**request_args)
+        download_latency = time.time() - start_time
+
+        timing = request_timing(response.infos)
+        version = HTTP_VERSIONS.get(response.http_version, str(response.http_version))
+        self.metrics[urlsplit(request.url).netloc].add(timing, version)
+        stats = self._crawler.stats
+        stats.inc_value("impersonate/connections_reused" if timing["reused"]
+                        else "impersonate/connections_new")
+        stats.inc_value("impersonate/handshake_ms", timing["handshake_ms"])
+        stats.inc_value("impersonate/transfer_ms", timing["transfer_ms"])
+        stats.inc_value(f"impersonate/protocol/{version}")
+
+        headers = Headers(response.headers.multi_items())
+        headers.pop("Content-Encoding", None)
+        request_bytes = response.request_size
+        response_bytes = response.header_size + response.download_size
+        stats.inc_value("impersonate/request_bytes", request_bytes)
+        stats.inc_value("impersonate/response_bytes", response_bytes)
+        request.meta["impersonate_request_bytes"] = request_bytes
+        request.meta["impersonate_response_bytes"] = response_bytes
+        request.meta["impersonate_timing"] = timing
+
+        respcls = responsetypes.from_args(headers=headers, url=response.url, body=response.content)
+        resp = respcls(
+            url=response.url,
+            status=response.status_code,
+            headers=headers,
+            body=response.content,
+            flags=["impersonate"],
+            request=request,
+        )
+        resp.meta["download_latency"] = download_latency
+        return resp
+
+    def report(self) -> str:
+        lines = [f"{'host':32s} {'requests':>8s} {'new conns':>9s} {'reused':>7s} "
+                 f"{'handshake ms':>12s} {'transfer ms':>11s}  protocols"]
+        for host, m in sorted(self.metrics.items()):
+            reused = 1 - m.new_connections / m.requests
+            versions = ", ".join(f"{v} {n}" for v, n in sorted(m.versions.items()))
+            lines.append(f"{host:32s} {m.requests:8d} {m.new_connections:9d} {reused:7.0%} "
+                         f"{m.handshake_ms / m.requests:12.1f} {m.transfer_ms / m.requests:11.1f}"
+                         f"  {versions}")
+        return "\n".join(lines)
+
+    async def _close_sessions(self):
+        if self.metrics:
+            logger.info("Impersonated downloads (means per request):\n%s", self.report())
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions.clear()
+
+    if ASYNC_HANDLER_API:
+
+        async def close(self) -> None:
+            await self._close_sessions()
+            await super().close()
+
+    else:
+
+        def close(self):  # type: ignore[override]
+            d = deferred_from_coro(self._close_sessions())
+            d.addCallback(lambda _: super(PooledImpersonateDownloadHandler, self).close())
+            return d
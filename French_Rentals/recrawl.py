@@ -0,0 +1,328 @@
+"""
+Priority-based recrawl scheduling with a per-run request budget.
+
+With DOWNLOAD_DELAY = 1 a run cannot refetch every listing a sitemap offers,
+so the listing requests the sitemap callbacks yield are buffered until the
+sitemaps are exhausted (spider_idle), ranked together and only the top
+RECRAWL_BUDGET are scheduled, highest score first (Request.priority).
+The score of a listing is
+
+    weight * P(changed since the last fetch) = weight * (1 - exp(-rate * age))
+
+where age is the time since its last fetch and rate its change frequency
+per day, estimated from its fetch history with a prior of PRIOR_CHANGES
+changes per PRIOR_DAYS days (so listings fetched once or twice are neither
+ignored nor over-trusted). Listings never fetched score NEW_LISTING_SCORE,
+above any refetch; weight is the business priority of the URL
+(PRIORITY_WEIGHTS, Paris first).
+
+Fetch history lives in RECRAWL_STATE (SQLite, one row per listing URL): a
+fetch whose item content hash differs from the previous one counts as a
+change, and the items of the last fetch are kept. RECRAWL_BUDGET = 0
+schedules everything, still ranked.
+
+A budgeted run must still export every listing the sitemaps offer, or the
+change feed would report the unfetched ones as removed and the snapshot
+store would keep a partial crawl. Listings cut by the budget are carried
+forward: their items from the last fetch are exported again, tagged with
+CarriedForward (the time of that fetch). A listing whose items are not on
+file ranks as new, so it is fetched before anything is carried.
+
+Usage:
+    scrapy crawl studapart_spider -s RECRAWL_BUDGET=2000 -O output_all.json
+    python -m French_Rentals.recrawl --spider studapart_spider --budget 2000
+"""
+
+import hashlib
+import heapq
+import json
+import math
+import re
+import time
+
+from scrapy import Request, signals
+from scrapy.exceptions import DontCloseSpider, NotConfigured
+
+from data_analysis.database import connect_writer
+
+
+DEFAULT_STATE_PATH = "recrawl_state.db"
+
+# URL substring -> business weight; the highest matching weight applies
+PRIORITY_WEIGHTS = {"paris": 2.0}
+
+NEW_LISTING_SCORE = 2.0
+PRIOR_CHANGES = 1.0
+PRIOR_DAYS = 7.0
+
+DAY = 86400.0
+
+
+def item_digest(items: list) -> str:
+    """64-bit digest of the items scraped from a listing page."""
+    payload = json.dumps(items, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+
+def url_weight(url: str) -> float:
+    url = url.lower()
+    return max((w for key, w in PRIORITY_WEIGHTS.items() if key in url), default=1.0)
+
+
+def score(url: str, history: tuple, now: float) -> float:
+    """Recrawl score of a listing; history is (first_fetched, last_fetched, changes) or None."""
+    weight = url_weight(url)
+    if history is None or history[1] is None:
+        return weight * NEW_LISTING_SCORE
+    first_fetched, last_fetched, changes = history
+    observed_days = max(0.0, last_fetched - first_fetched) / DAY
+    rate = (changes + PRIOR_CHANGES) / (observed_days + PRIOR_DAYS)
+    age_days = max(0.0, now - last_fetched) / DAY
+    return weight * (1.0 - math.exp(-rate * age_days))
+
+
+class RecrawlState:
+    """Fetch history per listing URL and the top-N planner."""
+
+    def __init__(self, path: str = DEFAULT_STATE_PATH):
+        self.conn = connect_writer(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS listings (
+                url TEXT PRIMARY KEY,
+                spider TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                first_fetched REAL,
+                last_fetched REAL,
+                fetches INTEGER NOT NULL DEFAULT 0,
+                changes INTEGER NOT NULL DEFAULT 0,
+                content_hash TEXT,
+                items TEXT            -- JSON items of the last fetch, for carrying forward
+            )
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(listings)")}
+        if "items" not in columns:
+            self.conn.execute("ALTER TABLE listings ADD COLUMN items TEXT")
+        self.conn.commit()
+
+    def history(self, spider: str) -> dict:
+        """
+        url -> (first_fetched, last_fetched, changes) for every known listing
+        of a spider; last_fetched is None when the items are not on file.
+        """
+        rows = self.conn.execute("""
+            SELECT url, first_fetched, CASE WHEN items IS NOT NULL THEN last_fetched END, changes
+            FROM listings WHERE spider = ?
+        """, (spider,))
+        return {url: (first, last, changes) for url, first, last, changes in rows}
+
+    def last_items(self, spider: str, urls: list[str]) -> dict:
+        """url -> (last_fetched, [items]) for the given urls whose items are on file."""
+        found = {}
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            found.update((url, (fetched, json.loads(items))) for url, fetched, items in self.conn.execute(f"""
+                SELECT url, last_fetched, items FROM listings
+                WHERE spider = ? AND items IS NOT NULL AND url IN ({', '.join('?' * len(chunk))})
+            """, (spider, *chunk)))
+        return found
+
+    def plan(self, spider: str, urls: list[str], budget: int = None,
+             now: float = None) -> list[tuple[str, float]]:
+        """
+        The top-`budget` urls by score, highest first, as (url, score); all
+        of them, ranked, when budget is None. Unknown urls are remembered as seen.
+        """
+        now = time.time() if now is None else now
+        urls = list(dict.fromkeys(urls))
+        history = self.history(spider)
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO listings (url, spider, first_seen) VALUES (?, ?, ?)",
+            [(url, spider, now) for url in urls if url not in history])
+        self.conn.commit()
+
+        scored = [(score(url, history.get(url), now), url) for url in urls]
+        top = sorted(scored, reverse=True) if budget is None else heapq.nlargest(budget, scored)
+        return [(url, s) for s, url in top]
+
+    def record(self, spider: str, url: str, items: list, now: float = None) -> bool:
+        """Record a fetch of url and its items; returns True when its content changed since the last one."""
+        now = time.time() if now is None else now
+        digest = item_digest(items) if items else None
+        payload = json.dumps(items, ensure_ascii=False, default=str) if items else None
+        row = self.conn.execute("SELECT content_hash, fetches FROM listings WHERE url = ?",
+                                (url,)).fetchone()
+        changed = row is not None and row[1] > 0 and digest is not None and row[0] != digest
+        self.conn.execute("""
+            INSERT INTO listings (url, spider, first_seen, first_fetched, last_fetched,
+                                  fetches, content_hash, items)
+            VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+            ON CONFLICT (url) DO UPDATE SET
+                first_fetched = COALESCE(first_fetched, excluded.first_fetched),
+                last_fetched = excluded.last_fetched,
+                fetches = fetches + 1,
+                changes = changes + ?,
+                content_hash = COALESCE(excluded.content_hash, content_hash),
+                items = excluded.items
+        """, (url, spider, now, now, now, digest, payload, int(changed)))
+        # Committed right away: crawlers running in one process (run_all.py)
+        # share the state file, and a write transaction left open by one
+        # would block the other's writes on the same thread
+        self.conn.commit()
+        return changed
+
+    def close(self):
+        self.conn.close()
+
+
+class RecrawlSpiderMiddleware:
+    """
+    Applies the recrawl plan to spiders with a `recrawl_listing` regex:
+    listing requests yielded by any other callback (the sitemap parsers) are
+    buffered until the spider is idle, then ranked and cut to the remaining
+    budget, and the listings left out are carried forward; responses of
+    listing pages are recorded as fetches.
+    """
+
+    def __init__(self, crawler, state: RecrawlState, budget: int):
+        self.crawler = crawler
+        self.state = state
+        self.remaining = budget or None
+        self.budget = budget
+        self.pending = {}
+        self.counts = dict.fromkeys(("offered", "scheduled", "new", "fetched", "changed", "carried"), 0)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("RECRAWL_ENABLED", True):
+            raise NotConfigured
+        state = RecrawlState(crawler.settings.get("RECRAWL_STATE", DEFAULT_STATE_PATH))
+        mw = cls(crawler, state, crawler.settings.getint("RECRAWL_BUDGET", 0))
+        crawler.signals.connect(mw.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    def _pattern(self):
+        pattern = getattr(self.crawler.spider, "recrawl_listing", None)
+        return re.compile(pattern) if isinstance(pattern, str) else pattern
+
+    def _is_listing_page(self, response) -> bool:
+        pattern = self._pattern()
+        return pattern is not None and bool(pattern.search(response.request.url))
+
+    def _schedule(self, requests: dict) -> list:
+        """Planned subset of {url: Request}, with descending priorities."""
+        plan = self.state.plan(self.crawler.spider.name, list(requests), self.remaining)
+        if self.remaining is not None:
+            self.remaining -= len(plan)
+
+        self.counts["offered"] += len(requests)
+        self.counts["scheduled"] += len(plan)
+        self.counts["new"] += sum(s >= NEW_LISTING_SCORE * url_weight(u) for u, s in plan)
+        return [requests[url].replace(priority=len(plan) - rank)
+                for rank, (url, _) in enumerate(plan)]
+
+    def _carry_forward(self, response, urls: list):
+        """Callback exporting the last items of listings the budget left out."""
+        for url, (fetched, items) in self.state.last_items(self.crawler.spider.name, urls).items():
+            self.counts["carried"] += 1
+            stamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(fetched))
+            for item in items:
+                yield {**item, "CarriedForward": stamp}
+
+    def _record(self, response, items: list):
+        self.counts["fetched"] += 1
+        if self.state.record(self.crawler.spider.name, response.request.url, items):
+            self.counts["changed"] += 1
+
+    def process_spider_output(self, response, result):
+        pattern = self._pattern()
+        if pattern is None:
+            yield from result
+            return
+        if self._is_listing_page(response):
+            items = []
+            for output in result:
+                if not isinstance(output, Request):
+                    items.append(output)
+                yield output
+            self._record(response, items)
+            return
+
+        for output in result:
+            if isinstance(output, Request) and pattern.search(output.url):
+                self.pending.setdefault(output.url, output)
+            else:
+                yield output
+
+    async def process_spider_output_async(self, response, result):
+        pattern = self._pattern()
+        if pattern is None:
+            async for output in result:
+                yield output
+            return
+        if self._is_listing_page(response):
+            items = []
+            async for output in result:
+                if not isinstance(output, Request):
+                    items.append(output)
+                yield output
+            self._record(response, items)
+            return
+
+        async for output in result:
+            if isinstance(output, Request) and pattern.search(output.url):
+                self.pending.setdefault(output.url, output)
+            else:
+                yield output
+
+    def spider_idle(self, spider):
+        """Plan the buffered listings once the sitemaps are exhausted."""
+        if not self.pending:
+            return
+        requests, self.pending = self.pending, {}
+        planned = self._schedule(requests)
+        for request in planned:
+            self.crawler.engine.crawl(request)
+        scheduled = {request.url for request in planned}
+        left_out = [url for url in requests if url not in scheduled]
+        if left_out:
+            self.crawler.engine.crawl(Request("data:,", callback=self._carry_forward,
+                                              cb_kwargs={"urls": left_out}, dont_filter=True))
+        raise DontCloseSpider
+
+    def spider_closed(self, spider, reason):
+        self.state.close()
+        c = self.counts
+        if c["offered"] or c["fetched"]:
+            budget = self.budget or "none"
+            spider.logger.info(
+                f"Recrawl: scheduled {c['scheduled']} of {c['offered']} listings "
+                f"(budget {budget}, {c['new']} new); fetched {c['fetched']}, "
+                f"{c['changed']} changed since their last fetch; "
+                f"{c['carried']} carried forward")
+
+
+def main(argv: list[str] = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show the recrawl plan over known listings")
+    parser.add_argument("--state", default=DEFAULT_STATE_PATH)
+    parser.add_argument("--spider", required=True)
+    parser.add_argument("--budget", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    state = RecrawlState(args.state)
+    history = state.history(args.spider)
+    now = time.time()
+    scored = sorted(((score(url, h, now), url) for url, h in history.items()), reverse=True)
+    new = sum(h[1] is None for h in history.values())
+    print(f"{len(history)} known listings, {new} never fetched")
+    for s, url in scored[:args.budget]:
+        h = history[url]
+        age = "never fetched" if h[1] is None else f"fetched {(now - h[1]) / DAY:.1f} d ago"
+        print(f"{s:6.3f}  {url}  ({age}, {h[2]} changes)")
+    state.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Run every spider of French_Rentals.spiders concurrently in one process.
+
+All spiders share one Twisted reactor; each crawler keeps its own
+downloader, so per-domain politeness (DOWNLOAD_DELAY,
+CONCURRENT_REQUESTS_PER_DOMAIN) is unchanged, but the different sites are
+crawled at the same time and the run takes about as long as the slowest
+spider instead of the sum.
+
+Scraped items of all spiders go through one ingest path: normalized with
+merge_data.normalize_record (source = spider name without '_spider'),
+deduplicated by listing id across spiders and streamed to one shard feed
+(data_analysis/shard_feed.py), which create_database.py --follow can load
+while the crawl runs. A per-spider timing breakdown is printed at the end.
+
+Usage (from the repository root):
+    python -m French_Rentals.run_all
+    python -m French_Rentals.run_all --spiders studapart_spider --output data_analysis/merged_rentals
+    python -m French_Rentals.run_all -s RECRAWL_BUDGET=2000 -s DOWNLOAD_DELAY=2
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+from scrapy.spiderloader import get_spider_loader
+from scrapy.utils.project import get_project_settings
+
+ROOT = Path(__file__).resolve().parent.parent
+ANALYSIS_DIR = ROOT / "data_analysis"
+
+# merge_data and its siblings import each other by bare name. data_analysis
+# is a namespace package that data_analysis/data_analysis.py would shadow once
+# its directory is on sys.path, so it is bound first for the Scrapy
+# extensions (from data_analysis import instrumentation)
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+import data_analysis  # noqa: E402,F401
+sys.path.append(str(ANALYSIS_DIR))
+
+from merge_data import normalize_record  # noqa: E402
+from shard_feed import MAX_ITEMS, ShardWriter  # noqa: E402
+
+
+DEFAULT_OUTPUT = ANALYSIS_DIR / "merged_rentals"
+
+
+def source_name(spider) -> str:
+    return spider.name.removesuffix("_spider")
+
+
+class SharedIngest:
+    """Normalizing, deduplicating sink for the items of every crawler."""
+
+    def __init__(self, output: str, max_items: int = MAX_ITEMS):
+        self.writer = ShardWriter(output, max_items)
+        self.seen = set()
+        self.duplicates = 0
+
+    def item_scraped(self, item, response, spider):
+        record = normalize_record(dict(item), source_name(spider))
+        if record["id"] in self.seen:
+            self.duplicates += 1
+            return
+        self.seen.add(record["id"])
+        self.writer.write_record(record)
+
+    def close(self):
+        self.writer.close()
+
+
+class SpiderTimer:
+    """Start / end of each spider, relative to the start of the run."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = {}
+
+    def spider_opened(self, spider):
+        self.spans[spider.name] = [time.perf_counter() - self.origin, None]
+
+    def spider_closed(self, spider, reason):
+        self.spans[spider.name][1] = time.perf_counter() - self.origin
+
+
+def report(crawlers: list, timer: SpiderTimer, ingest: SharedIngest, wall: float):
+    print(f"\n{'spider':28s} {'start s':>8s} {'end s':>8s} {'time s':>8s} "
+          f"{'requests':>9s} {'items':>7s}  finish")
+    busy = 0.0
+    for crawler in crawlers:
+        name = crawler.spider.name if crawler.spider else crawler.spidercls.name
+        start, end = timer.spans.get(name, [0.0, 0.0])
+        end = wall if end is None else end
+        busy += end - start
+        stats = crawler.stats.get_stats()
+        print(f"{name:28s} {start:8.1f} {end:8.1f} {end - start:8.1f} "
+              f"{stats.get('downloader/request_count', 0):9d} "
+              f"{stats.get('item_scraped_count', 0):7d}  {stats.get('finish_reason', '?')}")
+    print(f"\nWall time {wall:.1f} s for {busy:.1f} s of spider time "
+          f"({busy / wall if wall else 0:.2f}x overlap); "
+          f"{len(ingest.seen)} listings ingested, {ingest.duplicates} cross-spider duplicates "
+          f"-> {ingest.writer.directory}")
+
+
+def run(spiders: list, output: str = str(DEFAULT_OUTPUT), settings=None,
+        max_items: int = MAX_ITEMS) -> dict:
+    """Crawl spider classes (or names) together; returns {spider: seconds}."""
+    settings = settings or get_project_settings()
+    process = CrawlerProcess(settings)
+    ingest = SharedIngest(output, max_items)
+    timer = SpiderTimer()
+
+    crawlers = []
+    for spider in spiders:
+        crawler = process.create_crawler(spider)
+        crawler.signals.connect(ingest.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(timer.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(timer.spider_closed, signal=signals.spider_closed)
+        process.crawl(crawler)
+        crawlers.append(crawler)
+
+    try:
+        process.start()
+    finally:
+        ingest.close()
+    wall = time.perf_counter() - timer.origin
+    report(crawlers, timer, ingest, wall)
+    return {name: (end or wall) - start for name, (start, end) in timer.spans.items()}
+
+
+def main(argv: list[str] = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run all spiders concurrently in one process")
+    parser.add_argument("--spiders", nargs="+", help="Spider names (default: all of them)")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT),
+                        help="Shard feed directory for the normalized listings")
+    parser.add_argument("--shard-items", type=int, default=MAX_ITEMS)
+    parser.add_argument("-s", dest="set", action="append", default=[], metavar="NAME=VALUE",
+                        help="Scrapy setting for every spider (repeatable)")
+    args = parser.parse_args(argv)
+
+    # Resolve scrapy.cfg and relative state files as `scrapy crawl` would
+    output = Path(args.output).resolve()
+    os.chdir(ROOT)
+    settings = get_project_settings()
+    for pair in args.set:
+        name, value = pair.split("=", 1)
+        settings.set(name, value, priority="cmdline")
+
+    names = args.spiders or get_spider_loader(settings).list()
+    print(f"Running {len(names)} spiders in one process: {', '.join(names)}")
+    run(names, str(output), settings, args.shard_items)
+
+
+if __name__ == "__main__":
+    main()
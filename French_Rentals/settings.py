@@ -44,6 +44,18 @@ DOWNLOAD_DELAY = 1
 #    "French_Rentals.middlewares.FrenchRentalsSpiderMiddleware": 543,
 #}
 
+# Stage timing, both inert unless RENTALS_PROFILE is set (see French_Rentals/extensions.py),
+# and the recrawl plan (see French_Rentals/recrawl.py)
+SPIDER_MIDDLEWARES = {
+    "French_Rentals.extensions.InstrumentationSpiderMiddleware": 950,
+    "French_Rentals.recrawl.RecrawlSpiderMiddleware": 900,
+}
+
+# Listing requests scheduled per run, best recrawl scores first (0 = all of
+# them, still ranked), and where the fetch history is kept
+RECRAWL_BUDGET = 0
+RECRAWL_STATE = "recrawl_state.db"
+
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 #DOWNLOADER_MIDDLEWARES = {
@@ -55,6 +67,9 @@ DOWNLOAD_DELAY = 1
 #EXTENSIONS = {
 #    "scrapy.extensions.telnet.TelnetConsole": None,
 #}
+EXTENSIONS = {
+    "French_Rentals.extensions.InstrumentationExtension": 500,
+}
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
@@ -84,10 +99,23 @@ DOWNLOAD_DELAY = 1
 #HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
 
 FEED_EXPORT_ENCODING = "utf-8"
+
+# shards:// feeds: compressed JSON Lines shards rotated at whichever limit is
+# reached first (see French_Rentals/feedstorage.py)
+FEED_STORAGES = {
+    "shards": "French_Rentals.feedstorage.ShardedFeedStorage",
+}
+FEED_SHARD_ITEMS = 10_000
+FEED_SHARD_BYTES = 64 * 1024 * 1024
+
+# scrapy_impersonate with persistent sessions per host and fingerprint, and
+# handshake / transfer metrics (see French_Rentals/handlers.py). Curl handles
+# per session; 0 = CONCURRENT_REQUESTS_PER_DOMAIN
 DOWNLOAD_HANDLERS = {
-    "http": "scrapy_impersonate.ImpersonateDownloadHandler",
-    "https": "scrapy_impersonate.ImpersonateDownloadHandler",
+    "http": "French_Rentals.handlers.PooledImpersonateDownloadHandler",
+    "https": "French_Rentals.handlers.PooledImpersonateDownloadHandler",
 }
+IMPERSONATE_POOL_SIZE = 0
 
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 
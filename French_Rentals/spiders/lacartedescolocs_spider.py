@@ -2,11 +2,16 @@ import scrapy
 import re
 import json
 
+from French_Rentals.amenities import NUMERIC_FIELDS, extract
+
 class LaCarteDesColocsSpider(scrapy.Spider):
     name = "lacartedescolocs_spider"
     
     impersonate_browser = "safari15_5"
 
+    # Listing pages, ranked and cut to RECRAWL_BUDGET by French_Rentals.recrawl
+    recrawl_listing = re.compile(r"/colocations/.*/a/")
+
     def start_requests(self):
         yield scrapy.Request(
             url="https://www.lacartedescolocs.fr/",
@@ -38,7 +43,8 @@ class LaCarteDesColocsSpider(scrapy.Spider):
                 continue
             listing_urls.append(url)
 
-        listing_urls = list(set(listing_urls))
+        # Deduplicated, then ordered by the recrawl middleware
+        listing_urls = list(dict.fromkeys(listing_urls))
 
         for url in listing_urls:
             yield scrapy.Request(
@@ -58,19 +64,9 @@ class LaCarteDesColocsSpider(scrapy.Spider):
         except json.JSONDecodeError:
             return
 
-        description = data.get('description', '').lower()
-        floor_val = None
-        
-        if "rdc" in description or "rez-de-chaussée" in description:
-            floor_val = "Rez-de-chaussée"
-        elif "duplex" in description:
-            floor_val = "Duplex"
-        else:
-            m = re.search(r"(\d+)(?:ème|er)?\s*étage", description)
-            if m: 
-                num = m.group(1)
-                suffix = "er" if num == "1" else "ème"
-                floor_val = f"{num}{suffix} étage"
+        # Floor, amenities and numeric hints in one pass over the description
+        extracted = extract(data.get('description') or '')
+        floor_val = extracted["floor"]
 
         rooms_val = None
         if data.get('lodging_size'):
@@ -118,4 +114,11 @@ class LaCarteDesColocsSpider(scrapy.Spider):
         if data.get('longitude'):
             item["Lon"] = str(data.get('longitude'))
 
+        if extracted["amenities"]:
+            item["Amenities"] = extracted["amenities"]
+
+        for field in NUMERIC_FIELDS:
+            if extracted[field] is not None:
+                item[field.capitalize()] = str(extracted[field])
+
         yield item
\ No newline at end of file
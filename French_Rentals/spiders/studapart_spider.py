@@ -1,6 +1,8 @@
 import scrapy
 import re
 
+from French_Rentals.amenities import NUMERIC_FIELDS, extract
+
 
 class StudapartSpider(scrapy.spiders.SitemapSpider):
     name = "studapart_spider"
@@ -13,6 +15,9 @@ class StudapartSpider(scrapy.spiders.SitemapSpider):
         (r"/fr/", "parse"),
     ]
 
+    # Listing pages, ranked and cut to RECRAWL_BUDGET by French_Rentals.recrawl
+    recrawl_listing = re.compile(r"/fr/")
+
     def clean_text(self, s: str | None) -> str | None:
         if not s:
             return None
@@ -82,17 +87,25 @@ class StudapartSpider(scrapy.spiders.SitemapSpider):
         listing_props = response.css("div.PropertyPage_body p.ft-s::text").getall()
         info = self.parse_main_info(listing_props)
 
-        yield {
+        # Amenities and numeric hints (and the floor, if the properties lack
+        # it) in one pass over the whole listing body
+        extracted = extract(" ".join(response.css("div.PropertyPage_body ::text").getall()))
+
+        item = {
             "AdUrl": response.url,
             "AdTitle": listing_title,
             "RentalPrice_EUR": self.extract_number(listing_price_raw),
             "RentalAddrese": listing_address,
             "RentalSize_m2": self.extract_number(info["size"]),
             "RentalRooms": self.extract_number(info["rooms"]),
-            "RentalFloor": info["floor"],
+            "RentalFloor": info["floor"] or extracted["floor"],
             "RentalType": info["listing_type"],
             "Furnished": info["furnished"],
+            "Amenities": extracted["amenities"],
         }
+        for field in NUMERIC_FIELDS:
+            item[field.capitalize()] = None if extracted[field] is None else str(extracted[field])
+        yield item
 
 
 # For running the spider directly
@@ -0,0 +1,138 @@
+"""
+Throughput of the single-pass amenity extractor against chained regexes.
+
+Seeded synthetic French descriptions are run through:
+  legacy   the original parse_ad floor detection (substring checks + regex,
+           floor only)
+  chained  the same idiom extended to the whole dictionary: one word-bounded
+           regex search per keyword and one full-text search per numeric hint
+  single   French_Rentals.amenities.extract, one pass for everything
+chained and single must agree on every description; the script exits
+non-zero if they do not.
+
+Usage:
+    python bench_amenities.py [--texts 20000] [--words 250] [--seed 0]
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from French_Rentals.amenities import (  # noqa: E402
+    AMENITIES, FLOOR_KEYWORDS, NEGATION_RE, NUMERIC_FIELDS, NUMERIC_HINTS, extract, fold,
+)
+
+
+FILLER = ("appartement lumineux proche du métro et des commerces, situé dans un quartier calme "
+          "avec une belle vue idéal pour étudiants refait à neuf charges comprises caution "
+          "disponible immédiatement visite possible le week-end grand séjour chambre spacieuse "
+          "cuisine salle d'eau placard rangements double vitrage chauffage collectif").split()
+
+
+def description(rng: random.Random, words: int) -> str:
+    tokens = [rng.choice(FILLER) for _ in range(words)]
+    keywords = [w for ws in (*AMENITIES.values(), *FLOOR_KEYWORDS.values()) for w in ws]
+    hints = [f"{rng.randint(1, 9)}ème étage", f"colocation de {rng.randint(2, 6)}",
+             f"{rng.randint(1, 4)} chambres", "1 salle de bain"]
+    for phrase in rng.sample(keywords, rng.randint(0, 8)) + rng.sample(hints, rng.randint(0, 3)):
+        if rng.random() < 0.1:
+            phrase = "sans " + phrase
+        tokens.insert(rng.randrange(len(tokens) + 1), phrase)
+    return " ".join(tokens).capitalize() + "."
+
+
+def legacy_floor(text: str) -> str:
+    """Floor detection as parse_ad did it before amenities.py."""
+    description = text.lower()
+    if "rdc" in description or "rez-de-chaussée" in description:
+        return "Rez-de-chaussée"
+    if "duplex" in description:
+        return "Duplex"
+    m = re.search(r"(\d+)(?:ème|er)?\s*étage", description)
+    if m:
+        return f"{m.group(1)}{'er' if m.group(1) == '1' else 'ème'} étage"
+    return None
+
+
+class Chained:
+    """One search per keyword / pattern, same semantics as KeywordExtractor."""
+
+    def __init__(self):
+        def compile_all(table):
+            return [(label, [re.compile(rf"\b{re.escape(fold(w))}\b") for w in words])
+                    for label, words in table.items()]
+        self.amenities = compile_all(AMENITIES)
+        self.floors = compile_all(FLOOR_KEYWORDS)
+        self.numeric = {name: re.compile(p) for name, (_, p) in NUMERIC_HINTS.items()}
+
+    @staticmethod
+    def present(text: str, patterns: list) -> bool:
+        for pattern in patterns:
+            for m in pattern.finditer(text):
+                if not NEGATION_RE.search(text, max(0, m.start() - 8), m.start()):
+                    return True
+        return False
+
+    def extract(self, text: str) -> dict:
+        text = fold(text)
+        result = {"floor": None, "amenities": [], **dict.fromkeys(NUMERIC_FIELDS)}
+        result["amenities"] = sorted(label for label, ps in self.amenities if self.present(text, ps))
+        result["floor"] = next((label for label, ps in self.floors if self.present(text, ps)), None)
+        for name, pattern in self.numeric.items():
+            m = pattern.search(text)
+            if not m:
+                continue
+            value = next(g for g in m.groups() if g is not None)
+            if name == "floor":
+                if result["floor"] is None:
+                    result["floor"] = f"{value}{'er' if value == '1' else 'ème'} étage"
+            else:
+                result[name] = int(value)
+        return result
+
+
+def throughput(fn, texts: list[str], total_bytes: int) -> tuple[float, float]:
+    start = time.perf_counter()
+    for text in texts:
+        fn(text)
+    elapsed = time.perf_counter() - start
+    return len(texts) / elapsed, total_bytes / elapsed / 1e6
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Amenity extractor throughput benchmark")
+    parser.add_argument("--texts", type=int, default=20000)
+    parser.add_argument("--words", type=int, default=250, help="Filler words per description")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    texts = [description(rng, args.words) for _ in range(args.texts)]
+    total_bytes = sum(len(t.encode()) for t in texts)
+    chained = Chained()
+
+    mismatches = sum(chained.extract(t) != extract(t) for t in texts)
+    print(f"{len(texts)} descriptions, {total_bytes / len(texts):.0f} bytes on average, "
+          f"{len(AMENITIES)} amenities / {sum(map(len, AMENITIES.values()))} keywords\n")
+    print(f"{'extractor':10s} {'texts/s':>10s} {'MB/s':>8s}  fields")
+    results = {}
+    for name, fn, fields in (("legacy", legacy_floor, "floor"),
+                             ("chained", chained.extract, "floor, amenities, hints"),
+                             ("single", extract, "floor, amenities, hints")):
+        results[name] = throughput(fn, texts, total_bytes)
+        print(f"{name:10s} {results[name][0]:10,.0f} {results[name][1]:8.1f}  {fields}")
+
+    print(f"\nsingle pass vs chained: {results['single'][0] / results['chained'][0]:.1f}x")
+    if mismatches:
+        print(f"{mismatches} descriptions differ between chained and single")
+        sys.exit(1)
+    print("chained and single agree on every description")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Concurrency benchmark: reader latency while an ingest writer is running.
+
+Compares the old default-journal connections with the WAL Database layer.
+Each run seeds a temporary database, starts one writer inserting batches and
+several readers running the arrondissement aggregate, then reports reader
+latency percentiles and writer throughput.
+
+Usage:
+    python bench_concurrency.py --rows 50000 --readers 4 --seconds 5
+"""
+
+import argparse
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from create_database import create_tables
+from database import Database
+
+
+READ_QUERY = """
+    SELECT arrondissement, COUNT(*), AVG(price_eur), AVG(price_per_m2)
+    FROM rentals
+    WHERE arrondissement IS NOT NULL AND price_eur IS NOT NULL
+    GROUP BY arrondissement
+"""
+
+INSERT_SQL = """
+    INSERT OR REPLACE INTO rentals
+    (id, source, url, title, price_eur, address, arrondissement,
+     size_m2, price_per_m2, rooms, floor, rental_type, furnished,
+     latitude, longitude)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def random_rows(start: int, count: int, rng: random.Random) -> list[tuple]:
+    """Generate rows shaped like insert_data() output."""
+    rows = []
+    for i in range(start, start + count):
+        price = rng.randint(300, 2500)
+        size = rng.randint(9, 120)
+        rows.append((
+            f"bench{i:010d}",
+            rng.choice(["studapart", "lacartedescolocs"]),
+            f"https://example.invalid/{i}",
+            "Benchmark listing",
+            float(price),
+            "Paris",
+            str(rng.randint(1, 20)).zfill(2),
+            float(size),
+            round(price / size, 2),
+            rng.randint(1, 6),
+            None,
+            "Appartement",
+            "Meublé",
+            None,
+            None,
+        ))
+    return rows
+
+
+def percentile(samples: list[float], q: float) -> float:
+    samples = sorted(samples)
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def run_case(mode: str, rows: int, readers: int, seconds: float, batch: int) -> dict:
+    """Run one writer + N readers for `seconds` and collect latencies."""
+    rng = random.Random(42)
+    tmpdir = tempfile.mkdtemp(prefix="bench_concurrency_")
+    db_path = str(Path(tmpdir) / "bench.db")
+
+    db = None
+    if mode == "wal":
+        db = Database(db_path, pool_size=readers)
+        with db.writer() as conn:
+            create_tables(conn)
+            conn.executemany(INSERT_SQL, random_rows(0, rows, rng))
+    else:
+        conn = sqlite3.connect(db_path)
+        create_tables(conn)
+        conn.executemany(INSERT_SQL, random_rows(0, rows, rng))
+        conn.commit()
+        conn.close()
+
+    stop = threading.Event()
+    latencies = []
+    errors = []
+    written = [0]
+    lock = threading.Lock()
+
+    def writer():
+        next_id = rows
+        while not stop.is_set():
+            batch_rows = random_rows(next_id, batch, rng)
+            next_id += batch
+            try:
+                if db is not None:
+                    with db.writer() as conn:
+                        conn.executemany(INSERT_SQL, batch_rows)
+                else:
+                    conn = sqlite3.connect(db_path)
+                    conn.executemany(INSERT_SQL, batch_rows)
+                    conn.commit()
+                    conn.close()
+                written[0] += batch
+            except sqlite3.Error as e:
+                errors.append(f"writer: {e}")
+
+    def reader():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                if db is not None:
+                    with db.reader() as conn:
+                        conn.execute(READ_QUERY).fetchall()
+                else:
+                    conn = sqlite3.connect(db_path)
+                    conn.execute(READ_QUERY).fetchall()
+                    conn.close()
+            except sqlite3.Error as e:
+                errors.append(f"reader: {e}")
+                continue
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed_ms)
+
+    threads = [threading.Thread(target=writer)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    if db is not None:
+        db.close()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return {
+        "mode": mode,
+        "reads": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "max_ms": round(max(latencies, default=0.0), 2),
+        "rows_written_per_s": round(written[0] / seconds),
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reader latency under write load")
+    parser.add_argument("--rows", type=int, default=50000, help="Rows seeded before the run")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--batch", type=int, default=500, help="Rows per writer commit")
+    args = parser.parse_args()
+
+    print(f"Seed rows: {args.rows}, readers: {args.readers}, "
+          f"duration: {args.seconds}s, writer batch: {args.batch}")
+    results = [run_case(mode, args.rows, args.readers, args.seconds, args.batch)
+               for mode in ("delete", "wal")]
+
+    print(f"\n{'mode':8s} {'reads':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'max ms':>8s} {'rows/s':>8s} {'errors':>7s}")
+    for r in results:
+        print(f"{r['mode']:8s} {r['reads']:8d} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f} "
+              f"{r['max_ms']:8.2f} {r['rows_written_per_s']:8d} {r['errors']:7d}")
+
+
+if __name__ == "__main__":
+    main()
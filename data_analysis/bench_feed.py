@@ -0,0 +1,96 @@
+"""
+Storage and read throughput of spider output: JSON array vs shard feed.
+
+Seeded synthetic Studapart records are written both as the JSON array the
+spiders produce with `-O file.json` and as a compressed JSON Lines shard
+feed (shard_feed.py, fed line by line like the Scrapy exporter does), then
+read back. Reported per format: write time, size on disk, full read time
+and records/s, and when a downstream stage could start on the first records
+(the whole file for the array, the first published shard for the feed).
+
+Usage:
+    python bench_feed.py [--records 200000] [--shard-items 10000]
+"""
+
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from shard_feed import ShardWriter, iter_records, iter_shards
+from synthetic_data import DEFAULT_SEED, generate, studapart_record, write_json_array
+
+
+def dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.iterdir() if p.is_file())
+
+
+def bench_array(records: list[dict], tmp: Path) -> dict:
+    path = tmp / "output_all.json"
+    start = time.perf_counter()
+    write_json_array(path, records)
+    write = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with open(path, "r", encoding="utf-8") as f:
+        n = len(json.load(f))
+    read = time.perf_counter() - start
+    return {"write": write, "size": path.stat().st_size, "read": read, "n": n,
+            "first_write": write, "first_read": read}
+
+
+def bench_shards(records: list[dict], tmp: Path, shard_items: int) -> dict:
+    path = tmp / "output_all"
+    start = time.perf_counter()
+    first_write = None
+    with ShardWriter(path, shard_items) as writer:
+        for record in records:
+            writer.write(json.dumps(record, ensure_ascii=False).encode() + b"\n")
+            if first_write is None and writer.manifest["shards"]:
+                first_write = time.perf_counter() - start
+    write = time.perf_counter() - start
+
+    start = time.perf_counter()
+    next(iter_shards(path))
+    first_read = time.perf_counter() - start
+    start = time.perf_counter()
+    n = sum(1 for _ in iter_records(path))
+    read = time.perf_counter() - start
+    return {"write": write, "size": dir_size(path), "read": read, "n": n,
+            "first_write": first_write or write, "first_read": first_read,
+            "shards": len(writer.manifest["shards"])}
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="JSON array vs shard feed benchmark")
+    parser.add_argument("--records", type=int, default=200_000)
+    parser.add_argument("--shard-items", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args(argv)
+
+    records = list(generate(args.records, studapart_record, args.seed))
+    tmp = Path(tempfile.mkdtemp(prefix="bench_feed_"))
+    try:
+        array = bench_array(records, tmp)
+        shards = bench_shards(records, tmp, args.shard_items)
+    finally:
+        shutil.rmtree(tmp)
+    assert array["n"] == shards["n"] == len(records)
+
+    print(f"{len(records)} records, shard feed of {shards['shards']} shards "
+          f"({args.shard_items} items each)\n")
+    print(f"{'format':12s} {'write s':>8s} {'size MB':>8s} {'read s':>7s} {'records/s':>10s} "
+          f"{'first shard':>12s} {'first read':>11s}")
+    for name, r in (("json array", array), ("shard feed", shards)):
+        print(f"{name:12s} {r['write']:8.2f} {r['size'] / 1e6:8.1f} {r['read']:7.2f} "
+              f"{r['n'] / r['read']:10,.0f} {r['first_write']:11.2f}s {r['first_read']:10.3f}s")
+    print(f"\nshard feed: {array['size'] / shards['size']:.1f}x smaller on disk, "
+          f"{array['read'] / shards['read']:.2f}x the array's read throughput; the first "
+          f"records are readable after {shards['first_write']:.2f} s of writing instead of "
+          f"{array['write']:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
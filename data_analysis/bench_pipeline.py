@@ -0,0 +1,226 @@
+"""
+Scale benchmark of the whole pipeline on synthetic data.
+
+For each size, seeded synthetic spider output (synthetic_data.py) is pushed
+through every stage: merge_datasets, create_tables + insert_data, each
+statement of sql_queries.sql, and generate_all_visualizations. Wall time and
+the tracemalloc peak are recorded per stage, and the results are written to
+bench_results/pipeline_<git revision>.json so two revisions can be compared.
+
+tracemalloc slows allocation-heavy stages down; pass --no-tracemalloc for
+pure timings. Plot rendering runs in worker processes, which tracemalloc does
+not see; their footprint shows in the children max RSS instead.
+
+Usage:
+    python bench_pipeline.py run --sizes 10000 1000000 10000000
+    python bench_pipeline.py compare bench_results/pipeline_abc123.json bench_results/pipeline_def456.json
+"""
+
+import argparse
+import json
+import platform
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+from create_database import create_tables, insert_data
+from database import connect_reader, connect_writer
+from merge_data import merge_datasets
+from synthetic_data import DEFAULT_SEED, generate_dataset
+from visualizations import generate_all_visualizations
+
+
+SQL_FILE = Path(__file__).with_name("sql_queries.sql")
+RESULTS_DIR = "bench_results"
+
+# Slowdown ratio reported as a regression by `compare`
+REGRESSION_RATIO = 1.10
+
+
+def git_revision() -> str:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, cwd=Path(__file__).parent).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_statements(path: Path = SQL_FILE) -> list[str]:
+    """Split sql_queries.sql into complete statements, dropping comment lines."""
+    statements, buffer = [], ""
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.strip().startswith("--"):
+            continue
+        buffer += line + "\n"
+        if sqlite3.complete_statement(buffer):
+            statements.append(buffer.strip())
+            buffer = ""
+    return statements
+
+
+class Stage:
+    """Context manager measuring wall time and tracemalloc peak of a stage."""
+
+    def __init__(self, results: dict, name: str, trace: bool):
+        self.results = results
+        self.name = name
+        self.trace = trace
+
+    def __enter__(self):
+        if self.trace:
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        entry = {"seconds": round(time.perf_counter() - self.start, 4)}
+        if self.trace:
+            entry["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+        self.results[self.name] = entry
+        print(f"  {self.name:28s} {entry['seconds']:9.3f}s"
+              + (f" {entry['peak_mb']:10.1f} MB peak" if self.trace else ""))
+        return False
+
+
+def run_size(n: int, work_dir: Path, seed: int, trace: bool, workers: int) -> dict:
+    """Run every stage on n synthetic records; returns {stage: measurements}."""
+    size_dir = work_dir / f"n{n}_seed{seed}"
+    stages = {}
+
+    start = time.perf_counter()
+    files = generate_dataset(n, size_dir, seed)
+    print(f"  {'(generate input)':28s} {time.perf_counter() - start:9.3f}s")
+
+    if trace:
+        tracemalloc.start()
+    try:
+        with Stage(stages, "merge_datasets", trace):
+            merged = merge_datasets(files)
+
+        db_path = size_dir / "bench.db"
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+        with Stage(stages, "insert_data", trace):
+            conn = connect_writer(str(db_path))
+            create_tables(conn)
+            insert_data(conn, merged)
+            conn.close()
+        del merged
+
+        conn = connect_reader(str(db_path))
+        for i, statement in enumerate(load_statements(), 1):
+            with Stage(stages, f"sql_query_{i}", trace):
+                conn.execute(statement).fetchall()
+        conn.close()
+
+        plots_dir = size_dir / "plots"
+        shutil.rmtree(plots_dir, ignore_errors=True)
+        with Stage(stages, "generate_all_visualizations", trace):
+            generate_all_visualizations(str(db_path), str(plots_dir), workers=workers, force=True)
+    finally:
+        if trace:
+            tracemalloc.stop()
+
+    stages["_rows"] = n
+    stages["_db_mb"] = round(db_path.stat().st_size / 1e6, 2)
+    return stages
+
+
+def run(args):
+    work_dir = Path(args.work)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    results = {
+        "revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "tracemalloc": args.tracemalloc,
+        "sizes": {},
+    }
+
+    for n in args.sizes:
+        print(f"\n=== {n} records ===")
+        results["sizes"][str(n)] = run_size(n, work_dir, args.seed, args.tracemalloc, args.workers)
+
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    results["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 1e6, 1)
+    results["children_max_rss_mb"] = round(
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 1e6, 1)
+
+    out = Path(args.results)
+    out.mkdir(parents=True, exist_ok=True)
+    path = out / f"pipeline_{results['revision']}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {path}")
+
+    if not args.keep:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare(args) -> int:
+    """Print per-stage ratios between two result files; non-zero exit on regressions."""
+    with open(args.baseline, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.candidate, encoding="utf-8") as f:
+        cand = json.load(f)
+
+    print(f"baseline {base['revision']}  vs  candidate {cand['revision']}")
+    print(f"{'rows':>10s} {'stage':28s} {'base s':>9s} {'cand s':>9s} {'ratio':>7s}")
+    regressions = 0
+    for size, stages in cand["sizes"].items():
+        base_stages = base["sizes"].get(size, {})
+        for stage, entry in stages.items():
+            if stage.startswith("_") or stage not in base_stages:
+                continue
+            before, after = base_stages[stage]["seconds"], entry["seconds"]
+            ratio = after / before if before else float("inf")
+            flag = ""
+            if ratio > args.threshold and after - before > args.min_seconds:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"{size:>10s} {stage:28s} {before:9.3f} {after:9.3f} {ratio:7.2f}{flag}")
+    print(f"\n{regressions} regression(s) above {args.threshold:.2f}x")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline scale benchmark on synthetic data")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    r = sub.add_parser("run", help="Benchmark every stage at each size")
+    r.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    r.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    r.add_argument("--work", default="bench_work", help="Scratch directory for inputs and databases")
+    r.add_argument("--results", default=RESULTS_DIR)
+    r.add_argument("--workers", type=int, default=None, help="Plot rendering processes")
+    r.add_argument("--no-tracemalloc", dest="tracemalloc", action="store_false")
+    r.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+
+    c = sub.add_parser("compare", help="Compare two result files")
+    c.add_argument("baseline")
+    c.add_argument("candidate")
+    c.add_argument("--threshold", type=float, default=REGRESSION_RATIO)
+    c.add_argument("--min-seconds", type=float, default=0.05,
+                   help="Ignore slowdowns smaller than this in absolute terms")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
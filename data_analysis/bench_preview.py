@@ -0,0 +1,95 @@
+"""
+Exact vs preview (stratified sample) latency as the corpus grows.
+
+One synthetic database (index_advisor.synthetic_rows) is grown through the
+given sizes; the preview sample is maintained on every batch with
+update_sample(), as insert_data does. At each size the chart data for both
+arrondissement plots and the summary are computed exactly (rentals table)
+and from the sample (--approx). Reported: time of both, and how many exact
+per-arrondissement averages fall inside the preview's 95% CI.
+
+Usage:
+    python bench_preview.py [--sizes 10000 100000 1000000] [--db /tmp/bench_preview.db]
+"""
+
+import argparse
+import contextlib
+import io
+import time
+from pathlib import Path
+
+from create_database import create_tables, print_summary
+from database import connect_writer
+from index_advisor import INSERT_SQL, synthetic_rows
+from reservoir_sample import print_sample_summary, update_sample
+from visualizations import PLOT_SPECS, load_frame, prepare_data
+
+SPECS = [spec for spec in PLOT_SPECS if spec.kind == "arrondissement"]
+REPEAT = 3
+
+
+def sample_rows(rows: list[tuple]):
+    """synthetic_rows tuples as update_sample() rows (non-outliers only)."""
+    for (id_, source, _, _, price, arrondissement, size, per_m2, rooms,
+         rental_type, furnished, _, _, is_outlier) in rows:
+        if not is_outlier:
+            yield source, arrondissement, id_, price, size, per_m2, rooms, rental_type, furnished
+
+
+def preview(conn, approx: bool):
+    """Chart data of the arrondissement plots plus the summary; (frames, seconds)."""
+    best, frames = float("inf"), None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        frame = load_frame(conn, approx)
+        frames = [prepare_data(frame, spec) for spec in SPECS]
+        with contextlib.redirect_stdout(io.StringIO()):
+            (print_sample_summary if approx else print_summary)(conn)
+        best = min(best, time.perf_counter() - start)
+    return frames, best
+
+
+def covered(exact, approx) -> tuple[int, int]:
+    """Exact averages inside the estimate's 95% CI, and the number compared."""
+    merged = exact.merge(approx, on="arrondissement", suffixes=("", "_approx"))
+    inside = (merged["avg_price"] - merged["avg_price_approx"]).abs() <= merged["avg_price_ci"] + 0.01
+    return int(inside.sum()), len(merged)
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Exact vs preview latency benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--db", default="/tmp/bench_preview.db")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    path = Path(args.db)
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        conn = connect_writer(str(path))
+        create_tables(conn)
+
+    print(f"{'rows':>10s} {'sampled':>8s} {'exact s':>8s} {'preview s':>10s} {'speedup':>8s} {'in 95% CI':>10s}")
+    total = 0
+    for size in sorted(args.sizes):
+        rows = list(synthetic_rows(size - total, args.seed, offset=total))
+        conn.executemany(INSERT_SQL, rows)
+        update_sample(conn, sample_rows(rows))
+        conn.commit()
+        total = size
+
+        exact, exact_s = preview(conn, approx=False)
+        approx, approx_s = preview(conn, approx=True)
+        inside = [covered(e, a) for e, a in zip(exact, approx)]
+        sampled = conn.execute("SELECT COUNT(*) FROM rental_sample").fetchone()[0]
+        print(f"{size:10d} {sampled:8d} {exact_s:8.3f} {approx_s:10.3f} {exact_s / approx_s:7.1f}x "
+              f"{sum(i for i, _ in inside):>5d}/{sum(n for _, n in inside):<4d}")
+
+    conn.close()
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
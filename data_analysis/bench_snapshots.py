@@ -0,0 +1,124 @@
+"""
+Weekly trend over a year of crawls: kept JSON copies vs the snapshot store.
+
+A year of weekly merged snapshots is simulated from seeded synthetic
+Studapart listings (a share of listings replaced and prices drifting every
+week) and kept both as merged_rentals.json-style copies and as snapshot
+store partitions (snapshot_store.py). The query "median price per
+arrondissement per week" is then answered from both: every JSON copy has to
+be parsed whole, the store maps three column files per partition. Results
+must match; reported are disk size, query time and bytes read.
+
+Usage:
+    python bench_snapshots.py [--listings 10000] [--weeks 52]
+"""
+
+import argparse
+import datetime
+import json
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from create_database import paris_arrondissement, safe_float
+from geo_index import resolve_addresses
+from merge_data import normalize_record
+from snapshot_store import SnapshotStore, dir_size, iso_week, weekly_medians
+from synthetic_data import DEFAULT_SEED, generate, studapart_record
+
+WEEKLY_TURNOVER = 0.05
+WEEKLY_DRIFT = 0.002
+FIRST_CRAWL = datetime.date(2025, 1, 6)
+
+
+def simulate(listings: int, weeks: int, seed: int):
+    """(date, records) per weekly crawl."""
+    rng = random.Random(seed)
+    fresh = (normalize_record(r, "studapart")
+             for r in generate(listings * (1 + int(weeks * WEEKLY_TURNOVER) + 1), studapart_record, seed))
+    current = [next(fresh) for _ in range(listings)]
+    for week in range(weeks):
+        if week:
+            for i in rng.sample(range(listings), int(listings * WEEKLY_TURNOVER)):
+                current[i] = next(fresh)
+        factor = 1 + WEEKLY_DRIFT * week
+        snapshot = [{**r, "price_eur": str(round(float(r["price_eur"]) * factor))} for r in current]
+        yield FIRST_CRAWL + datetime.timedelta(weeks=week), snapshot
+
+
+def json_trend(paths: list[tuple[datetime.date, Path]]) -> dict:
+    trend = {}
+    for date, path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        groups = defaultdict(list)
+        places = resolve_addresses([record.get("address") for record in records])
+        for record, place in zip(records, places):
+            arrondissement, _ = paris_arrondissement(record.get("address"), safe_float(record.get("latitude")),
+                                                     safe_float(record.get("longitude")), place.city)
+            price = safe_float(record.get("price_eur"))
+            if arrondissement and price is not None:
+                groups[arrondissement].append(price)
+        trend[iso_week(date)] = {a: statistics.median(v) for a, v in groups.items()}
+    return trend
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="JSON copies vs snapshot store benchmark")
+    parser.add_argument("--listings", type=int, default=10_000)
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args(argv)
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench_snapshots_"))
+    try:
+        copies = tmp / "copies"
+        copies.mkdir()
+        store = SnapshotStore(tmp / "snapshots")
+        paths = []
+        write_json = write_store = 0.0
+        for date, records in simulate(args.listings, args.weeks, args.seed):
+            path = copies / f"merged_rentals_{date}.json"
+            start = time.perf_counter()
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(records, f, ensure_ascii=False, indent=2)
+            write_json += time.perf_counter() - start
+            paths.append((date, path))
+            start = time.perf_counter()
+            store.write(records, date)
+            write_store += time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = json_trend(paths)
+        json_s = time.perf_counter() - start
+
+        store.files_read.clear()
+        start = time.perf_counter()
+        trend = weekly_medians(store, "price_eur", "arrondissement")
+        store_s = time.perf_counter() - start
+
+        json_size, store_size = dir_size(copies), dir_size(store.root)
+        read_bytes = sum(p.stat().st_size for p in set(store.files_read))
+    finally:
+        shutil.rmtree(tmp)
+
+    assert trend.keys() == expected.keys()
+    for week, row in expected.items():
+        assert row.keys() == trend[week].keys(), week
+        assert all(abs(row[a] - trend[week][a]) < 0.01 for a in row), week
+
+    print(f"{args.weeks} weekly snapshots of {args.listings} listings\n")
+    print(f"{'format':15s} {'write s':>8s} {'size MB':>8s} {'query s':>8s} {'read MB':>8s}")
+    print(f"{'json copies':15s} {write_json:8.2f} {json_size / 1e6:8.1f} {json_s:8.2f} {json_size / 1e6:8.1f}")
+    print(f"{'snapshot store':15s} {write_store:8.2f} {store_size / 1e6:8.1f} {store_s:8.3f} "
+          f"{read_bytes / 1e6:8.2f}")
+    print(f"\nstore: {json_size / store_size:.1f}x smaller, trend query {json_s / store_s:.0f}x faster, "
+          f"{read_bytes / store_size:.1%} of the store read")
+
+
+if __name__ == "__main__":
+    main()
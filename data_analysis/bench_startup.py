@@ -0,0 +1,95 @@
+"""
+Start-up benchmark for the lightweight cli.py commands.
+
+Each command is run repeatedly in a fresh interpreter; the budget applies to
+its median wall time, interpreter start-up included. A bare `python -c pass`
+is timed too, for reference: it is what no command can go below. A second
+run under `python -X importtime` checks that none of the heavy libraries is
+imported at all, which holds regardless of machine speed. Exits non-zero if
+either check fails.
+
+Usage:
+    python bench_startup.py [--db paris_rentals.db] [--runs 10] [--budget-ms 100]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+CLI = str(Path(__file__).with_name("cli.py"))
+
+HEAVY_MODULES = ("pandas", "numpy", "matplotlib", "seaborn", "scipy")
+
+DEFAULT_BUDGET_MS = 100
+
+
+def light_commands(db: str) -> list[list[str]]:
+    return [
+        ["--help"],
+        ["summary", "--db", db],
+        ["query", "--db", db, "run", "rental_types"],
+        ["query", "--db", db, "list"],
+    ]
+
+
+def median_ms(cmd: list[str], runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def heavy_imports(cmd: list[str]) -> list[str]:
+    """Top-level packages from HEAVY_MODULES imported while running cmd."""
+    result = subprocess.run([sys.executable, "-X", "importtime", *cmd[1:]],
+                            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    found = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            module = line.rsplit("|", 1)[1].strip().split(".")[0]
+            if module in HEAVY_MODULES:
+                found.add(module)
+    return sorted(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Start-up time of the light cli.py commands")
+    parser.add_argument("--db", default="paris_rentals.db")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args()
+
+    if not Path(args.db).exists():
+        print(f"Error: {args.db} not found.")
+        sys.exit(2)
+
+    baseline = median_ms([sys.executable, "-c", "pass"], args.runs)
+    print(f"Bare interpreter: {baseline:.1f} ms (median of {args.runs})\n")
+    print(f"{'command':48s} {'median ms':>10s} {'over bare':>10s}  heavy imports")
+
+    failures = 0
+    for argv in light_commands(args.db):
+        cmd = [sys.executable, CLI, *argv]
+        elapsed = median_ms(cmd, args.runs)
+        heavy = heavy_imports(cmd)
+        ok = elapsed <= args.budget_ms and not heavy
+        failures += not ok
+        print(f"{' '.join(argv):48s} {elapsed:10.1f} {elapsed - baseline:10.1f}  "
+              f"{', '.join(heavy) or '-'}{'' if ok else '  FAIL'}")
+
+    print(f"\nBudget: {args.budget_ms:.0f} ms per command, "
+          f"no {'/'.join(HEAVY_MODULES)} imports")
+    if failures:
+        print(f"{failures} command(s) over budget")
+        sys.exit(1)
+    print("All commands within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Per-crawl change feed of added, removed and changed listings.
+
+Instead of every consumer diffing whole merged_rentals.json snapshots, each
+merge writes changes/changes_<time>[_NN].jsonl (a sequence suffix when two
+merges land in the same second), one event per line keyed by the
+merge_data.generate_id identity:
+
+    {"op": "added",   "id": ..., "source": ..., "url": ..., "after": {...}}
+    {"op": "removed", "id": ..., "source": ..., "url": ..., "before": {...}}
+    {"op": "changed", "id": ..., "source": ..., "url": ..., "fields": ["price_eur"],
+     "before": {...}, "after": {...}}
+
+before/after hold TRACKED_FIELDS; "changed" means the record's content hash
+differs, "fields" lists the tracked fields among the differences.
+
+The feed is a streaming hash-join: the previous snapshot is only present as
+its id -> hash index (changes/snapshot_index.tsv: id, content hash and the
+tracked values as JSON), held in a dict of raw strings, and the current
+records are streamed past it once while the new index is written. Only the
+entries of changed and removed listings are parsed; ids left in the dict
+afterwards were removed. Memory is O(index), neither snapshot is loaded a
+second time.
+
+Usage:
+    python change_feed.py [--merged merged_rentals.json] [--dir changes]
+    python change_feed.py --baseline       # only (re)write the index
+"""
+
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Iterable
+
+from instrumentation import configure, instrumented
+
+
+CHANGES_DIR = "changes"
+INDEX_NAME = "snapshot_index.tsv"
+
+TRACKED_FIELDS = ("price_eur", "size_m2", "furnished")
+
+
+def content_hash(record: dict) -> str:
+    """64-bit digest of the normalized record."""
+    payload = json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+
+def load_index(path: Path) -> dict:
+    """id -> (hash, unparsed '{"s": source, "u": url, "v": [tracked values]}')."""
+    index = {}
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                rid, digest, payload = line.rstrip("\n").split("\t", 2)
+                index[rid] = (digest, payload)
+    return index
+
+
+def tracked(values: list) -> dict:
+    return dict(zip(TRACKED_FIELDS, values))
+
+
+def new_feed_path(out_dir: Path) -> Path:
+    """changes_<time>.jsonl, with a _NN sequence suffix when a feed of the same second exists."""
+    stem = f"changes_{time.strftime('%Y%m%dT%H%M%S')}"
+    path, seq = out_dir / f"{stem}.jsonl", 0
+    while path.exists() or path.with_suffix(".tmp").exists():
+        seq += 1
+        path = out_dir / f"{stem}_{seq:02d}.jsonl"
+    return path
+
+
+@instrumented(records=lambda counts: sum(counts.values()))
+def write_change_feed(records: Iterable[dict], changes_dir: str = CHANGES_DIR,
+                      baseline: bool = False) -> dict:
+    """
+    Join records against the previous index, append the events to a new feed
+    file and replace the index. Returns {'added': n, 'removed': n, 'changed': n,
+    'unchanged': n}; with baseline=True no feed is written.
+    """
+    out_dir = Path(changes_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    index_path = out_dir / INDEX_NAME
+    previous = {} if baseline else load_index(index_path)
+    first_run = not index_path.exists()
+
+    counts = dict.fromkeys(("added", "removed", "changed", "unchanged"), 0)
+    feed_path = None if baseline else new_feed_path(out_dir)
+    tmp_index = index_path.with_suffix(".tmp")
+    feed = None if baseline else open(feed_path.with_suffix(".tmp"), "w", encoding="utf-8")
+
+    def emit(event: dict):
+        counts[event["op"]] += 1
+        feed.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    with open(tmp_index, "w", encoding="utf-8") as new_index:
+        for record in records:
+            rid = record["id"]
+            digest = content_hash(record)
+            values = [record.get(field) for field in TRACKED_FIELDS]
+            payload = json.dumps({"s": record.get("source"), "u": record.get("url"), "v": values},
+                                 ensure_ascii=False)
+            new_index.write(f"{rid}\t{digest}\t{payload}\n")
+            if feed is None:
+                continue
+
+            old = previous.pop(rid, None)
+            head = {"id": rid, "source": record.get("source"), "url": record.get("url")}
+            if old is None:
+                emit({"op": "added", **head, "after": tracked(values)})
+            elif old[0] != digest:
+                before = json.loads(old[1])["v"]
+                fields = [f for f, a, b in zip(TRACKED_FIELDS, before, values) if a != b]
+                emit({"op": "changed", **head, "fields": fields,
+                      "before": tracked(before), "after": tracked(values)})
+            else:
+                counts["unchanged"] += 1
+
+        # Build side leftovers: listings that are gone from this crawl
+        for rid, (_, payload) in previous.items():
+            entry = json.loads(payload)
+            emit({"op": "removed", "id": rid, "source": entry["s"], "url": entry["u"],
+                  "before": tracked(entry["v"])})
+
+    # Publish the feed before the index moves on: a crash in between leaves
+    # the old index, and the next run re-emits these events instead of losing them
+    if feed is not None:
+        feed.close()
+        Path(feed.name).replace(feed_path)
+    tmp_index.replace(index_path)
+    if feed is not None:
+        note = " (first run: every listing is new)" if first_run else ""
+        print(f"Change feed {feed_path}: {counts['added']} added, {counts['removed']} removed, "
+              f"{counts['changed']} changed, {counts['unchanged']} unchanged{note}")
+    else:
+        print(f"Baseline index written to {index_path}")
+    return counts
+
+
+def main(argv: list[str] = None):
+    import argparse
+
+    configure()
+    parser = argparse.ArgumentParser(description="Write the change feed of a merged snapshot")
+    parser.add_argument("--merged", default="merged_rentals.json", help="merge_data.py output")
+    parser.add_argument("--dir", default=CHANGES_DIR, help="Feed and index directory")
+    parser.add_argument("--baseline", action="store_true",
+                        help="Only write the index, e.g. when starting to publish a feed")
+    args = parser.parse_args(argv)
+
+    if not Path(args.merged).exists():
+        print(f"Error: {args.merged} not found. Run merge_data.py first.")
+        exit(1)
+    with open(args.merged, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    write_change_feed(records, args.dir, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
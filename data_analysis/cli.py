@@ -0,0 +1,67 @@
+"""
+Single command-line entry point for the analysis tools.
+
+Each command maps to a script's main(); its module is only imported when the
+command runs. `--help`, `summary` and the query commands therefore start
+without importing pandas, matplotlib, seaborn or scipy (bench_startup.py
+checks this and the start-up time).
+
+Usage:
+    python cli.py --help
+    python cli.py summary [--approx]
+    python cli.py query run price_by_arrondissement --format csv
+    python cli.py plots --force
+    python cli.py <command> --help
+"""
+
+import sys
+from importlib import import_module
+
+from instrumentation import configure
+
+
+# command: (module, description); heavy dependencies are noted in brackets
+COMMANDS = {
+    "summary": ("summary", "Print database summary statistics"),
+    "query": ("query_service", "List, run or serve the named analysis queries"),
+    "indexes": ("index_advisor", "Query-plan audit and index advice for the workload"),
+    "quantiles": ("quantile_sketch", "Price percentiles from the stored sketches"),
+    "sample": ("reservoir_sample", "Preview sample: rebuild, estimates with 95% CIs"),
+    "outliers": ("outliers", "Recompute outlier flags and print the bounds"),
+    "merge": ("merge_data", "Merge the spiders' JSON outputs"),
+    "build-db": ("create_database", "Create the database from merged JSON"),
+    "snapshots": ("snapshot_store", "Date-partitioned crawl snapshots and trends [numpy]"),
+    "plots": ("visualizations", "Render the charts [pandas, matplotlib]"),
+    "overview": ("data_analysis", "Market overview figure [pandas, seaborn]"),
+    "heatmap": ("heatmap_tiles", "Build the tiled heatmap"),
+    "geo": ("geo_index", "Offline city / département resolution"),
+    "geocode": ("geocoding", "Batch-geocode listings without coordinates (cached)"),
+    "comparables": ("comparables", "Comparable listings and fair-rent scores [numpy, scipy]"),
+}
+
+
+def usage() -> str:
+    lines = ["usage: cli.py [--profile[=cprofile]] <command> [args...]", "", "commands:"]
+    lines += [f"  {name:13s} {description}" for name, (_, description) in COMMANDS.items()]
+    lines += ["", "Run `cli.py <command> --help` for the options of a command."]
+    return "\n".join(lines)
+
+
+def main(argv: list[str] = None) -> int:
+    argv = [sys.argv[0]] + (sys.argv[1:] if argv is None else list(argv))
+    configure(argv)
+    if len(argv) < 2 or argv[1] in ("-h", "--help"):
+        print(usage())
+        return 0
+
+    command, rest = argv[1], argv[2:]
+    if command not in COMMANDS:
+        print(f"Unknown command '{command}'.\n\n{usage()}", file=sys.stderr)
+        return 2
+    # Sub-parsers report the full command in their usage line
+    sys.argv = [f"cli.py {command}"] + rest
+    return import_module(COMMANDS[command][0]).main(rest) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
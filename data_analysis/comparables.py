@@ -0,0 +1,366 @@
+"""
+Comparable-listings search and batch fair-rent scoring.
+
+Listings are embedded as fixed-scale feature vectors (position in km, log
+size, rooms, furnished, rental type) and indexed with a KD-tree. The k
+nearest comparables of a listing give its fair-rent estimate (median of
+their prices) and the deviation of its asking price from it.
+
+The index is persisted next to the database (arrays only, in one .npz; the
+trees are rebuilt on load) and updated incrementally: new or changed listings
+go to a small delta buffer with its own KD-tree, and replaced rows are
+tombstoned. The main tree is rebuilt once the buffer and tombstones exceed
+REBUILD_FRACTION of it, or the tombstones exceed MAX_TOMBSTONES.
+
+Usage:
+    python comparables.py build
+    python comparables.py update
+    python comparables.py query <listing id> -k 10
+    python comparables.py score
+"""
+
+import argparse
+import math
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from create_database import ARRONDISSEMENT_CENTERS
+from instrumentation import configure, instrumented
+
+
+DEFAULT_INDEX_PATH = "comparables_index"
+
+# One unit of distance in feature space equals:
+KM_PER_UNIT = 1.0           # 1 km apart
+LOG_SIZE_PER_UNIT = 0.25    # ~28% size difference
+ROOMS_PER_UNIT = 1.0        # one room
+FURNISHED_WEIGHT = 1.0      # furnished vs not
+TYPE_WEIGHT = 2.0           # different rental type (one-hot, so sqrt(2) * weight)
+
+# Degrees to km around Paris
+KM_PER_DEG_LAT = 111.2
+KM_PER_DEG_LON = 111.2 * math.cos(math.radians(48.86))
+
+REBUILD_FRACTION = 0.10
+# Tombstones make neighbour queries look further; compact past this many
+MAX_TOMBSTONES = 1_000
+DEFAULT_K = 10
+
+FEATURE_QUERY = """
+    SELECT id, price_eur, latitude, longitude, arrondissement,
+           size_m2, rooms, furnished, rental_type
+    FROM rentals
+    WHERE is_outlier = 0
+      AND price_eur IS NOT NULL
+      AND size_m2 IS NOT NULL AND size_m2 > 0
+"""
+
+
+@instrumented(records=len)
+def load_listings(conn: sqlite3.Connection) -> list[tuple]:
+    """
+    Listings with a usable position: coordinates, or the arrondissement
+    center when only the arrondissement is known.
+    """
+    listings = []
+    for (rental_id, price, lat, lon, arrondissement,
+         size, rooms, furnished, rental_type) in conn.execute(FEATURE_QUERY):
+        if lat is None or lon is None:
+            if arrondissement not in ARRONDISSEMENT_CENTERS:
+                continue
+            lat, lon = ARRONDISSEMENT_CENTERS[arrondissement]
+        listings.append((rental_id, price, lat, lon, size, rooms or 1,
+                         1.0 if furnished else 0.0, rental_type or ''))
+    return listings
+
+
+def encode(listings: list[tuple], types: list[str]) -> np.ndarray:
+    """Vectorized feature matrix for listings, given the rental-type vocabulary."""
+    if not listings:
+        return np.empty((0, 5 + len(types)))
+    cols = list(zip(*listings))
+    lat = np.asarray(cols[2], dtype=float)
+    lon = np.asarray(cols[3], dtype=float)
+    size = np.asarray(cols[4], dtype=float)
+    rooms = np.asarray(cols[5], dtype=float)
+    furnished = np.asarray(cols[6], dtype=float)
+
+    type_index = {t: i for i, t in enumerate(types)}
+    one_hot = np.zeros((len(listings), len(types)))
+    one_hot[np.arange(len(listings)), [type_index[t] for t in cols[7]]] = TYPE_WEIGHT
+
+    numeric = np.column_stack([
+        lat * KM_PER_DEG_LAT / KM_PER_UNIT,
+        lon * KM_PER_DEG_LON / KM_PER_UNIT,
+        np.log(size) / LOG_SIZE_PER_UNIT,
+        rooms / ROOMS_PER_UNIT,
+        furnished * FURNISHED_WEIGHT,
+    ])
+    return np.hstack([numeric, one_hot])
+
+
+class ComparablesIndex:
+    """KD-tree over base rows plus a smaller KD-tree over the delta buffer."""
+
+    def __init__(self, ids: np.ndarray, X: np.ndarray, prices: np.ndarray, types: list[str]):
+        self.types = types
+        self.ids = ids
+        self.X = X
+        self.prices = prices
+        self.alive = np.ones(len(ids), dtype=bool)
+        self.n_base = len(ids)
+        self.tree = cKDTree(X) if len(ids) else None
+        self.delta_tree = None
+        self._positions = {rental_id: i for i, rental_id in enumerate(ids)}
+
+    @classmethod
+    @instrumented("comparables.build")
+    def build(cls, listings: list[tuple]) -> "ComparablesIndex":
+        types = sorted({row[7] for row in listings})
+        ids = np.array([row[0] for row in listings], dtype=object)
+        prices = np.array([row[1] for row in listings], dtype=float)
+        return cls(ids, encode(listings, types), prices, types)
+
+    # -- persistence -------------------------------------------------------
+
+    def save(self, path: str = DEFAULT_INDEX_PATH):
+        np.savez(f"{path}.npz", ids=self.ids.astype(str), X=self.X, prices=self.prices,
+                 alive=self.alive, n_base=self.n_base, types=np.array(self.types, dtype=str))
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INDEX_PATH) -> "ComparablesIndex":
+        data = np.load(f"{path}.npz")
+        n_base = int(data["n_base"])
+        index = cls(data["ids"][:n_base].astype(object), data["X"][:n_base], data["prices"][:n_base],
+                    [str(t) for t in data["types"]])
+        index.ids = data["ids"].astype(object)
+        index.X = data["X"]
+        index.prices = data["prices"]
+        index.alive = data["alive"]
+        index._positions = {rental_id: i for i, rental_id in enumerate(index.ids)
+                            if index.alive[i]}
+        index._index_delta()
+        return index
+
+    # -- incremental maintenance ------------------------------------------
+
+    @instrumented("comparables.update")
+    def update(self, listings: list[tuple]) -> "ComparablesIndex":
+        """
+        Sync with the current listings: append new or changed rows to the
+        delta buffer, tombstone replaced or removed ones, and rebuild when the
+        delta grows too large. Returns the (possibly new) index.
+        """
+        if {row[7] for row in listings} - set(self.types):
+            return ComparablesIndex.build(listings)
+
+        current = {row[0] for row in listings}
+        X_new = encode(listings, self.types)
+        append = []
+        for i, row in enumerate(listings):
+            pos = self._positions.get(row[0])
+            if pos is not None:
+                if self.prices[pos] == row[1] and np.allclose(self.X[pos], X_new[i]):
+                    continue
+                self.alive[pos] = False
+            append.append(i)
+
+        for rental_id, pos in list(self._positions.items()):
+            if rental_id not in current:
+                self.alive[pos] = False
+                del self._positions[rental_id]
+
+        if append:
+            start = len(self.ids)
+            self.ids = np.concatenate([self.ids, np.array([listings[i][0] for i in append], dtype=object)])
+            self.X = np.vstack([self.X, X_new[append]])
+            self.prices = np.concatenate([self.prices, [listings[i][1] for i in append]])
+            self.alive = np.concatenate([self.alive, np.ones(len(append), dtype=bool)])
+            for offset, i in enumerate(append):
+                self._positions[listings[i][0]] = start + offset
+            self._index_delta()
+
+        tombstones = int((~self.alive).sum())
+        pending = (len(self.ids) - self.n_base) + int((~self.alive[:self.n_base]).sum())
+        if pending > REBUILD_FRACTION * max(self.n_base, 1) or tombstones > MAX_TOMBSTONES:
+            keep = self.alive
+            rebuilt = ComparablesIndex(self.ids[keep], self.X[keep], self.prices[keep], self.types)
+            return rebuilt
+        return self
+
+    def _index_delta(self):
+        self.delta_tree = cKDTree(self.X[self.n_base:]) if len(self.ids) > self.n_base else None
+
+    # -- queries -----------------------------------------------------------
+
+    def positions_of(self, ids) -> np.ndarray:
+        """Live index positions of the given ids (-1 if not indexed)."""
+        return np.array([self._positions.get(rental_id, -1) for rental_id in ids], dtype=np.int64)
+
+    def _search(self, tree: cKDTree, offset: int, X: np.ndarray, k: int, exclude: np.ndarray):
+        """
+        k nearest live rows of one tree (whose rows start at index position
+        offset), as (distances, positions). Starts with k (+1 for exclude)
+        candidates and re-queries only the rows that hit tombstones, with
+        twice as many.
+        """
+        dist = np.full((len(X), k), np.inf)
+        pos = np.full((len(X), k), -1, dtype=np.int64)
+        todo = np.arange(len(X))
+        k_query = min(k + (1 if exclude is not None else 0), tree.n)
+        while len(todo):
+            d, p = tree.query(X[todo], k=k_query, workers=-1)
+            d, p = d.reshape(len(todo), -1), p.reshape(len(todo), -1)
+            # cKDTree pads missing neighbours with index == n
+            valid = p < tree.n
+            p = np.where(valid, p + offset, -1)
+            valid[valid] = self.alive[p[valid]]
+            if exclude is not None:
+                valid &= p != exclude[todo, None]
+            done = (valid.sum(axis=1) >= k) | (k_query == tree.n)
+
+            d = np.where(valid, d, np.inf)[done]
+            order = np.argsort(d, axis=1, kind="stable")[:, :k]
+            width = order.shape[1]
+            dist[todo[done], :width] = np.take_along_axis(d, order, axis=1)
+            pos[todo[done], :width] = np.take_along_axis(p[done], order, axis=1)
+
+            todo = todo[~done]
+            k_query = min(2 * k_query, tree.n)
+        return dist, np.where(np.isfinite(dist), pos, -1)
+
+    def neighbors(self, X: np.ndarray, k: int, exclude: np.ndarray = None):
+        """
+        k nearest live rows for each row of X, as (distances, positions)
+        arrays of shape (len(X), k). Positions are -1 where fewer exist.
+        exclude gives one index position per row to skip (the listing itself).
+        """
+        dist = np.full((len(X), k), np.inf)
+        pos = np.full((len(X), k), -1, dtype=np.int64)
+        for tree, offset in ((self.tree, 0), (self.delta_tree, self.n_base)):
+            if tree is None or not k:
+                continue
+            d, p = self._search(tree, offset, X, k, exclude)
+            dist, pos = np.hstack([dist, d]), np.hstack([pos, p])
+            order = np.argsort(dist, axis=1, kind="stable")[:, :k]
+            dist = np.take_along_axis(dist, order, axis=1)
+            pos = np.take_along_axis(pos, order, axis=1)
+        return dist, pos
+
+    @instrumented("comparables.score", records=len)
+    def score(self, listings: list[tuple], k: int = DEFAULT_K, batch: int = 10_000) -> list[tuple]:
+        """
+        Fair rent (median of k comparables' prices) and relative deviation
+        for every listing, in vectorized batches.
+        Returns (id, price, fair_rent, deviation, comparables used).
+        """
+        results = []
+        X_all = encode(listings, self.types)
+        for start in range(0, len(listings), batch):
+            chunk = listings[start:start + batch]
+            exclude = self.positions_of(row[0] for row in chunk)
+            _, pos = self.neighbors(X_all[start:start + batch], k, exclude=exclude)
+            prices = np.where(pos >= 0, self.prices[np.maximum(pos, 0)], np.nan)
+            counts = (pos >= 0).sum(axis=1)
+            asking = np.array([row[1] for row in chunk], dtype=float)
+            with np.errstate(all="ignore"):
+                fair = np.nanmedian(prices, axis=1)
+                deviation = np.round((asking - fair) / fair, 4)
+            fair = np.round(fair, 2)
+            for row, f, dev, n in zip(chunk, fair.tolist(), deviation.tolist(), counts.tolist()):
+                if n == 0:
+                    results.append((row[0], row[1], None, None, 0))
+                else:
+                    results.append((row[0], row[1], f, dev, n))
+        return results
+
+
+def save_scores(conn: sqlite3.Connection, scores: list[tuple]):
+    """Replace the fair_rent_scores table. Does not commit."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fair_rent_scores (
+            id TEXT PRIMARY KEY,
+            fair_rent REAL,
+            deviation REAL,
+            comparables INTEGER
+        )
+    """)
+    conn.execute("DELETE FROM fair_rent_scores")
+    conn.executemany(
+        "INSERT INTO fair_rent_scores (id, fair_rent, deviation, comparables) VALUES (?, ?, ?, ?)",
+        [(rental_id, fair, dev, n) for rental_id, _, fair, dev, n in scores],
+    )
+
+
+def main(argv: list[str] = None):
+    from database import connect_reader, connect_writer
+
+    configure()
+    parser = argparse.ArgumentParser(description="Comparable listings and fair-rent scoring")
+    parser.add_argument("--db", default="paris_rentals.db")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Index path prefix")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="Build the index from scratch")
+    sub.add_parser("update", help="Incrementally sync the index with the database")
+    q = sub.add_parser("query", help="Show the comparables of one listing")
+    q.add_argument("id")
+    q.add_argument("-k", type=int, default=DEFAULT_K)
+    s = sub.add_parser("score", help="Score every listing and store fair_rent_scores")
+    s.add_argument("-k", type=int, default=DEFAULT_K)
+    args = parser.parse_args(argv)
+
+    conn = connect_reader(args.db)
+    start = time.perf_counter()
+    listings = load_listings(conn)
+    conn.close()
+    print(f"Loaded {len(listings)} listings with a position in {time.perf_counter() - start:.2f}s")
+
+    if args.command == "build" or not Path(f"{args.index}.npz").exists():
+        start = time.perf_counter()
+        index = ComparablesIndex.build(listings)
+        index.save(args.index)
+        print(f"Built index of {index.n_base} listings in {time.perf_counter() - start:.2f}s")
+        if args.command == "build":
+            return
+    else:
+        index = ComparablesIndex.load(args.index)
+
+    if args.command == "update":
+        start = time.perf_counter()
+        index = index.update(listings)
+        index.save(args.index)
+        print(f"Index synced in {time.perf_counter() - start:.2f}s: {index.n_base} in tree, "
+              f"{len(index.ids) - index.n_base} in delta, {int((~index.alive).sum())} tombstoned")
+
+    elif args.command == "query":
+        row = next((r for r in listings if r[0] == args.id), None)
+        if row is None:
+            print(f"Listing {args.id} not found (or has no position / is an outlier).")
+            return
+        start = time.perf_counter()
+        dist, pos = index.neighbors(encode([row], index.types), args.k,
+                                    exclude=index.positions_of([args.id]))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"{args.k} comparables of {args.id} (€{row[1]:.0f}) in {elapsed_ms:.2f} ms:")
+        for d, p in zip(dist[0], pos[0]):
+            if p >= 0:
+                print(f"  {index.ids[p]}  €{index.prices[p]:8.0f}  distance {d:6.2f}")
+
+    elif args.command == "score":
+        start = time.perf_counter()
+        scores = index.score(listings, args.k)
+        elapsed = time.perf_counter() - start
+        conn = connect_writer(args.db)
+        save_scores(conn, scores)
+        conn.commit()
+        conn.close()
+        print(f"Scored {len(scores)} listings in {elapsed:.2f}s "
+              f"({len(scores) / max(elapsed, 1e-9):.0f} listings/s), saved to fair_rent_scores")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
 """
 Create SQLite database from merged JSON rental data.
+
+--json may also be a shard feed (merge_data.py --shards); each shard is
+inserted as soon as it is published, and with --follow the load keeps up
+with a merge that is still running.
 """
 
 import json
@@ -7,6 +11,16 @@ import sqlite3
 import re
 from pathlib import Path
 
+from database import connect_writer
+from geo_index import create_geo_schema, parse_addresses, resolve_addresses
+from geocoding import create_geocode_schema, default_geocoder
+from instrumentation import configure, instrumented, stage
+from outliers import create_outlier_schema, flag_outliers
+from quantile_sketch import create_sketch_table, update_sketches, rebuild_sketches
+from reservoir_sample import create_sample_schema, update_sample, rebuild_sample
+from shard_feed import is_shard_feed, iter_shards
+from summary import print_summary
+
 
 # Paris arrondissement boundaries (approximate polygons using bounding boxes)
 # Based on central point of each arrondissement
@@ -34,6 +48,34 @@ ARRONDISSEMENT_CENTERS = {
 }
 
 
+# Columns written by insert_data, in UPSERT_SQL order
+RENTAL_COLUMNS = [
+    "id", "source", "url", "title", "price_eur", "address", "arrondissement",
+    "size_m2", "price_per_m2", "rooms", "floor", "rental_type", "furnished",
+    "latitude", "longitude", "city", "departement", "city_lat", "city_lon",
+    "geocode_precision", "amenities", "roommates", "bedrooms", "bathrooms",
+]
+
+# An existing listing is only rewritten when one of its values differs, so
+# the statement's change count tells new or changed rows from re-ingested ones
+_updated = [c for c in RENTAL_COLUMNS if c != "id"]
+UPSERT_SQL = f"""
+    INSERT INTO rentals ({', '.join(RENTAL_COLUMNS)})
+    VALUES ({', '.join('?' * len(RENTAL_COLUMNS))})
+    ON CONFLICT(id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in _updated)}
+    WHERE ({', '.join(f'rentals.{c}' for c in _updated)})
+       IS NOT ({', '.join(f'excluded.{c}' for c in _updated)})
+"""
+
+# Ids per `IN (...)` lookup, below SQLite's bound-parameter limit
+ID_CHUNK = 500
+
+
+# Sorted, comma-separated amenity labels ('ascenseur,balcon') and numeric hints
+EXTRACTED_COLUMNS = {"amenities": "TEXT", "roommates": "INTEGER", "bedrooms": "INTEGER",
+                     "bathrooms": "INTEGER"}
+
+
 def get_arrondissement_from_coords(lat: float, lon: float) -> str:
     """
     Determine Paris arrondissement from GPS coordinates.
@@ -98,6 +140,22 @@ def extract_arrondissement(address: str) -> str:
     return None
 
 
+def paris_arrondissement(address: str, lat: float, lon: float, city: str) -> tuple[str, bool]:
+    """
+    Paris arrondissement of a listing from its address, else from its
+    coordinates, and whether the coordinates gave it. city is the commune
+    resolved by geo_index.resolve_addresses: '69008 Lyon 8e Arrondissement'
+    is not a Paris arrondissement.
+    """
+    if city not in (None, "Paris"):
+        return None, False
+    arrondissement = extract_arrondissement(address)
+    if arrondissement is None and lat and lon:
+        arrondissement = get_arrondissement_from_coords(lat, lon)
+        return arrondissement, arrondissement is not None
+    return arrondissement, False
+
+
 def safe_float(value) -> float:
     """Safely convert value to float."""
     if value is None:
@@ -121,6 +179,7 @@ def safe_int(value) -> int:
         return None
 
 
+@instrumented()
 def create_tables(conn: sqlite3.Connection):
     """Create the rentals table."""
     cursor = conn.cursor()
@@ -141,42 +200,110 @@ def create_tables(conn: sqlite3.Connection):
             rental_type TEXT,
             furnished TEXT,
             latitude REAL,
-            longitude REAL
+            longitude REAL,
+            is_outlier INTEGER NOT NULL DEFAULT 0,
+            city TEXT,
+            departement TEXT,
+            city_lat REAL,
+            city_lon REAL,
+            geocode_precision TEXT,
+            amenities TEXT,
+            roommates INTEGER,
+            bedrooms INTEGER,
+            bathrooms INTEGER
         )
     """)
     
+    # Description-derived fields (French_Rentals/amenities.py), added to
+    # databases created before them
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(rentals)")}
+    for name, sql_type in EXTRACTED_COLUMNS.items():
+        if name not in columns:
+            cursor.execute(f"ALTER TABLE rentals ADD COLUMN {name} {sql_type}")
+    
     # Create indexes for common queries
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_arrondissement ON rentals(arrondissement)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_price ON rentals(price_eur)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_source ON rentals(source)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_rental_type ON rentals(rental_type)")
     
+    # Outlier flag (also migrates older databases), per-group price
+    # quantile sketches and the preview sample, all maintained by insert_data
+    create_outlier_schema(conn)
+    create_sketch_table(conn)
+    create_sample_schema(conn)
+    
+    # Nationwide city / département / commune centroid (geo_index.py)
+    create_geo_schema(conn)
+    create_geocode_schema(conn)
+    
     conn.commit()
     print("Tables and indexes created successfully.")
 
 
-def insert_data(conn: sqlite3.Connection, data: list[dict]):
-    """Insert rental data into the database."""
+@instrumented(records=len)
+def strata_of(conn: sqlite3.Connection, ids) -> dict:
+    """{id: (source, arrondissement)} of the given ids that exist, '' for NULL."""
+    ids = list(ids)
+    strata = {}
+    for start in range(0, len(ids), ID_CHUNK):
+        chunk = ids[start:start + ID_CHUNK]
+        strata.update(
+            (row[0], (row[1] or '', row[2] or '')) for row in conn.execute(
+                f"SELECT id, source, arrondissement FROM rentals "
+                f"WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+        )
+    return strata
+
+
+@instrumented(records=int)
+def insert_data(conn: sqlite3.Connection, data: list[dict]) -> int:
+    """
+    Insert new listings and update changed ones; listings re-ingested with
+    identical values are left alone. Returns the number of rows written.
+    """
     cursor = conn.cursor()
     
     inserted = 0
+    updated = 0
+    unchanged = 0
     skipped = 0
     geo_resolved = 0
+    new_rows = []
+    # (id, arrondissement, rental_type) of inserted and updated listings
+    flag_rows = []
+    # (source, arrondissement) strata whose sketches / sample lose a value
+    touched = set()
+    
+    # Stratum of the listings that already exist, in a few batched lookups
+    existing = strata_of(conn, {record.get("id") for record in data})
     
-    for record in data:
+    # City / département for every address, resolved in one batch; each
+    # distinct address is parsed once, for this and for the geocode cache keys
+    addresses = [record.get("address") for record in data]
+    parsed = parse_addresses(addresses)
+    places = resolve_addresses(addresses, parsed=parsed)
+    
+    # Coordinates for listings without any, from the geocode cache (and the
+    # RENTALS_GEOCODER backend for addresses never seen before)
+    geocoder = default_geocoder()
+    geocodes = geocoder.geocode([
+        None if safe_float(record.get("latitude")) else record.get("address") for record in data
+    ], parsed)
+    geocoder.close()
+    
+    for record, place, geocode in zip(data, places, geocodes):
         price = safe_float(record.get("price_eur"))
         size = safe_float(record.get("size_m2"))
         lat = safe_float(record.get("latitude"))
         lon = safe_float(record.get("longitude"))
+        precision = None
+        if lat is None and geocode is not None:
+            lat, lon, precision = geocode
         
-        # Try to extract arrondissement from address first
-        arrondissement = extract_arrondissement(record.get("address"))
-        
-        # If not found in address, try to determine from coordinates
-        if arrondissement is None and lat and lon:
-            arrondissement = get_arrondissement_from_coords(lat, lon)
-            if arrondissement:
-                geo_resolved += 1
+        # From the address first, else from the coordinates
+        arrondissement, from_coords = paris_arrondissement(record.get("address"), lat, lon, place.city)
+        geo_resolved += from_coords
         
         # Calculate price per m2
         price_per_m2 = None
@@ -184,13 +311,7 @@ def insert_data(conn: sqlite3.Connection, data: list[dict]):
             price_per_m2 = round(price / size, 2)
         
         try:
-            cursor.execute("""
-                INSERT OR REPLACE INTO rentals 
-                (id, source, url, title, price_eur, address, arrondissement,
-                 size_m2, price_per_m2, rooms, floor, rental_type, furnished,
-                 latitude, longitude)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+            cursor.execute(UPSERT_SQL, (
                 record.get("id"),
                 record.get("source"),
                 record.get("url"),
@@ -204,78 +325,100 @@ def insert_data(conn: sqlite3.Connection, data: list[dict]):
                 record.get("floor"),
                 record.get("rental_type"),
                 record.get("furnished"),
-                safe_float(record.get("latitude")),
-                safe_float(record.get("longitude")),
+                lat,
+                lon,
+                *place,
+                precision,
+                ",".join(record.get("amenities") or []) or None,
+                safe_int(record.get("roommates")),
+                safe_int(record.get("bedrooms")),
+                safe_int(record.get("bathrooms")),
             ))
-            inserted += 1
+            stratum = (record.get("source") or '', arrondissement or '')
+            if not cursor.rowcount:
+                unchanged += 1
+            elif record.get("id") in existing:
+                # The old values leave their stratum, the new ones join theirs
+                updated += 1
+                touched.update((existing[record.get("id")], stratum))
+            else:
+                inserted += 1
+                new_rows.append((record.get("id"), record.get("source"), arrondissement, size, price,
+                                 price_per_m2, safe_int(record.get("rooms")),
+                                 record.get("rental_type"), record.get("furnished")))
+            if cursor.rowcount:
+                flag_rows.append((record.get("id"), arrondissement, record.get("rental_type")))
+            existing[record.get("id")] = stratum
         except sqlite3.Error as e:
             print(f"Error inserting record: {e}")
             skipped += 1
     
-    conn.commit()
-    print(f"Inserted: {inserted}, Skipped: {skipped}, Geo-resolved: {geo_resolved}")
-
-
-def print_summary(conn: sqlite3.Connection):
-    """Print database summary statistics."""
-    cursor = conn.cursor()
-    
-    print("\n" + "="*50)
-    print("DATABASE SUMMARY")
-    print("="*50)
-    
-    # Total records
-    cursor.execute("SELECT COUNT(*) FROM rentals")
-    print(f"Total rentals: {cursor.fetchone()[0]}")
+    # Only the segments that received rows get their bounds refreshed
+    changed = flag_outliers(conn, flag_rows)
+    outliers = conn.execute("SELECT COUNT(*) FROM rentals WHERE is_outlier = 1").fetchone()[0]
     
-    # By source
-    cursor.execute("SELECT source, COUNT(*) FROM rentals GROUP BY source")
-    print("\nBy source:")
-    for row in cursor.fetchall():
-        print(f"  - {row[0]}: {row[1]}")
+    # Sketches and the sample only hold non-outliers and cannot forget
+    # values: strata with updated rows, or with flags changing on existing
+    # rows, are rebuilt; the others just take their new non-outlier rows
+    new_ids = {row[0] for row in new_rows}
+    touched.update(strata_of(conn, changed - new_ids).values())
+    if touched:
+        rebuild_sketches(conn, touched)
+        rebuild_sample(conn, strata=touched)
+    kept = [row for row in new_rows
+            if row[0] not in changed and (row[1] or '', row[2] or '') not in touched]
+    update_sketches(conn, [row[1:5] for row in kept])
+    update_sample(conn, [(source, arrondissement, id_, price, size, *rest)
+                         for id_, source, arrondissement, size, price, *rest in kept])
     
-    # By arrondissement (top 5)
-    cursor.execute("""
-        SELECT arrondissement, COUNT(*) as cnt 
-        FROM rentals 
-        WHERE arrondissement IS NOT NULL 
-        GROUP BY arrondissement 
-        ORDER BY cnt DESC 
-        LIMIT 5
-    """)
-    print("\nTop 5 arrondissements:")
-    for row in cursor.fetchall():
-        print(f"  - {row[0]}e: {row[1]} listings")
-    
-    # Price stats
-    cursor.execute("""
-        SELECT 
-            ROUND(AVG(price_eur), 2),
-            ROUND(MIN(price_eur), 2),
-            ROUND(MAX(price_eur), 2)
-        FROM rentals 
-        WHERE price_eur IS NOT NULL
-    """)
-    avg, min_p, max_p = cursor.fetchone()
-    print(f"\nPrice stats (EUR): Avg={avg}, Min={min_p}, Max={max_p}")
+    conn.commit()
+    cities = sum(place.city is not None for place in places)
+    if geocoder.stats.unique:
+        print(geocoder.stats.report())
+    print(f"Inserted: {inserted}, Updated: {updated}, Unchanged: {unchanged}, Skipped: {skipped}, "
+          f"Geo-resolved: {geo_resolved}, City-resolved: {cities}, Outliers: {outliers}")
+    return inserted + updated
 
 
-if __name__ == "__main__":
-    json_path = "merged_rentals.json"
-    db_path = "paris_rentals.db"
+def main(argv: list[str] = None):
+    import argparse
+
+    configure()
+    parser = argparse.ArgumentParser(description="Create the SQLite database from merged JSON")
+    parser.add_argument("--json", default="merged_rentals.json", help="Merged listings (merge_data.py)")
+    parser.add_argument("--db", default="paris_rentals.db")
+    parser.add_argument("--follow", action="store_true",
+                        help="With a shard feed, wait for shards until it is complete")
+    args = parser.parse_args(argv)
+    json_path = args.json
+    db_path = args.db
     
     if not Path(json_path).exists():
         print(f"Error: {json_path} not found. Run merge_data.py first.")
         exit(1)
     
+    if is_shard_feed(json_path):
+        print(f"Creating database {db_path} from shard feed {json_path}...")
+        conn = connect_writer(db_path)
+        create_tables(conn)
+        for i, shard in enumerate(iter_shards(json_path, args.follow)):
+            print(f"Shard {i}: {len(shard)} records")
+            with stage("insert_shard", records=len(shard)):
+                insert_data(conn, shard)
+        print_summary(conn)
+        conn.close()
+        print(f"\nDatabase saved to {db_path}")
+        return
+    
     # Load JSON data
     print(f"Loading {json_path}...")
-    with open(json_path, "r", encoding="utf-8") as f:
+    with stage("load_json") as s, open(json_path, "r", encoding="utf-8") as f:
         data = json.load(f)
+        s.records = len(data)
     
     # Create database
     print(f"Creating database {db_path}...")
-    conn = sqlite3.connect(db_path)
+    conn = connect_writer(db_path)
     
     create_tables(conn)
     insert_data(conn, data)
@@ -283,3 +426,7 @@ if __name__ == "__main__":
     
     conn.close()
     print(f"\nDatabase saved to {db_path}")
+
+
+if __name__ == "__main__":
+    main()
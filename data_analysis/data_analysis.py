@@ -1,79 +1,334 @@
+"""
+Rental market overview figure (distributions, rooms, types, size vs price).
+
+Above LARGE_N_THRESHOLD rows the figure switches to aggregated rendering:
+hexbin density instead of a per-listing scatter, binned KDE instead of a
+per-point KDE, and a regression fitted from sufficient statistics instead of
+regplot. Render cost then depends on the number of bins, not on N.
+
+With --approx the rows come from the stratified preview sample (see
+reservoir_sample.py), weighted by the listings each stands for, so counts
+are estimates and the mean price is shown with its 95% confidence interval;
+the figure goes to rental_analysis_preview.png.
+
+Usage:
+    python data_analysis.py [--mode auto|detailed|aggregated] [--approx]
+    python data_analysis.py --benchmark 10000 1000000 10000000
+"""
+
+import argparse
+import time
+
+import numpy as np
 import pandas as pd
 import seaborn as sns
+import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 
-try:
-    df = pd.read_json('merged_rentals.json')
-except ValueError:
-    print("Error: check your json file.")
-    exit()
-
-numeric_cols = ['price_eur', 'size_m2', 'rooms']
-for col in numeric_cols:
-    df[col] = pd.to_numeric(df[col], errors='coerce')
-
-df_clean = df[
-    (df['price_eur'] < 5000) & 
-    (df['rooms'] < 10) & 
-    (df['size_m2'] < 500)
-].dropna(subset=['price_eur', 'size_m2', 'rooms'])
-
-print(f"Plotting {len(df_clean)} records.")
-
-sns.set_theme(style="whitegrid", context="talk")
-palette = sns.color_palette("viridis")
-
-fig = plt.figure(figsize=(20, 12))
-gs = gridspec.GridSpec(2, 3, figure=fig, height_ratios=[1, 1.2], wspace=0.3, hspace=0.4)
-
-ax1 = fig.add_subplot(gs[0, 0])
-sns.histplot(data=df_clean, x='price_eur', kde=True, color=palette[0], ax=ax1, element="step")
-ax1.set_title('Price Distribution (€)', fontweight='bold')
-ax1.set_xlabel('Price (€)')
-
-ax2 = fig.add_subplot(gs[0, 1])
-sns.histplot(data=df_clean, x='size_m2', kde=True, color=palette[2], ax=ax2, element="step")
-ax2.set_title('Size Distribution (m²)', fontweight='bold')
-ax2.set_xlabel('Size (m²)')
-
-ax3 = fig.add_subplot(gs[0, 2])
-sns.countplot(data=df_clean, x='rooms', palette="viridis", ax=ax3)
-ax3.set_title('Number of Rooms', fontweight='bold')
-ax3.set_xlabel('Rooms')
-ax3.set_ylabel('Count')
-
-ax4 = fig.add_subplot(gs[1, 0])
-top_rental_types = df_clean['rental_type'].value_counts().nlargest(10).index
-
-sns.countplot(data=df_clean[df_clean['rental_type'].isin(top_rental_types)], 
-              y='rental_type', 
-              palette="rocket", 
-              order=top_rental_types, 
-              ax=ax4)
-
-ax4.set_xscale('log') 
-ax4.set_title('Top Rental Types (Log Scale)', fontweight='bold')
-ax4.set_xlabel('Count (Logarithmic)')
-ax4.set_ylabel('')
-ax4.grid(True, which="both", axis="x", ls="--", alpha=0.5)
-
-ax5 = fig.add_subplot(gs[1, 1:])
-sns.scatterplot(data=df_clean, x='size_m2', y='price_eur', 
-                hue='rooms', size='rooms', sizes=(50, 300), 
-                palette="viridis", ax=ax5, alpha=0.7)
-
-sns.regplot(data=df_clean, x='size_m2', y='price_eur', scatter=False, 
-            ax=ax5, color='grey', line_kws={"linestyle": "--", "alpha": 0.5})
-
-ax5.set_title('Correlation: Size (m²) vs. Price (€)', fontweight='bold')
-ax5.set_xlabel('Size (m²)')
-ax5.set_ylabel('Price (€)')
-ax5.legend(title='Rooms', bbox_to_anchor=(1, 1), loc='upper left')
-
-plt.suptitle('Rental Market Analysis', fontsize=24, fontweight='bold', y=0.95)
-sns.despine()
-
-plt.savefig('rental_analysis_log.png', bbox_inches='tight', dpi=150)
-print("Graph saved as 'rental_analysis_log.png'")
-plt.show()
\ No newline at end of file
+from database import connect_reader
+from instrumentation import configure, instrumented
+from reservoir_sample import Estimate, sample_query, stratified_mean
+
+
+# Row count above which the figure is drawn from aggregates
+LARGE_N_THRESHOLD = 100_000
+
+# Resolution of the aggregated views
+HIST_BINS = 60
+KDE_GRID = 512
+HEXBIN_GRIDSIZE = 60
+
+# Detailed mode is only benchmarked up to this size (it is O(N) per artist)
+DETAILED_BENCHMARK_MAX = 100_000
+
+
+# Outliers are flagged at ingest (see outliers.py), so cleaning is an index filter
+CLEAN_QUERY = """
+    SELECT price_eur, size_m2, rooms, rental_type
+    FROM rentals
+    WHERE is_outlier = 0
+      AND price_eur IS NOT NULL
+      AND size_m2 IS NOT NULL
+      AND rooms IS NOT NULL
+"""
+
+
+@instrumented(records=len)
+def load_clean_data(db_path: str = 'paris_rentals.db') -> pd.DataFrame:
+    conn = connect_reader(db_path)
+    df = pd.read_sql_query(CLEAN_QUERY, conn)
+    conn.close()
+    return df
+
+
+@instrumented(records=lambda result: len(result[0]))
+def load_sample_data(db_path: str = 'paris_rentals.db') -> tuple[pd.DataFrame, Estimate]:
+    """
+    CLEAN_QUERY's rows from the preview sample, with their `weight`, and the
+    estimated mean price of the listings they stand for.
+    """
+    conn = connect_reader(db_path)
+    query, params = sample_query(['source', 'arrondissement', 'price_eur', 'size_m2',
+                                  'rooms', 'rental_type'])
+    df = pd.read_sql_query(query, conn, params=params)
+    conn.close()
+
+    complete = df['size_m2'].notna() & df['rooms'].notna()
+    strata = [
+        (stratum['weight'].iloc[0] * len(stratum), len(stratum),
+         stratum.loc[complete[stratum.index], 'price_eur'].tolist())
+        for _, stratum in df.groupby(['source', 'arrondissement'], dropna=False)
+    ]
+    columns = ['price_eur', 'size_m2', 'rooms', 'rental_type', 'weight']
+    return df.loc[complete, columns].reset_index(drop=True), stratified_mean(strata)
+
+
+def weighted_counts(values: pd.Series, weights: pd.Series = None) -> pd.Series:
+    """value_counts(), or the estimated listings per value for sampled rows."""
+    if weights is None:
+        return values.value_counts()
+    return weights.groupby(values).sum().sort_values(ascending=False)
+
+
+def binned_kde(values: np.ndarray, bins: int = KDE_GRID,
+               weights: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Gaussian KDE evaluated on a regular grid by smoothing a fine histogram.
+    Uses Scott's bandwidth; cost is O(N) for the histogram plus O(bins²).
+    """
+    counts, edges = np.histogram(values, bins=bins, weights=weights)
+    centers = (edges[:-1] + edges[1:]) / 2
+    step = edges[1] - edges[0]
+    bandwidth = 1.06 * values.std() * len(values) ** (-1 / 5)
+
+    sigma_bins = max(bandwidth / step, 1e-6)
+    half = int(np.ceil(4 * sigma_bins))
+    offsets = np.arange(-half, half + 1)
+    kernel = np.exp(-0.5 * (offsets / sigma_bins) ** 2)
+    kernel /= kernel.sum()
+
+    density = np.convolve(counts, kernel, mode='same')
+    return centers, density
+
+
+def aggregated_regression(x: np.ndarray, y: np.ndarray,
+                          w: np.ndarray = None) -> tuple[float, float]:
+    """Least-squares line from sufficient statistics (n, Σx, Σy, Σx², Σxy), optionally weighted."""
+    w = np.ones_like(x) if w is None else w
+    n = w.sum()
+    sx, sy = (w * x).sum(), (w * y).sum()
+    sxx, sxy = (w * x * x).sum(), (w * x * y).sum()
+    denom = n * sxx - sx * sx
+    if denom == 0:
+        return 0.0, sy / n
+    slope = (n * sxy - sx * sy) / denom
+    return slope, (sy - slope * sx) / n
+
+
+def plot_distribution(ax, values: pd.Series, color, large: bool, weights: pd.Series = None):
+    if not large:
+        # seaborn cannot pick 'auto' bins for weighted data
+        sns.histplot(x=values, weights=weights, bins='auto' if weights is None else HIST_BINS,
+                     kde=True, color=color, ax=ax, element="step")
+        return
+
+    values = values.to_numpy(dtype=float)
+    weights = None if weights is None else weights.to_numpy(dtype=float)
+    counts, edges = np.histogram(values, bins=HIST_BINS, weights=weights)
+    ax.stairs(counts, edges, color=color, fill=True, alpha=0.25)
+    ax.stairs(counts, edges, color=color)
+
+    centers, density = binned_kde(values, weights=weights)
+    # Rescale the fine-grid density to the coarse histogram's bin width
+    scale = (edges[1] - edges[0]) / (centers[1] - centers[0])
+    ax.plot(centers, density * scale, color=color, linewidth=2)
+    ax.set_ylabel('Count')
+
+
+def plot_size_vs_price(ax, df_clean: pd.DataFrame, large: bool):
+    x = df_clean['size_m2'].to_numpy(dtype=float)
+    y = df_clean['price_eur'].to_numpy(dtype=float)
+    w = df_clean['weight'].to_numpy(dtype=float) if 'weight' in df_clean else None
+
+    if not large:
+        sns.scatterplot(data=df_clean, x='size_m2', y='price_eur',
+                        hue='rooms', size='rooms', sizes=(50, 300),
+                        palette="viridis", ax=ax, alpha=0.7)
+
+        if w is None:
+            sns.regplot(data=df_clean, x='size_m2', y='price_eur', scatter=False,
+                        ax=ax, color='grey', line_kws={"linestyle": "--", "alpha": 0.5})
+        else:
+            # Sampled rows: the fit must weigh each row by the listings it stands for
+            slope, intercept = aggregated_regression(x, y, w)
+            xs = np.array([x.min(), x.max()])
+            ax.plot(xs, intercept + slope * xs, color='grey', linestyle='--', alpha=0.5)
+        ax.legend(title='Rooms', bbox_to_anchor=(1, 1), loc='upper left')
+        return
+
+    if w is None:
+        hb = ax.hexbin(x, y, gridsize=HEXBIN_GRIDSIZE, bins='log', mincnt=1, cmap='viridis')
+    else:
+        hb = ax.hexbin(x, y, C=w, reduce_C_function=np.sum, gridsize=HEXBIN_GRIDSIZE,
+                       bins='log', mincnt=1, cmap='viridis')
+    plt.colorbar(hb, ax=ax, label='Listings (log)')
+
+    slope, intercept = aggregated_regression(x, y, w)
+    xs = np.array([x.min(), x.max()])
+    ax.plot(xs, intercept + slope * xs, color='grey', linestyle='--', alpha=0.8,
+            label=f'Fit: {slope:.1f} €/m² + {intercept:.0f} €')
+    ax.legend(loc='upper left')
+
+
+@instrumented()
+def render_analysis(df_clean: pd.DataFrame, save_path: str = 'rental_analysis_log.png',
+                    mode: str = 'auto', close: bool = True,
+                    estimate: Estimate = None) -> tuple[bool, float]:
+    """
+    Draw and save the overview figure (left open for plt.show() if close=False).
+    Rows with a `weight` column are a sample: counts are weighted, and
+    `estimate` (mean price with its CI) goes in the price panel title.
+    Returns (aggregated mode used, render seconds).
+    """
+    large = mode == 'aggregated' or (mode == 'auto' and len(df_clean) > LARGE_N_THRESHOLD)
+    weights = df_clean['weight'] if 'weight' in df_clean else None
+    count_label = 'Count' if weights is None else 'Listings (estimated)'
+    start = time.perf_counter()
+
+    sns.set_theme(style="whitegrid", context="talk")
+    palette = sns.color_palette("viridis")
+
+    fig = plt.figure(figsize=(20, 12))
+    gs = gridspec.GridSpec(2, 3, figure=fig, height_ratios=[1, 1.2], wspace=0.3, hspace=0.4)
+
+    ax1 = fig.add_subplot(gs[0, 0])
+    plot_distribution(ax1, df_clean['price_eur'], palette[0], large, weights)
+    title = 'Price Distribution (€)'
+    if estimate is not None:
+        title += f'\nmean ≈ €{estimate.mean:.0f} ± {estimate.ci:.0f} (95% CI)'
+    ax1.set_title(title, fontweight='bold')
+    ax1.set_xlabel('Price (€)')
+
+    ax2 = fig.add_subplot(gs[0, 1])
+    plot_distribution(ax2, df_clean['size_m2'], palette[2], large, weights)
+    ax2.set_title('Size Distribution (m²)', fontweight='bold')
+    ax2.set_xlabel('Size (m²)')
+
+    ax3 = fig.add_subplot(gs[0, 2])
+    room_counts = weighted_counts(df_clean['rooms'], weights).sort_index()
+    sns.barplot(x=room_counts.index.astype(int), y=room_counts.values,
+                hue=room_counts.index.astype(int), palette="viridis", legend=False, ax=ax3)
+    ax3.set_title('Number of Rooms', fontweight='bold')
+    ax3.set_xlabel('Rooms')
+    ax3.set_ylabel(count_label)
+
+    ax4 = fig.add_subplot(gs[1, 0])
+    top_rental_types = weighted_counts(df_clean['rental_type'], weights).nlargest(10)
+
+    sns.barplot(x=top_rental_types.values,
+                y=top_rental_types.index.astype(str),
+                hue=top_rental_types.index.astype(str),
+                palette="rocket",
+                legend=False,
+                ax=ax4)
+
+    ax4.set_xscale('log')
+    ax4.set_title('Top Rental Types (Log Scale)', fontweight='bold')
+    ax4.set_xlabel(f'{count_label} (Logarithmic)')
+    ax4.set_ylabel('')
+    ax4.grid(True, which="both", axis="x", ls="--", alpha=0.5)
+
+    ax5 = fig.add_subplot(gs[1, 1:])
+    plot_size_vs_price(ax5, df_clean, large)
+    title = 'Correlation: Size (m²) vs. Price (€)'
+    ax5.set_title(title + (' — density' if large else ''), fontweight='bold')
+    ax5.set_xlabel('Size (m²)')
+    ax5.set_ylabel('Price (€)')
+
+    suptitle = 'Rental Market Analysis' + (' (preview: stratified sample)' if weights is not None else '')
+    plt.suptitle(suptitle, fontsize=24, fontweight='bold', y=0.95)
+    sns.despine()
+
+    plt.savefig(save_path, bbox_inches='tight', dpi=150)
+    if close:
+        plt.close(fig)
+    return large, time.perf_counter() - start
+
+
+def synthetic_frame(n: int, seed: int = 0) -> pd.DataFrame:
+    """Cleaned-shape listings for render benchmarks."""
+    rng = np.random.default_rng(seed)
+    size = np.clip(rng.lognormal(3.6, 0.6, n), 9, 499)
+    rooms = np.clip(np.round(size / 20 + rng.normal(0, 0.7, n)), 1, 9)
+    price = np.clip(size * rng.normal(22, 6, n) + 200, 150, 4999)
+    types = np.array(['Appartement', 'Studio', 'Logement en colocation', 'Maison',
+                      'Chambre chez l\'habitant', 'Résidence étudiante'])
+    return pd.DataFrame({
+        'price_eur': price,
+        'size_m2': size,
+        'rooms': rooms,
+        'rental_type': pd.Categorical.from_codes(rng.integers(0, len(types), n), types),
+    })
+
+
+def benchmark(sizes: list[int], save_path: str = 'rental_analysis_bench.png'):
+    """
+    Report render time per row count in the automatically chosen mode, plus
+    the other mode where detailed rendering is still affordable.
+    """
+    print(f"{'rows':>12s} {'mode':>11s} {'render s':>9s}")
+    for n in sizes:
+        df_clean = synthetic_frame(n)
+        large, elapsed = render_analysis(df_clean, save_path, mode='auto')
+        print(f"{n:12d} {'aggregated' if large else 'detailed':>11s} {elapsed:9.2f}  (auto)")
+        if n <= DETAILED_BENCHMARK_MAX:
+            other = 'detailed' if large else 'aggregated'
+            _, elapsed = render_analysis(df_clean, save_path, mode=other)
+            print(f"{n:12d} {other:>11s} {elapsed:9.2f}")
+
+
+def main(argv: list[str] = None):
+    configure()
+    parser = argparse.ArgumentParser(description="Rental market overview figure")
+    parser.add_argument("--db", default="paris_rentals.db")
+    parser.add_argument("--output", default=None,
+                        help="Figure path (rental_analysis_log.png, or rental_analysis_preview.png)")
+    parser.add_argument("--mode", choices=["auto", "detailed", "aggregated"], default="auto")
+    parser.add_argument("--approx", action="store_true",
+                        help="Preview from the stratified sample, with confidence intervals")
+    parser.add_argument("--benchmark", type=int, nargs="*", metavar="ROWS",
+                        help="Benchmark render time on synthetic data (default: 10k 1M 10M)")
+    args = parser.parse_args(argv)
+    output = args.output or ("rental_analysis_preview.png" if args.approx else "rental_analysis_log.png")
+
+    if args.benchmark is not None:
+        matplotlib.use('Agg')
+        benchmark(args.benchmark or [10_000, 1_000_000, 10_000_000])
+        return
+
+    estimate = None
+    try:
+        if args.approx:
+            df_clean, estimate = load_sample_data(args.db)
+        else:
+            df_clean = load_clean_data(args.db)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        exit()
+
+    if estimate is not None:
+        print(f"Plotting {len(df_clean)} sampled records standing for ~{estimate.population:.0f}; "
+              f"mean price €{estimate.mean:.0f} ± {estimate.ci:.0f} (95% CI).")
+    else:
+        print(f"Plotting {len(df_clean)} records.")
+
+    large, elapsed = render_analysis(df_clean, output, args.mode, close=False,
+                                     estimate=estimate)
+    print(f"Graph saved as '{output}' "
+          f"({'aggregated' if large else 'detailed'} mode, {elapsed:.2f}s)")
+    plt.show()
+
+
+if __name__ == "__main__":
+    main()
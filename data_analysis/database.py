@@ -0,0 +1,130 @@
+"""
+Shared SQLite access layer for the data analysis scripts.
+
+The database runs in WAL mode so a crawl-time writer and analytic readers do
+not block each other. Writes go through a single serialized connection;
+reads borrow from a pool of read-only connections tuned for scans.
+
+One-shot scripts open a single connection with connect_reader() /
+connect_writer(); long-lived, multi-threaded readers (query_service.py)
+share a Database pool.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+DEFAULT_DB_PATH = "paris_rentals.db"
+
+# Page cache per connection (negative value = KiB) and memory-mapped I/O window
+CACHE_SIZE_KIB = 64 * 1024
+MMAP_SIZE_BYTES = 256 * 1024 * 1024
+BUSY_TIMEOUT_MS = 5000
+
+
+def _tune(conn: sqlite3.Connection):
+    """Apply cache, mmap and busy-timeout pragmas to a connection."""
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE_BYTES}")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+def connect_writer(db_path: str = DEFAULT_DB_PATH) -> sqlite3.Connection:
+    """
+    Open a read-write connection with WAL journaling.
+    WAL is persistent, so this also upgrades an existing database file.
+    """
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode = WAL")
+    # NORMAL is durable across application crashes in WAL mode and avoids an
+    # fsync per commit.
+    conn.execute("PRAGMA synchronous = NORMAL")
+    _tune(conn)
+    return conn
+
+
+def connect_reader(db_path: str = DEFAULT_DB_PATH) -> sqlite3.Connection:
+    """Open a read-only connection. Raises FileNotFoundError if the database is missing."""
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Database {db_path} not found. Run create_database.py first.")
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+    conn.execute("PRAGMA query_only = ON")
+    _tune(conn)
+    return conn
+
+
+class Database:
+    """
+    One serialized writer plus a pool of read-only connections.
+
+    Usage:
+        db = Database("paris_rentals.db")
+        with db.writer() as conn:
+            insert_data(conn, records)
+        with db.reader() as conn:
+            rows = conn.execute("SELECT ...").fetchall()
+        db.close()
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, pool_size: int = 4):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        # Opened on first use, so a read-only user never holds a writer
+        self._write_conn = None
+        self._write_lock = threading.Lock()
+        self._readers = queue.Queue(maxsize=pool_size)
+        self._opened = 0
+        self._open_lock = threading.Lock()
+
+    @contextmanager
+    def writer(self):
+        """Hold the writer connection; commit on success, roll back on error."""
+        with self._write_lock:
+            if self._write_conn is None:
+                self._write_conn = connect_writer(self.db_path)
+            try:
+                yield self._write_conn
+                self._write_conn.commit()
+            except Exception:
+                self._write_conn.rollback()
+                raise
+
+    @contextmanager
+    def reader(self):
+        """Borrow a read-only connection from the pool (opened lazily)."""
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            # End any implicit read transaction so the WAL can checkpoint
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._open_lock:
+            if self._opened < self.pool_size:
+                self._opened += 1
+                return connect_reader(self.db_path)
+        return self._readers.get()
+
+    def close(self):
+        """Close every pooled connection and checkpoint the WAL (if written to)."""
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._write_lock:
+            if self._write_conn is not None:
+                self._write_conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self._write_conn.close()
+                self._write_conn = None
@@ -0,0 +1,574 @@
+"""
+Offline geo-resolution of listing addresses (city, département, commune centroid).
+
+Studapart is national, but extract_arrondissement and the Paris bounding box
+only understand Paris. This module resolves any French address against a
+compact commune index shipped as communes_fr.db (SQLite, keyed by normalized
+commune name; its postcodes table is empty, see below):
+
+  * the département comes from the postal code when the address has one
+    (Corsica 200xx-201xx -> 2A, 202xx-206xx -> 2B, overseas 97x -> 3 digits),
+    otherwise from a trailing département name ('Valence, Drôme'), the index
+    or other addresses of the same commune;
+  * the commune is looked up by postal code when the index has postal codes;
+    with the shipped index only the postcode's département prefix is used,
+    and the commune comes from the city name next to it / in the comma-separated parts, restricted
+    to the postcode's or the address's region and preferably its département,
+    the most populous winning.
+
+Lookups are batched (one IN query per chunk of distinct keys) and cached per
+address, so a full load costs a few queries. The rentals columns city,
+departement, city_lat and city_lon are indexed for per-city analyses.
+
+The index is built from GeoNames (cities500, CC-BY 4.0): either the
+official dump (cities500.txt or FR.txt, with départements) or the
+geonamescache JSON, which has none; --admin2 then takes them from a GeoNames
+cities1000 extract with admin2 names (reverse_geocode's geocode.gz), and the
+remaining small communes get the département of their 7 nearest neighbours
+in the region (departement_estimated = 1; an estimate never rules a commune
+out). La Poste's base officielle des codes postaux can be joined on the
+INSEE code, which only the official dump carries: --postcodes needs
+cities500.txt / FR.txt, and communes_fr.db, built from the JSON, has no
+postcode rows.
+
+Usage:
+    python geo_index.py build --geonames cities500.json [--admin2 geocode.gz] [--postcodes laposte_hexasmal.csv]
+    python geo_index.py lookup "5 Rue Pierre Cacard, 69100 Villeurbanne, France"
+    python geo_index.py resolve [--db paris_rentals.db] [--all]
+"""
+
+import csv
+import functools
+import heapq
+import json
+import math
+import re
+import sqlite3
+import sys
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import NamedTuple
+
+from instrumentation import configure, instrumented
+
+
+INDEX_PATH = Path(__file__).with_name("communes_fr.db")
+
+# Distinct keys per IN (...) query, below SQLite's default variable limit
+BATCH_SIZE = 500
+
+# Neighbouring communes that vote on the département of a commune the source has none for
+ESTIMATE_NEIGHBOURS = 7
+
+# INSEE region code of each département (GeoNames admin1 codes are INSEE's)
+REGION_DEPARTEMENTS = {
+    "11": "75 77 78 91 92 93 94 95",
+    "24": "18 28 36 37 41 45",
+    "27": "21 25 39 58 70 71 89 90",
+    "28": "14 27 50 61 76",
+    "32": "02 59 60 62 80",
+    "44": "08 10 51 52 54 55 57 67 68 88",
+    "52": "44 49 53 72 85",
+    "53": "22 29 35 56",
+    "75": "16 17 19 23 24 33 40 47 64 79 86 87",
+    "76": "09 11 12 30 31 32 34 46 48 65 66 81 82",
+    "84": "01 03 07 15 26 38 42 43 63 69 73 74",
+    "93": "04 05 06 13 83 84",
+    "94": "2A 2B",
+    "01": "971", "02": "972", "03": "973", "04": "974", "06": "976",
+}
+DEPARTEMENT_REGION = {d: r for r, ds in REGION_DEPARTEMENTS.items() for d in ds.split()}
+
+DEPARTEMENT_NAMES = {
+    "01": "Ain", "02": "Aisne", "03": "Allier", "04": "Alpes-de-Haute-Provence",
+    "05": "Hautes-Alpes", "06": "Alpes-Maritimes", "07": "Ardèche", "08": "Ardennes",
+    "09": "Ariège", "10": "Aube", "11": "Aude", "12": "Aveyron", "13": "Bouches-du-Rhône",
+    "14": "Calvados", "15": "Cantal", "16": "Charente", "17": "Charente-Maritime", "18": "Cher",
+    "19": "Corrèze", "2A": "Corse-du-Sud", "2B": "Haute-Corse", "21": "Côte-d'Or",
+    "22": "Côtes-d'Armor", "23": "Creuse", "24": "Dordogne", "25": "Doubs", "26": "Drôme",
+    "27": "Eure", "28": "Eure-et-Loir", "29": "Finistère", "30": "Gard", "31": "Haute-Garonne",
+    "32": "Gers", "33": "Gironde", "34": "Hérault", "35": "Ille-et-Vilaine", "36": "Indre",
+    "37": "Indre-et-Loire", "38": "Isère", "39": "Jura", "40": "Landes", "41": "Loir-et-Cher",
+    "42": "Loire", "43": "Haute-Loire", "44": "Loire-Atlantique", "45": "Loiret", "46": "Lot",
+    "47": "Lot-et-Garonne", "48": "Lozère", "49": "Maine-et-Loire", "50": "Manche",
+    "51": "Marne", "52": "Haute-Marne", "53": "Mayenne", "54": "Meurthe-et-Moselle",
+    "55": "Meuse", "56": "Morbihan", "57": "Moselle", "58": "Nièvre", "59": "Nord",
+    "60": "Oise", "61": "Orne", "62": "Pas-de-Calais", "63": "Puy-de-Dôme",
+    "64": "Pyrénées-Atlantiques", "65": "Hautes-Pyrénées", "66": "Pyrénées-Orientales",
+    "67": "Bas-Rhin", "68": "Haut-Rhin", "69": "Rhône", "70": "Haute-Saône",
+    "71": "Saône-et-Loire", "72": "Sarthe", "73": "Savoie", "74": "Haute-Savoie", "75": "Paris",
+    "76": "Seine-Maritime", "77": "Seine-et-Marne", "78": "Yvelines", "79": "Deux-Sèvres",
+    "80": "Somme", "81": "Tarn", "82": "Tarn-et-Garonne", "83": "Var", "84": "Vaucluse",
+    "85": "Vendée", "86": "Vienne", "87": "Haute-Vienne", "88": "Vosges", "89": "Yonne",
+    "90": "Territoire de Belfort", "91": "Essonne", "92": "Hauts-de-Seine",
+    "93": "Seine-Saint-Denis", "94": "Val-de-Marne", "95": "Val-d'Oise",
+    "971": "Guadeloupe", "972": "Martinique", "973": "Guyane", "974": "La Réunion",
+    "976": "Mayotte",
+}
+
+# GeoNames admin2 names that are not the official ones
+DEPARTEMENT_ALIASES = {
+    "upper garonne": "31", "south corsica": "2A", "upper corsica": "2B", "loire et cher": "41",
+}
+
+# Region names as they appear in Studapart addresses, normalized
+REGION_NAMES = {
+    "ile de france": "11", "centre val de loire": "24", "bourgogne franche comte": "27",
+    "normandie": "28", "hauts de france": "32", "grand est": "44", "pays de la loire": "52",
+    "bretagne": "53", "nouvelle aquitaine": "75", "occitanie": "76",
+    "auvergne rhone alpes": "84", "provence alpes cote d azur": "93", "corse": "94",
+}
+
+COUNTRY_FRANCE = {"france", "fr", "fra"}
+COUNTRY_OTHER = {
+    "belgique", "belgium", "be", "espagne", "spain", "espana", "es", "italie", "italia",
+    "allemagne", "deutschland", "suisse", "switzerland", "ch", "luxembourg", "lu",
+    "portugal", "pt", "royaume uni", "united kingdom", "uk", "pays bas", "nederland", "nl",
+    "monaco",
+}
+
+POSTCODE_RE = re.compile(r"(?<!\d)(\d{5})(?!\d)")
+STREET_RE = re.compile(r"^\d|\b(rue|avenue|av|bd|boulevard|place|pl|chemin|allee|all|impasse|"
+                       r"quai|cours|route|square|sq|residence|rte)\b")
+
+
+class Place(NamedTuple):
+    city: str
+    departement: str
+    latitude: float
+    longitude: float
+
+
+NO_PLACE = Place(None, None, None, None)
+
+
+# Address fragments repeat (cities, regions, 'France'); street parts do not
+@functools.lru_cache(maxsize=1 << 16)
+def normalize(text: str) -> str:
+    """Lowercase, strip accents, unify hyphens/apostrophes, expand St/Ste."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    text = re.sub(r"[^a-z0-9]+", " ", text).strip()
+    return re.sub(r"\b(st|ste)\b", lambda m: "saint" if m.group(1) == "st" else "sainte", text)
+
+
+DEPARTEMENT_KEYS = {normalize(name): code for code, name in DEPARTEMENT_NAMES.items()}
+DEPARTEMENT_KEYS.update(DEPARTEMENT_ALIASES)
+
+
+def postcode_departement(postcode: str) -> str:
+    """Département code of a French postal code, None if it is not one."""
+    prefix = postcode[:2]
+    if prefix == "20":
+        return "2A" if postcode < "20200" else "2B"
+    if prefix == "97":
+        return postcode[:3] if postcode[:3] in DEPARTEMENT_REGION else None
+    return prefix if prefix in DEPARTEMENT_REGION else None
+
+
+def departement_code(name: str) -> str:
+    """Code of a département name ('Drôme', 'Département du Nord'), None if it is not one."""
+    key = re.sub(r"^departement (du |de la |de l |des |d )?", "", normalize(name))
+    return DEPARTEMENT_KEYS.get(key)
+
+
+def city_key(text: str) -> str:
+    """Normalized commune name from an address fragment ('Paris 13e Arrondissement' -> 'paris')."""
+    return re.sub(r"\s*\d.*$", "", normalize(text))
+
+
+class ParsedAddress(NamedTuple):
+    postcode: str
+    departement: str
+    region: str
+    keys: tuple
+
+
+def parse_address(address: str) -> ParsedAddress:
+    """Postcode, département, region hint and candidate city keys (best first)."""
+    if not address:
+        return None
+    parts = [p.strip() for p in address.split(",") if p.strip()]
+    tail = normalize(parts[-1]) if parts else ""
+    if tail in COUNTRY_OTHER or (tail.split() or [""])[-1] in COUNTRY_OTHER:
+        return None
+
+    postcode = departement = region = None
+    keys = []
+    matches = list(POSTCODE_RE.finditer(address))
+    if matches:
+        match = matches[-1]
+        departement = postcode_departement(match.group(1))
+        if departement:
+            postcode = match.group(1)
+            region = DEPARTEMENT_REGION[departement]
+            # '75011 Paris FR' but 'Roissy-en-France': try with and without the country
+            key = city_key(address[match.end():].split(",")[0])
+            words = key.split()
+            if len(words) > 1 and words[-1] in COUNTRY_FRANCE:
+                keys.append(" ".join(words[:-1]))
+            keys.append(key)
+
+    # 'street, [postcode] city, [region,] France': the first part is the
+    # street unless it is all there is ('Montpellier, France', 'Paris')
+    while parts and normalize(parts[-1]) in COUNTRY_FRANCE:
+        parts.pop()
+    # Trailing département names ('Valence, Drôme') are hints too, unless
+    # the city would be left as the street ('3 rue X, Vienne' is the commune);
+    # they are still tried last, as some are communes ('Villa Curial, Paris')
+    fallback = []
+    while len(parts) > 2 or (len(parts) == 2 and not STREET_RE.search(normalize(parts[0]))):
+        key = city_key(parts[-1])
+        if key in REGION_NAMES:
+            region = region or REGION_NAMES[key]
+        elif departement_code(key):
+            hint = departement_code(key)
+            departement = departement or hint
+            region = region or DEPARTEMENT_REGION.get(hint)
+            fallback.append(key)
+        else:
+            break
+        parts.pop()
+    for i, part in reversed(list(enumerate(parts))):
+        key = city_key(part)
+        if key in REGION_NAMES:
+            region = region or REGION_NAMES[key]
+        elif key and not (i == 0 and len(parts) > 1) and not (len(parts) > 1 and STREET_RE.search(key)):
+            keys.append(key)
+    keys += fallback
+    return ParsedAddress(postcode, departement, region,
+                         tuple(dict.fromkeys(k for k in keys if k)))
+
+
+def parse_addresses(addresses: list[str]) -> dict:
+    """{address: ParsedAddress} of the distinct addresses, to share between batch steps."""
+    return {address: parse_address(address) for address in set(addresses)}
+
+
+# -- index -------------------------------------------------------------------
+
+class GeoIndex:
+    """Batched, cached address resolution against communes_fr.db."""
+
+    def __init__(self, path: str = INDEX_PATH):
+        if not Path(path).exists():
+            raise FileNotFoundError(f"{path} not found. Run geo_index.py build first.")
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self.has_postcodes = self.conn.execute("SELECT EXISTS (SELECT 1 FROM postcodes)").fetchone()[0]
+        self.names = {}         # key -> [commune rows]
+        self.postcodes = {}     # postcode -> [commune rows]
+        self.resolved = {}      # address -> (commune row or None, département from postcode)
+        self.learned = {}       # commune id -> Counter of départements seen with its postcodes
+
+    def close(self):
+        self.conn.close()
+
+    def fetch(self, table: str, column: str, keys: set, cache: dict):
+        alias = "t.alias" if table == "names" else "0"
+        keys = [k for k in keys if k not in cache]
+        for k in keys:
+            cache[k] = []
+        for i in range(0, len(keys), BATCH_SIZE):
+            chunk = keys[i:i + BATCH_SIZE]
+            rows = self.conn.execute(f"""
+                SELECT t.{column}, c.id, c.name, c.departement, c.region,
+                       c.latitude, c.longitude, c.population, {alias}, c.departement_estimated
+                FROM {table} t JOIN communes c ON c.id = t.id
+                WHERE t.{column} IN ({','.join('?' * len(chunk))})
+            """, chunk)
+            for key, *commune in rows:
+                cache[key].append(tuple(commune))
+
+    def match(self, parsed: ParsedAddress) -> tuple:
+        """Best commune row for a parsed address, or None."""
+        def best(rows):
+            # An estimated département (small communes) never rules a commune
+            # out; a name found only across the border ('92160 Wissous') is
+            # kept if the region agrees
+            if parsed.departement:
+                rows = [r for r in rows if r[2] in (None, parsed.departement) or r[8]] or rows
+            if parsed.region:
+                rows = [r for r in rows if r[3] in (None, parsed.region)]
+            # Official names before aliases ('Clermont'), then the most populous
+            return max(rows, key=lambda r: (not r[7], r[6] or 0)) if rows else None
+
+        if parsed.postcode and self.postcodes.get(parsed.postcode):
+            rows = self.postcodes[parsed.postcode]
+            named = [r for r in rows if normalize(r[1]) in parsed.keys]
+            return best(named or rows)
+        for key in parsed.keys:
+            found = best(self.names.get(key, []))
+            if found:
+                return found
+        return None
+
+    @instrumented(records=len)
+    def resolve(self, addresses: list[str], parsed: dict = None) -> list[Place]:
+        """
+        Place for each address, NO_PLACE where it cannot be resolved; parsed
+        holds addresses already parsed (parse_addresses).
+        """
+        parsed = parsed or {}
+        pending = {a: parsed[a] if a in parsed else parse_address(a)
+                   for a in set(addresses) if a not in self.resolved}
+        parsed = [p for p in pending.values() if p]
+        if self.has_postcodes:
+            self.fetch("postcodes", "postcode", {p.postcode for p in parsed if p.postcode},
+                       self.postcodes)
+        self.fetch("names", "key", {k for p in parsed for k in p.keys}, self.names)
+
+        for address, p in pending.items():
+            commune = self.match(p) if p else None
+            self.resolved[address] = (commune, p.departement if p else None)
+            if commune and p.departement:
+                self.learned.setdefault(commune[0], Counter())[p.departement] += 1
+
+        places = []
+        for address in addresses:
+            commune, departement = self.resolved[address]
+            if commune is None:
+                places.append(Place(None, departement, None, None))
+                continue
+            departement = departement or commune[2]
+            if departement is None and commune[0] in self.learned:
+                departement = self.learned[commune[0]].most_common(1)[0][0]
+            places.append(Place(commune[1], departement, commune[4], commune[5]))
+        return places
+
+
+def resolve_addresses(addresses: list[str], path: str = INDEX_PATH, parsed: dict = None) -> list[Place]:
+    """One-shot batch resolution (see GeoIndex.resolve)."""
+    index = GeoIndex(path)
+    try:
+        return index.resolve(addresses, parsed)
+    finally:
+        index.close()
+
+
+# -- rentals columns -----------------------------------------------------------
+
+GEO_COLUMNS = {"city": "TEXT", "departement": "TEXT", "city_lat": "REAL", "city_lon": "REAL"}
+
+
+def create_geo_schema(conn: sqlite3.Connection):
+    """Add the indexed rentals.city / departement / city_lat / city_lon columns."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(rentals)")}
+    for name, sql_type in GEO_COLUMNS.items():
+        if name not in columns:
+            conn.execute(f"ALTER TABLE rentals ADD COLUMN {name} {sql_type}")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_city ON rentals(city)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_departement ON rentals(departement, city)")
+
+
+@instrumented(records=int)
+def update_rentals(conn: sqlite3.Connection, resolve_all: bool = False) -> int:
+    """Resolve rentals rows (only those without a city unless resolve_all). Returns rows updated."""
+    where = "" if resolve_all else "WHERE city IS NULL AND departement IS NULL"
+    rows = conn.execute(f"SELECT id, address FROM rentals {where}").fetchall()
+    places = resolve_addresses([address for _, address in rows])
+    updates = [(*place, row_id) for (row_id, _), place in zip(rows, places) if place != NO_PLACE]
+    conn.executemany("""
+        UPDATE rentals SET city = ?, departement = ?, city_lat = ?, city_lon = ? WHERE id = ?
+    """, updates)
+    return len(updates)
+
+
+# -- build -----------------------------------------------------------------------
+
+# Sub-municipal GeoNames entries (PPLX: 'Paris 15 Vaugirard', 'Lyon 03', 'Marseille Endoume')
+SECTION_RE = re.compile(r"^(Paris|Lyon|Marseille) ")
+
+# Basic Latin, Latin-1 and Latin Extended-A/B letters, digits and punctuation
+LATIN_RE = re.compile(r"[\x20-\x7e\xc0-\u024f]+")
+
+
+def read_geonames(path: str) -> list[dict]:
+    """French populated places from a geonamescache JSON or a GeoNames dump (.txt)."""
+    communes = []
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            for c in json.load(f).values():
+                if c["countrycode"] == "FR" and not SECTION_RE.match(c["name"]):
+                    communes.append({"id": c["geonameid"], "name": c["name"], "departement": None,
+                                     "region": c["admin1code"], "insee": None,
+                                     "alternatenames": c["alternatenames"],
+                                     "latitude": c["latitude"], "longitude": c["longitude"],
+                                     "population": c["population"]})
+        return communes
+
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            if row[8] != "FR" or not row[7].startswith("PPL") or row[7] == "PPLX":
+                continue
+            communes.append({"id": int(row[0]), "name": row[1], "departement": row[11] or None,
+                             "region": row[10] or None, "insee": row[13] or None,
+                             "alternatenames": row[3].split(",") if row[3] else [],
+                             "latitude": float(row[4]), "longitude": float(row[5]),
+                             "population": int(row[14] or 0)})
+    return communes
+
+
+def commune_keys(commune: dict) -> list[tuple[str, int]]:
+    """(key, is_alias) for the official name and its Latin-script alternate
+    names ('Dunkerque' for Dunkirk, 'Saint-Ouen-sur-Seine'); airport codes and
+    transliterations from other scripts are left out."""
+    key = normalize(commune["name"])
+    aliases = {normalize(a) for a in commune["alternatenames"]
+               if LATIN_RE.fullmatch(a) and not (a.isupper() and len(a) <= 4)}
+    return [(key, 0)] + [(a, 1) for a in sorted(aliases - {key, ""})]
+
+
+def read_admin2(path: str) -> dict[tuple, str]:
+    """
+    (latitude, longitude) -> département code, from GeoNames places with
+    their admin2 name: the geocode.gz (JSON) shipped with the reverse_geocode
+    package, built from GeoNames cities1000. Completes a geonamescache
+    source, which has no admin2 code.
+    """
+    import gzip
+
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        places = json.load(f)
+    return {(round(p["latitude"], 5), round(p["longitude"], 5)): departement_code(p["county"])
+            for p in places if p["country_code"] == "FR" and p.get("county")}
+
+
+def estimate_departements(communes: list[dict], k: int = ESTIMATE_NEIGHBOURS) -> int:
+    """
+    Give communes without a département the one most of their k nearest
+    communes of the same region have (inverse-distance vote), flagged as
+    estimated. Returns the number estimated.
+    """
+    known = {}
+    for c in communes:
+        if c["departement"]:
+            known.setdefault(c["region"], []).append(c)
+    estimated = 0
+    for c in communes:
+        if c["departement"] or not known.get(c["region"]):
+            continue
+        scale = math.cos(math.radians(c["latitude"]))
+        nearest = heapq.nsmallest(k, known[c["region"]], key=lambda o: (
+            (o["latitude"] - c["latitude"]) ** 2 + ((o["longitude"] - c["longitude"]) * scale) ** 2))
+        votes = Counter()
+        for o in nearest:
+            distance = math.hypot(o["latitude"] - c["latitude"], (o["longitude"] - c["longitude"]) * scale)
+            votes[o["departement"]] += 1 / (distance + 1e-6)
+        c["departement"] = votes.most_common(1)[0][0]
+        c["departement_estimated"] = 1
+        estimated += 1
+    return estimated
+
+
+def read_postcodes(path: str) -> dict[str, set]:
+    """INSEE code -> postal codes from La Poste's base officielle (';'-separated CSV)."""
+    postcodes = {}
+    with open(path, "r", encoding="utf-8-sig") as f:
+        reader = csv.reader(f, delimiter=";")
+        next(reader)
+        for row in reader:
+            postcodes.setdefault(row[0], set()).add(row[2])
+    return postcodes
+
+
+def build_index(geonames_path: str, postcodes_path: str = None, out_path: str = INDEX_PATH,
+                admin2_path: str = None) -> int:
+    """Write the commune index. Returns the number of communes."""
+    communes = read_geonames(geonames_path)
+    postcodes = read_postcodes(postcodes_path) if postcodes_path else {}
+    if postcodes and not any(c["insee"] for c in communes):
+        print(f"{geonames_path} has no INSEE codes; --postcodes needs the official GeoNames dump",
+              file=sys.stderr)
+    if admin2_path:
+        admin2 = read_admin2(admin2_path)
+        for c in communes:
+            c["departement"] = c["departement"] or admin2.get(
+                (round(c["latitude"], 5), round(c["longitude"], 5)))
+    estimated = estimate_departements(communes)
+
+    out = Path(out_path)
+    out.unlink(missing_ok=True)
+    conn = sqlite3.connect(out)
+    conn.executescript("""
+        CREATE TABLE communes (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            departement TEXT,
+            region TEXT,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            population INTEGER,
+            departement_estimated INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE names (
+            key TEXT, id INTEGER, alias INTEGER NOT NULL, PRIMARY KEY (key, id)
+        ) WITHOUT ROWID;
+        CREATE TABLE postcodes (postcode TEXT, id INTEGER, PRIMARY KEY (postcode, id)) WITHOUT ROWID;
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+    """)
+    conn.executemany("INSERT INTO communes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+        (c["id"], c["name"], c["departement"], c["region"],
+         round(c["latitude"], 5), round(c["longitude"], 5), c["population"],
+         c.get("departement_estimated", 0)) for c in communes])
+    conn.executemany("INSERT OR IGNORE INTO names VALUES (?, ?, ?)", [
+        (key, c["id"], alias) for c in communes for key, alias in commune_keys(c)])
+    conn.executemany("INSERT OR IGNORE INTO postcodes VALUES (?, ?)",
+                     [(pc, c["id"]) for c in communes for pc in postcodes.get(c["insee"], ())])
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+        ("source", Path(geonames_path).name),
+        ("postcodes", Path(postcodes_path).name if postcodes_path else ""),
+        ("admin2", Path(admin2_path).name if admin2_path else ""),
+        ("departements_estimated", str(estimated)),
+        ("license", "GeoNames CC-BY 4.0"),
+    ])
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    return len(communes)
+
+
+def main(argv: list[str] = None):
+    import argparse
+
+    configure()
+    parser = argparse.ArgumentParser(description="Offline city / département resolution")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="Build communes_fr.db from GeoNames (and La Poste postcodes)")
+    b.add_argument("--geonames", required=True, help="geonamescache cities500.json or GeoNames .txt dump")
+    b.add_argument("--postcodes", help="La Poste base officielle des codes postaux (CSV)")
+    b.add_argument("--admin2", help="GeoNames places with département names (reverse_geocode's "
+                                    "geocode.gz), for a geonamescache source")
+    b.add_argument("--out", default=str(INDEX_PATH))
+    lk = sub.add_parser("lookup", help="Resolve addresses given on the command line")
+    lk.add_argument("addresses", nargs="+")
+    r = sub.add_parser("resolve", help="Fill the geo columns of the rentals table")
+    r.add_argument("--db", default="paris_rentals.db")
+    r.add_argument("--all", action="store_true", help="Re-resolve rows that already have a city")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        n = build_index(args.geonames, args.postcodes, args.out, args.admin2)
+        print(f"Indexed {n} communes into {args.out}")
+    elif args.command == "lookup":
+        for address, place in zip(args.addresses, resolve_addresses(args.addresses)):
+            print(f"{address}\n  -> {place.city} ({place.departement}) {place.latitude}, {place.longitude}")
+    else:
+        from database import connect_writer
+
+        conn = connect_writer(args.db)
+        create_geo_schema(conn)
+        updated = update_rentals(conn, args.all)
+        conn.commit()
+        print(f"Resolved {updated} listings.")
+        for departement, city, n in conn.execute("""
+            SELECT departement, city, COUNT(*) AS n FROM rentals
+            WHERE city IS NOT NULL GROUP BY departement, city ORDER BY n DESC LIMIT 10
+        """):
+            print(f"  {departement or '??':3s} {city:30s} {n:6d}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
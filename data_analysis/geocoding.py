@@ -0,0 +1,402 @@
+"""
+Batch geocoding of listing addresses with a persistent cache.
+
+Studapart items carry no Lat/Lon, so they were missing from the heatmap and
+from coordinate-based arrondissement resolution. Addresses are normalized
+('24 rue Saint-Bernard 75011 Paris FR' and '24 Rue St-Bernard, 75011 Paris,
+France' share the key '24|rue saint bernard|75011|paris'), looked up in
+geocode_cache.db in batches and only the misses go to the backend, so each
+unique address is resolved once across all runs (unresolved ones too, unless
+--retry-misses).
+
+Backends (BACKENDS) take a batch of parsed addresses and return the hits:
+  ban  BAN address points ("Base Adresse Nationale" CSV export, the
+       national file or a directory of per-département adresses-XX.csv[.gz],
+       of which only the départements in the batch are read); house number
+       match, else the street's mean position
+  csv  any 'address;latitude;longitude' file, e.g. exported from another
+       geocoder
+
+insert_data geocodes listings without coordinates through the cache, and
+through the backend configured by RENTALS_GEOCODER ('ban:/data/ban').
+
+Usage:
+    python geocoding.py run --backend ban --source /data/ban [--db paris_rentals.db]
+    python geocoding.py run --backend csv --source geocoded.csv --retry-misses
+    python geocoding.py stats
+"""
+
+import csv
+import gzip
+import os
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+from geo_index import ParsedAddress, city_key, normalize, parse_address, postcode_departement
+from instrumentation import configure, instrumented
+from outliers import flag_outliers
+from quantile_sketch import rebuild_sketches
+from reservoir_sample import rebuild_sample
+
+
+CACHE_PATH = Path(__file__).with_name("geocode_cache.db")
+
+# Backend spec "<name>:<source>" used by insert_data (unset: cache only)
+GEOCODER_ENV = "RENTALS_GEOCODER"
+
+# Keys per IN (...) query against the cache
+BATCH_SIZE = 500
+
+STREET_TYPES = {
+    "av": "avenue", "ave": "avenue", "bd": "boulevard", "bld": "boulevard", "boul": "boulevard",
+    "pl": "place", "sq": "square", "all": "allee", "chem": "chemin", "che": "chemin",
+    "prom": "promenade", "rte": "route", "imp": "impasse", "fg": "faubourg", "fbg": "faubourg",
+    "crs": "cours", "r": "rue", "res": "residence", "qu": "quai", "pas": "passage",
+}
+NUMBER_RE = re.compile(r"^(\d+)\s*(bis|ter|quater|[a-d])?\b\s*(.*)$")
+
+
+class AddressKey(NamedTuple):
+    number: str         # house number with its repetition index ('12bis'), '' if none
+    street: str
+    postcode: str       # '' if the address has none
+    city: str
+
+    def __str__(self) -> str:
+        return "|".join(self)
+
+
+class Geocode(NamedTuple):
+    latitude: float
+    longitude: float
+    precision: str      # 'housenumber' or 'street'
+
+
+def normalize_street(text: str) -> tuple[str, str]:
+    """(number, street) with street types expanded: '24 Bd St-Michel' -> ('24', 'boulevard saint michel')."""
+    text = normalize(text)
+    number = ""
+    match = NUMBER_RE.match(text)
+    if match:
+        number = match.group(1) + (match.group(2) or "")
+        text = match.group(3)
+    words = text.split()
+    if words and words[0] in STREET_TYPES:
+        words[0] = STREET_TYPES[words[0]]
+    return number, " ".join(words)
+
+
+def address_key(address: str, parsed: ParsedAddress = None) -> AddressKey:
+    """
+    Normalized cache key of a French street address, None if it has no
+    street or city; parsed is parse_address(address) when already known.
+    """
+    parsed = parsed or parse_address(address)
+    if not parsed or not parsed.keys:
+        return None
+    # The street is the first comma-separated part, or what precedes the postcode
+    street = address.split(",")[0]
+    if parsed.postcode and "," not in address:
+        street = address[:address.rfind(parsed.postcode)]
+    number, street = normalize_street(street)
+    if not street or street == parsed.keys[0]:
+        return None
+    return AddressKey(number, street, parsed.postcode or "", parsed.keys[0])
+
+
+# -- backends ----------------------------------------------------------------
+
+class Backend:
+    """Resolves batches of address keys; subclasses implement geocode()."""
+
+    name = None
+
+    def __init__(self, source: str):
+        self.source = Path(source)
+        if not self.source.exists():
+            raise FileNotFoundError(f"{source} not found")
+
+    def geocode(self, keys: list[AddressKey]) -> dict[AddressKey, Geocode]:
+        raise NotImplementedError
+
+
+def open_text(path: Path):
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+class BanBackend(Backend):
+    """BAN address points, read once per batch and filtered to its postcodes and cities."""
+
+    name = "ban"
+
+    def files(self, keys: list[AddressKey]) -> list[Path]:
+        if self.source.is_file():
+            return [self.source]
+        departements = {postcode_departement(k.postcode) for k in keys if k.postcode}
+        files = []
+        for path in sorted(self.source.glob("adresses-*.csv*")):
+            code = path.name.split(".")[0].removeprefix("adresses-")
+            # Addresses without a postcode can be anywhere
+            if code in departements or any(not k.postcode for k in keys):
+                files.append(path)
+        return files
+
+    def geocode(self, keys: list[AddressKey]) -> dict[AddressKey, Geocode]:
+        postcodes = {k.postcode for k in keys if k.postcode}
+        cities = {k.city for k in keys if not k.postcode}
+        wanted = {(k.postcode or k.city, k.street) for k in keys}
+
+        # (postcode or city, street) -> {number: (lat, lon)}
+        points = {}
+        for path in self.files(keys):
+            with open_text(path) as f:
+                for row in csv.DictReader(f, delimiter=";"):
+                    postcode = row["code_postal"]
+                    city = city_key(row["nom_commune"]) if cities else None
+                    if postcode not in postcodes and city not in cities:
+                        continue
+                    number, street = normalize_street(f"{row['numero']}{row['rep']} {row['nom_voie']}")
+                    point = (float(row["lat"]), float(row["lon"]))
+                    for place in (postcode, city):
+                        if (place, street) in wanted:
+                            points.setdefault((place, street), {})[number] = point
+
+        found = {}
+        for k in keys:
+            street = points.get((k.postcode or k.city, k.street))
+            if not street:
+                continue
+            if k.number in street:
+                found[k] = Geocode(*street[k.number], "housenumber")
+            else:
+                lats, lons = zip(*street.values())
+                found[k] = Geocode(sum(lats) / len(lats), sum(lons) / len(lons), "street")
+        return found
+
+
+class CsvBackend(Backend):
+    """Pre-geocoded 'address;latitude;longitude[;precision]' rows, matched on the normalized address."""
+
+    name = "csv"
+
+    def geocode(self, keys: list[AddressKey]) -> dict[AddressKey, Geocode]:
+        wanted = set(keys)
+        found = {}
+        with open_text(self.source) as f:
+            for row in csv.DictReader(f, delimiter=";"):
+                key = address_key(row["address"])
+                if key in wanted and row["latitude"] and row["longitude"]:
+                    found[key] = Geocode(float(row["latitude"]), float(row["longitude"]),
+                                         row.get("precision") or "housenumber")
+        return found
+
+
+BACKENDS = {backend.name: backend for backend in (BanBackend, CsvBackend)}
+
+
+def backend_from_spec(spec: str) -> Backend:
+    """'ban:/data/ban' -> BanBackend('/data/ban')."""
+    name, _, source = spec.partition(":")
+    if name not in BACKENDS or not source:
+        raise ValueError(f"Invalid geocoder '{spec}', expected one of "
+                         f"{', '.join(f'{n}:<path>' for n in BACKENDS)}")
+    return BACKENDS[name](source)
+
+
+# -- cache -------------------------------------------------------------------
+
+class GeocodeStats:
+    def __init__(self):
+        self.addresses = self.unique = self.hits = self.resolved = self.unresolved = self.uncached = 0
+        self.backend_seconds = self.seconds = 0.0
+
+    def report(self) -> str:
+        lookups = self.hits + self.resolved + self.unresolved + self.uncached
+        hit_rate = self.hits / lookups if lookups else 0.0
+        queried = self.resolved + self.unresolved
+        rate = queried / self.backend_seconds if self.backend_seconds else 0.0
+        overall = self.addresses / self.seconds if self.seconds else 0.0
+        return (f"Geocoding: {self.addresses} addresses, {self.unique} unique, "
+                f"cache hits {self.hits} ({hit_rate:.1%}), backend resolved {self.resolved} / "
+                f"{queried} ({rate:,.0f} addresses/s), {overall:,.0f} addresses/s overall"
+                + (f", {self.uncached} not in the cache (no backend)" if self.uncached else ""))
+
+
+class Geocoder:
+    """Cache-first batch geocoding; backend=None answers from the cache only."""
+
+    def __init__(self, backend: Backend = None, cache_path: str = CACHE_PATH,
+                 retry_misses: bool = False):
+        self.backend = backend
+        self.retry_misses = retry_misses
+        self.cache = sqlite3.connect(cache_path)
+        self.cache.execute("""
+            CREATE TABLE IF NOT EXISTS geocodes (
+                key TEXT PRIMARY KEY,
+                latitude REAL,        -- NULL: the backend could not resolve it
+                longitude REAL,
+                precision TEXT,
+                backend TEXT NOT NULL,
+                resolved_at TEXT NOT NULL
+            )
+        """)
+        self.stats = GeocodeStats()
+
+    def close(self):
+        self.cache.close()
+
+    def lookup(self, keys: list[str]) -> dict[str, tuple]:
+        cached = {}
+        for i in range(0, len(keys), BATCH_SIZE):
+            chunk = keys[i:i + BATCH_SIZE]
+            cached.update((row[0], row[1:]) for row in self.cache.execute(f"""
+                SELECT key, latitude, longitude, precision FROM geocodes
+                WHERE key IN ({','.join('?' * len(chunk))})
+            """, chunk))
+        return cached
+
+    @instrumented(records=len)
+    def geocode(self, addresses: list[str], parsed: dict = None) -> list[Geocode]:
+        """
+        Geocode for each address, None where it is unknown; parsed holds
+        addresses already parsed (geo_index.parse_addresses).
+        """
+        start = time.perf_counter()
+        parsed = parsed or {}
+        keys = {a: address_key(a, parsed.get(a)) for a in set(addresses) if a}
+        unique = {str(k): k for k in keys.values() if k}
+        cached = self.lookup(list(unique))
+        hits = {k: v for k, v in cached.items() if v[0] is not None or not self.retry_misses}
+        misses = [unique[k] for k in unique if k not in hits]
+        self.stats.addresses += sum(1 for a in addresses if a)
+        self.stats.unique += len(unique)
+        self.stats.hits += len(hits)
+
+        results = {k: Geocode(*v) if v[0] is not None else None for k, v in hits.items()}
+        if misses and self.backend:
+            backend_start = time.perf_counter()
+            found = self.backend.geocode(misses)
+            self.stats.backend_seconds += time.perf_counter() - backend_start
+            now = time.strftime("%Y-%m-%dT%H:%M:%S")
+            rows = []
+            for k in misses:
+                g = found.get(k)
+                results[str(k)] = g
+                rows.append((str(k), *(g or (None, None, None)), self.backend.name, now))
+            self.cache.executemany("INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.cache.commit()
+            self.stats.resolved += len(found)
+            self.stats.unresolved += len(misses) - len(found)
+        else:
+            self.stats.uncached += len(misses)
+
+        self.stats.seconds += time.perf_counter() - start
+        return [results.get(str(keys[a])) if a and keys[a] else None for a in addresses]
+
+
+def default_geocoder() -> Geocoder:
+    """Cache-only, or with the backend from RENTALS_GEOCODER."""
+    spec = os.environ.get(GEOCODER_ENV)
+    return Geocoder(backend_from_spec(spec) if spec else None)
+
+
+# -- rentals -----------------------------------------------------------------
+
+def create_geocode_schema(conn: sqlite3.Connection):
+    """Add rentals.geocode_precision (NULL when the coordinates come from the spider)."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(rentals)")}
+    if "geocode_precision" not in columns:
+        conn.execute("ALTER TABLE rentals ADD COLUMN geocode_precision TEXT")
+
+
+@instrumented(records=int)
+def geocode_rentals(conn: sqlite3.Connection, geocoder: Geocoder) -> int:
+    """
+    Fill coordinates (and missing Paris arrondissements) of rentals without
+    any. Listings that gain an arrondissement move segment and stratum, so
+    their outlier flags, sketches and sample strata are refreshed as in
+    create_database.insert_data. Returns rows updated. Does not commit.
+    """
+    from create_database import paris_arrondissement, strata_of
+
+    rows = conn.execute("""
+        SELECT id, source, address, arrondissement, city, rental_type FROM rentals
+        WHERE latitude IS NULL AND address IS NOT NULL
+    """).fetchall()
+    updates = []
+    # (id, arrondissement, rental_type) of the listings that moved segment
+    flag_rows = []
+    # (source, arrondissement) strata they left and joined
+    touched = set()
+    for (rental_id, source, address, old, city, rental_type), g in zip(
+            rows, geocoder.geocode([r[2] for r in rows])):
+        if g is not None:
+            arrondissement = old or paris_arrondissement(address, g.latitude, g.longitude, city)[0]
+            updates.append((g.latitude, g.longitude, g.precision, arrondissement, rental_id))
+            if arrondissement != old:
+                flag_rows.append((rental_id, arrondissement, rental_type))
+                touched.update({(source or '', old or ''), (source or '', arrondissement or '')})
+    conn.executemany("""
+        UPDATE rentals SET latitude = ?, longitude = ?, geocode_precision = ?, arrondissement = ?
+        WHERE id = ?
+    """, updates)
+
+    if flag_rows:
+        changed = flag_outliers(conn, flag_rows)
+        touched.update(strata_of(conn, changed).values())
+    if touched:
+        rebuild_sketches(conn, touched)
+        rebuild_sample(conn, strata=touched)
+    return len(updates)
+
+
+def main(argv: list[str] = None):
+    import argparse
+    from database import connect_writer
+
+    configure()
+    parser = argparse.ArgumentParser(description="Geocode listings without coordinates")
+    sub = parser.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("run", help="Geocode rentals rows without coordinates")
+    r.add_argument("--backend", choices=BACKENDS, help="Omit to answer from the cache only")
+    r.add_argument("--source", help="Backend data: BAN file or directory, CSV file")
+    r.add_argument("--db", default="paris_rentals.db")
+    r.add_argument("--cache", default=str(CACHE_PATH))
+    r.add_argument("--retry-misses", action="store_true",
+                   help="Query the backend again for addresses it could not resolve before")
+    s = sub.add_parser("stats", help="Summarize the cache")
+    s.add_argument("--cache", default=str(CACHE_PATH))
+    args = parser.parse_args(argv)
+
+    if args.command == "stats":
+        cache = sqlite3.connect(args.cache)
+        print(f"{'backend':10s} {'precision':12s} {'addresses':>10s}")
+        for backend, precision, n in cache.execute("""
+            SELECT backend, COALESCE(precision, 'unresolved'), COUNT(*) FROM geocodes
+            GROUP BY 1, 2 ORDER BY 1, 3 DESC
+        """):
+            print(f"{backend:10s} {precision:12s} {n:10d}")
+        cache.close()
+        return
+
+    if args.backend and not args.source:
+        parser.error("--backend needs --source")
+    backend = BACKENDS[args.backend](args.source) if args.backend else None
+    geocoder = Geocoder(backend, args.cache, args.retry_misses)
+    conn = connect_writer(args.db)
+    create_geocode_schema(conn)
+    updated = geocode_rentals(conn, geocoder)
+    conn.commit()
+    conn.close()
+    geocoder.close()
+    print(geocoder.stats.report())
+    print(f"Updated {updated} listings.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Pre-aggregated, tiled heatmap of rental listings.
+
+Instead of inlining every coordinate into the page (heatmap_paris.html), this
+aggregates listings into Web-Mercator grid cells for each zoom level and
+writes one small JSON file per non-empty tile with the count and median
+price of every cell. The viewer only fetches the tiles on screen, so page
+size and render time depend on the zoom level, not on the listing count.
+
+Usage:
+    python heatmap_tiles.py --min-zoom 10 --max-zoom 16 --out heatmap_tiles
+    cd heatmap_tiles && python -m http.server   # then open http://localhost:8000/
+"""
+
+import argparse
+import json
+import math
+import statistics
+from collections import defaultdict
+from pathlib import Path
+
+from database import connect_reader
+from instrumentation import configure, instrumented
+
+
+TILE_SIZE = 256
+# Cells per tile side; 32 gives 8 px cells on screen
+CELLS_PER_TILE = 32
+
+# Tile files, relative to out_dir (and so to index.html, which fetches them)
+TILE_PATH = "tiles/{z}/{x}/{y}.json"
+
+COORD_QUERY = """
+    SELECT latitude, longitude, price_eur
+    FROM rentals
+    WHERE is_outlier = 0
+      AND latitude IS NOT NULL
+      AND longitude IS NOT NULL
+"""
+
+
+def project(lat: float, lon: float) -> tuple[float, float]:
+    """Web-Mercator projection to normalized [0, 1) x/y."""
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = (lon + 180.0) / 360.0
+    sin_lat = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return x, y
+
+
+@instrumented(records=len)
+def aggregate_cells(points: list[tuple], max_zoom: int) -> dict:
+    """Group points into cells at max_zoom: {(cx, cy): [count, [prices]]}."""
+    scale = (1 << max_zoom) * CELLS_PER_TILE
+    cells = defaultdict(lambda: [0, []])
+    for lat, lon, price in points:
+        x, y = project(lat, lon)
+        cell = cells[(int(x * scale), int(y * scale))]
+        cell[0] += 1
+        if price is not None and price > 0:
+            cell[1].append(price)
+    return cells
+
+
+def coarsen(cells: dict) -> dict:
+    """Merge 2x2 blocks of cells into the next zoom level up."""
+    parent = defaultdict(lambda: [0, []])
+    for (cx, cy), (count, prices) in cells.items():
+        cell = parent[(cx >> 1, cy >> 1)]
+        cell[0] += count
+        cell[1].extend(prices)
+    return parent
+
+
+@instrumented()
+def write_tiles(cells: dict, zoom: int, out_dir: Path) -> dict:
+    """Write one JSON file per non-empty tile; return zoom-level stats."""
+    tiles = defaultdict(list)
+    for (cx, cy), (count, prices) in cells.items():
+        median = round(statistics.median(prices)) if prices else None
+        tiles[(cx // CELLS_PER_TILE, cy // CELLS_PER_TILE)].append(
+            [cx % CELLS_PER_TILE, cy % CELLS_PER_TILE, count, median]
+        )
+
+    total_bytes = 0
+    for (tx, ty), rows in tiles.items():
+        path = out_dir / TILE_PATH.format(z=zoom, x=tx, y=ty)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = json.dumps({"cells": rows}, separators=(",", ":"))
+        path.write_text(payload, encoding="utf-8")
+        total_bytes += len(payload)
+
+    return {
+        "tiles": len(tiles),
+        "cells": len(cells),
+        "max_count": max((c[0] for c in cells.values()), default=0),
+        "bytes": total_bytes,
+    }
+
+
+VIEWER_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Paris rentals heatmap</title>
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css">
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<style>html, body, #map { height: 100%; margin: 0; }</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+fetch("index.json").then(r => r.json()).then(index => {
+  const map = L.map("map", {minZoom: index.min_zoom, maxZoom: index.max_zoom})
+    .setView(index.center, index.min_zoom + 2);
+  L.tileLayer("https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png",
+              {attribution: "&copy; OpenStreetMap contributors"}).addTo(map);
+
+  const cellPx = index.tile_size / index.cells_per_tile;
+  const Heat = L.GridLayer.extend({
+    createTile: function (coords, done) {
+      const tile = document.createElement("canvas");
+      tile.width = tile.height = index.tile_size;
+      const maxCount = index.zooms[coords.z] ? index.zooms[coords.z].max_count : 1;
+      fetch(L.Util.template(index.tile_path, coords))
+        .then(r => r.ok ? r.json() : {cells: []})
+        .then(data => {
+          const ctx = tile.getContext("2d");
+          for (const [cx, cy, count] of data.cells) {
+            const t = Math.log1p(count) / Math.log1p(maxCount);
+            ctx.fillStyle = `hsla(${(1 - t) * 240}, 90%, 50%, ${0.35 + 0.5 * t})`;
+            ctx.fillRect(cx * cellPx, cy * cellPx, cellPx, cellPx);
+          }
+          tile.cells = data.cells;
+          done(null, tile);
+        })
+        .catch(() => done(null, tile));
+      return tile;
+    }
+  });
+  const heat = new Heat({minZoom: index.min_zoom, maxNativeZoom: index.max_zoom}).addTo(map);
+
+  map.on("click", e => {
+    const z = map.getZoom();
+    const p = map.project(e.latlng, z);
+    const key = `${Math.floor(p.x / index.tile_size)}:${Math.floor(p.y / index.tile_size)}:${z}`;
+    const tile = heat._tiles[key];
+    if (!tile || !tile.el.cells) return;
+    const cx = Math.floor((p.x % index.tile_size) / cellPx);
+    const cy = Math.floor((p.y % index.tile_size) / cellPx);
+    const cell = tile.el.cells.find(c => c[0] === cx && c[1] === cy);
+    if (cell) {
+      L.popup().setLatLng(e.latlng)
+        .setContent(`${cell[2]} listing(s)` + (cell[3] !== null ? `<br>median €${cell[3]}` : ""))
+        .openOn(map);
+    }
+  });
+});
+</script>
+</body>
+</html>
+"""
+
+
+def generate_heatmap(db_path: str = "paris_rentals.db", out_dir: str = "heatmap_tiles",
+                     min_zoom: int = 10, max_zoom: int = 16) -> dict:
+    """Build the tile set and viewer; returns the index written to index.json."""
+    conn = connect_reader(db_path)
+    points = conn.execute(COORD_QUERY).fetchall()
+    conn.close()
+
+    if not points:
+        print("No listings with coordinates found.")
+        return {}
+
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+
+    lats = [p[0] for p in points]
+    lons = [p[1] for p in points]
+    index = {
+        "min_zoom": min_zoom,
+        "max_zoom": max_zoom,
+        "tile_size": TILE_SIZE,
+        "cells_per_tile": CELLS_PER_TILE,
+        "tile_path": TILE_PATH,
+        "center": [statistics.median(lats), statistics.median(lons)],
+        "listings": len(points),
+        "zooms": {},
+    }
+
+    cells = aggregate_cells(points, max_zoom)
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        stats = write_tiles(cells, zoom, out)
+        index["zooms"][zoom] = stats
+        print(f"  zoom {zoom:2d}: {stats['tiles']:5d} tiles, {stats['cells']:6d} cells, "
+              f"{stats['bytes'] / 1024:8.1f} KiB")
+        if zoom > min_zoom:
+            cells = coarsen(cells)
+
+    with open(out / "index.json", "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    (out / "index.html").write_text(VIEWER_HTML, encoding="utf-8")
+
+    print(f"Heatmap of {len(points)} listings written to {out}/")
+    return index
+
+
+def main(argv: list[str] = None):
+    configure()
+    parser = argparse.ArgumentParser(description="Tiled, pre-aggregated listing heatmap")
+    parser.add_argument("--db", default="paris_rentals.db")
+    parser.add_argument("--out", default="heatmap_tiles")
+    parser.add_argument("--min-zoom", type=int, default=10)
+    parser.add_argument("--max-zoom", type=int, default=16)
+    args = parser.parse_args(argv)
+
+    try:
+        generate_heatmap(args.db, args.out, args.min_zoom, args.max_zoom)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+
+
+if __name__ == "__main__":
+    main()
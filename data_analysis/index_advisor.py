@@ -0,0 +1,509 @@
+"""
+Query-plan audit and index advisor for the rentals table.
+
+Every workload query (the named queries of query_service.py and the bulk
+reads of the plotting / analysis scripts) is run through EXPLAIN QUERY PLAN
+and flagged when it scans the table, looks up table rows from a non-covering
+index, or sorts through a temporary B-tree. For each flagged query an index
+is derived from the query's shape:
+
+    key     = equality columns, then the GROUP BY (else ORDER BY) column or
+              CAST(column AS type) expression, then the first range column
+    covered = the other columns the query reads (when few enough)
+    WHERE   = the query's own `col IS NOT NULL` terms (partial index)
+
+Candidates are built on a scratch copy of the database and kept only if the
+whole workload gets measurably faster, net of what they add to inserting
+INGEST_ROWS rows (see advise()); the planner may choose an index that is
+slower than the scan it replaces, ANALYZE changes the plans of other queries,
+and every index slows down ingest. Timings are only meaningful on a database
+of realistic size. --apply creates the kept indexes and refreshes the planner
+statistics. `bench` builds a large synthetic rentals table and times the
+workload and inserts before and after applying the advice.
+
+Usage:
+    python index_advisor.py audit [--db paris_rentals.db] [--apply]
+    python index_advisor.py bench [--rows 1000000] [--repeat 3]
+"""
+
+import ast
+import itertools
+import random
+import re
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from database import connect_reader, connect_writer
+from instrumentation import configure, instrumented
+from query_service import QUERIES
+
+
+TABLE = "rentals"
+
+# Bulk reads defined as module constants of scripts that import pandas or
+# matplotlib; their SQL is read from the source instead of importing them
+SCRIPT_QUERIES = [
+    ("visualizations.py", "FRAME_QUERY"),
+    ("data_analysis.py", "CLEAN_QUERY"),
+    ("heatmap_tiles.py", "COORD_QUERY"),
+    ("comparables.py", "FEATURE_QUERY"),
+]
+
+# Wider covering indexes cost more on every insert than they save
+MAX_INDEX_COLUMNS = 6
+
+# A proposal has to make one of its queries this much faster, and the kept
+# set has to save this much on the workload net of insert overhead (below
+# it, differences are timing noise)
+MIN_SPEEDUP = 1.2
+MIN_SAVED_MS = 0.5
+TIMING_RUNS = 3
+
+# Rows ingested per run of the workload, to weigh index maintenance against
+# query time (about one crawl per analysis run)
+INGEST_ROWS = 10_000
+
+INDEX_PREFIX = "idx_advised_"
+
+
+@dataclass
+class WorkloadQuery:
+    name: str
+    sql: str
+    params: dict = field(default_factory=dict)
+
+
+@dataclass
+class Plan:
+    details: list
+    error: str = None
+
+    @property
+    def table_scans(self) -> int:
+        return sum(d == f"SCAN {TABLE}" for d in self.details)
+
+    @property
+    def lookups(self) -> int:
+        """Index accesses that still fetch every matching table row."""
+        return sum(d.startswith((f"SCAN {TABLE} USING INDEX", f"SEARCH {TABLE} USING INDEX"))
+                   for d in self.details)
+
+    @property
+    def temp_btrees(self) -> int:
+        return sum(d.startswith("USE TEMP B-TREE") for d in self.details)
+
+    def score(self) -> tuple:
+        """Lower is better: full scans, then temporary sorts, then row lookups."""
+        return (self.table_scans, self.temp_btrees, self.lookups)
+
+    def findings(self, grouped: bool) -> list[str]:
+        found = []
+        for d in self.details:
+            if d == f"SCAN {TABLE}":
+                found.append("full table scan")
+            elif d.startswith(f"SCAN {TABLE} USING INDEX"):
+                found.append(f"full index scan with row lookups ({d.rsplit(' ', 1)[-1]})")
+            elif d.startswith(f"SEARCH {TABLE} USING INDEX"):
+                found.append(f"row lookups ({d.split('USING INDEX ', 1)[1]})")
+            elif d.startswith("USE TEMP B-TREE"):
+                what = d[len("USE TEMP B-TREE FOR "):]
+                note = " of the grouped rows" if grouped and what == "ORDER BY" else ""
+                found.append(f"temp B-tree for {what}{note}")
+        return found
+
+
+@dataclass
+class IndexProposal:
+    columns: tuple
+    where: tuple = ()
+    queries: list = field(default_factory=list)
+    # query name -> (plan with the index, speedup)
+    results: dict = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        words = [re.sub(r"\W+", "_", column).strip("_").lower() for column in self.columns[:3]]
+        return INDEX_PREFIX + "_".join(words) + ("_partial" if self.where else "")
+
+    def sql(self) -> str:
+        where = f" WHERE {' AND '.join(f'{c} IS NOT NULL' for c in self.where)}" if self.where else ""
+        return f"CREATE INDEX IF NOT EXISTS {self.name} ON {TABLE}({', '.join(self.columns)}){where}"
+
+
+def module_constant(path: Path, name: str) -> str:
+    """String value of a top-level assignment, without importing the module."""
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == name for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise KeyError(f"{name} not found in {path}")
+
+
+def workload() -> list[WorkloadQuery]:
+    queries = [WorkloadQuery(name, spec["sql"], dict(spec["params"])) for name, spec in QUERIES.items()]
+    here = Path(__file__).resolve().parent
+    for script, constant in SCRIPT_QUERIES:
+        queries.append(WorkloadQuery(f"{Path(script).stem}.{constant}",
+                                     module_constant(here / script, constant)))
+    return queries
+
+
+_explain_ids = itertools.count()
+
+
+def explain(conn: sqlite3.Connection, query: WorkloadQuery) -> Plan:
+    # A cached EXPLAIN statement is not re-prepared when an index is dropped
+    # in the same transaction; a unique comment keeps the statement cache out
+    sql = f"EXPLAIN QUERY PLAN {query.sql}\n-- plan {next(_explain_ids)}"
+    try:
+        rows = conn.execute(sql, query.params).fetchall()
+    except sqlite3.OperationalError as e:
+        return Plan([], str(e))
+    return Plan([row[3] for row in rows])
+
+
+# -- query shape ---------------------------------------------------------------
+
+CLAUSE_END = r"(?=\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|$)"
+
+
+def _clause(sql: str, keyword: str) -> str:
+    match = re.search(rf"\b{keyword}\b(.*?){CLAUSE_END}", sql, re.S | re.I)
+    return match.group(1) if match else ""
+
+
+def query_shape(sql: str, table_columns: set) -> dict:
+    """Columns by role in a single-table query; OR-guarded terms only count as read."""
+    sql = " ".join(sql.split())
+    # The outer query only: scalar subqueries have their own plan entries
+    outer = re.sub(r"\(SELECT .*?\)", "", sql, flags=re.I)
+    where = _clause(outer, "WHERE")
+    terms = [t.strip() for t in re.split(r"\bAND\b", where, flags=re.I) if t.strip()]
+    plain = [t for t in terms if not re.search(r"\bOR\b", t, re.I)]
+
+    def columns(pattern: str, text_terms: list) -> list:
+        found = []
+        for term in text_terms:
+            match = re.fullmatch(pattern, term.strip("() "), re.I)
+            if match and match.group(1) in table_columns and match.group(1) not in found:
+                found.append(match.group(1))
+        return found
+
+    group = _clause(outer, "GROUP BY").strip()
+    order = re.sub(r"\s+(ASC|DESC)$", "", _clause(outer, "ORDER BY").strip(), flags=re.I)
+    return {
+        "equal": columns(r"(\w+)\s*=\s*[^=]+", plain),
+        "not_null": columns(r"(\w+)\s+IS NOT NULL", plain),
+        "range": columns(r"(\w+)\s*(?:>|<|>=|<=|BETWEEN)\s*.+", plain),
+        "group": group if group in table_columns else None,
+        "order": order if order in table_columns or sortable_expression(order, table_columns) else None,
+        "read": [c for c in dict.fromkeys(re.findall(r"\w+", outer)) if c in table_columns],
+    }
+
+
+def sortable_expression(expression: str, table_columns: set) -> bool:
+    """CAST(col AS type): SQLite can index the expression and walk it in order."""
+    match = re.fullmatch(r"CAST\((\w+) AS \w+\)", expression, re.I)
+    return bool(match) and match.group(1) in table_columns
+
+
+def propose(shape: dict) -> IndexProposal:
+    key = list(shape["equal"])
+    for column in (shape["group"] or shape["order"], *(shape["range"] or shape["not_null"])[:1]):
+        if column and column not in key:
+            key.append(column)
+    covered = key + [c for c in shape["read"] if c not in key]
+    columns = covered if len(covered) <= MAX_INDEX_COLUMNS else key
+    if not columns:
+        return None
+    return IndexProposal(tuple(columns), tuple(shape["not_null"]))
+
+
+# -- advisor -------------------------------------------------------------------
+
+def existing_keys(conn: sqlite3.Connection) -> list[tuple]:
+    """Key columns of the table's indexes (expressions come back as None)."""
+    keys = []
+    for row in conn.execute(f"PRAGMA index_list({TABLE})"):
+        info = conn.execute(f"PRAGMA index_info({row[1]})").fetchall()
+        keys.append(tuple(col[2] for col in sorted(info)))
+    return keys
+
+
+def best_ms(conn: sqlite3.Connection, query: WorkloadQuery, runs: int = TIMING_RUNS) -> float:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        conn.execute(query.sql, query.params).fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return min(samples)
+
+
+def uses(plan: Plan, proposal: IndexProposal) -> bool:
+    return any(f"INDEX {proposal.name} " in f"{d} " for d in plan.details)
+
+
+def workload_ms(conn: sqlite3.Connection, queries: list) -> dict:
+    """{query name: best time} for every query that runs."""
+    return {query.name: best_ms(conn, query) for query in queries}
+
+
+def insert_ms(conn: sqlite3.Connection, rows: int = INGEST_ROWS, runs: int = TIMING_RUNS) -> float:
+    """Best time to insert and commit `rows` synthetic listings, deleted again after each run."""
+    batch = list(synthetic_rows(rows, 0, offset=1 << 44))
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        conn.executemany(INSERT_SQL, batch)
+        conn.commit()
+        samples.append((time.perf_counter() - start) * 1000)
+        conn.executemany(f"DELETE FROM {TABLE} WHERE id = ?", [(row[0],) for row in batch])
+        conn.commit()
+    return min(samples)
+
+
+@instrumented()
+def advise(conn: sqlite3.Connection, queries: list = None,
+           ingest_rows: int = INGEST_ROWS) -> tuple[dict, list]:
+    """
+    ({query name: (plan, findings, grouped)}, kept proposals). Candidates are
+    built on a scratch copy of `conn`'s database, which is left unchanged.
+
+    With every candidate present and ANALYZE run (as apply() leaves them),
+    every workload query is re-timed, and so is inserting `ingest_rows`
+    rows. The set is kept when the workload saves MIN_SAVED_MS net of the
+    extra insert time, and each candidate makes one of the queries whose
+    plans pick it MIN_SPEEDUP faster and pays for its share of the insert
+    overhead (by column count). Otherwise the candidate worth least is
+    dropped and the whole workload re-timed, since the planner then chooses
+    differently.
+    """
+    queries = queries or workload()
+    table_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({TABLE})")}
+    existing = existing_keys(conn)
+
+    audit = {}
+    candidates = {}
+    runnable = []
+    for query in queries:
+        plan = explain(conn, query)
+        shape = query_shape(query.sql, table_columns)
+        grouped = bool(shape["group"] or re.search(r"\bGROUP BY\b", query.sql, re.I))
+        audit[query.name] = (plan, plan.findings(grouped), grouped)
+        if plan.error:
+            continue
+        runnable.append(query)
+        if plan.score() == (0, 0, 0):
+            continue
+        proposal = propose(shape)
+        if proposal is not None and not any(k[:len(proposal.columns)] == proposal.columns
+                                            for k in existing):
+            candidates.setdefault(proposal.sql(), proposal)
+    if not candidates:
+        return audit, []
+
+    # Timed inserts have to commit to cost what ingest pays for the indexes
+    scratch_dir = tempfile.mkdtemp(prefix="index_advisor_")
+    scratch = connect_writer(str(Path(scratch_dir) / "scratch.db"))
+    conn.backup(scratch)
+    kept = list(candidates.values())
+    try:
+        before = workload_ms(scratch, runnable)
+        insert_before = insert_ms(scratch, ingest_rows)
+        apply(scratch, kept)
+        while kept:
+            plans = {query.name: explain(scratch, query) for query in runnable}
+            after = workload_ms(scratch, runnable)
+            overhead = insert_ms(scratch, ingest_rows) - insert_before
+            net = sum(before.values()) - sum(after.values()) - overhead
+            width = sum(len(p.columns) for p in kept)
+
+            verdicts = []
+            for proposal in kept:
+                proposal.queries = [q for q in runnable if uses(plans[q.name], proposal)]
+                proposal.results = {q.name: (plans[q.name], before[q.name] / after[q.name])
+                                    for q in proposal.queries}
+                worth = (sum(before[q.name] - after[q.name] for q in proposal.queries)
+                         - overhead * len(proposal.columns) / width)
+                best = max((speedup for _, speedup in proposal.results.values()), default=0)
+                verdicts.append((best >= MIN_SPEEDUP and worth > 0, worth, proposal))
+            if net >= MIN_SAVED_MS and all(ok for ok, _, _ in verdicts):
+                break
+            _, worst = min(((worth, proposal) for ok, worth, proposal in verdicts
+                            if not ok or net < MIN_SAVED_MS), key=lambda item: item[0])
+            scratch.execute(f"DROP INDEX {worst.name}")
+            scratch.commit()
+            kept.remove(worst)
+    finally:
+        scratch.close()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return audit, kept
+
+
+def apply(conn: sqlite3.Connection, proposals: list):
+    if not proposals:
+        return
+    for proposal in proposals:
+        conn.execute(proposal.sql())
+    # Planner statistics, so the new indexes are weighed on real selectivity
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def print_report(audit: dict, proposals: list):
+    print(f"{'query':42s} plan")
+    for name, (plan, findings, _) in audit.items():
+        if plan.error:
+            print(f"{name:42s} not run: {plan.error}")
+            continue
+        print(f"{name:42s} {'; '.join(findings) or 'ok'}")
+
+    if not proposals:
+        print("\nNo index would make a workload query faster.")
+        return
+    print(f"\n{len(proposals)} proposed index(es):")
+    for proposal in proposals:
+        print(f"\n{proposal.sql()};")
+        for name, (plan, speedup) in proposal.results.items():
+            _, before, grouped = audit[name]
+            now = plan.findings(grouped)
+            print(f"  {name} ({speedup:.1f}x): {'; '.join(before) or 'ok'}  ->  {'; '.join(now) or 'ok'}")
+
+
+# -- benchmark -----------------------------------------------------------------
+
+ARRONDISSEMENTS = [f"{n:02d}" for n in range(1, 21)]
+RENTAL_TYPES = ["Logement en colocation", "Logement entier", "Logement en résidence",
+                "Logement chez l'habitant"]
+
+
+def synthetic_rows(n: int, seed: int, offset: int = 0):
+    """rentals rows with the value mix of the merged crawls (35% in Paris, 6% lacarte)."""
+    rng = random.Random(seed)
+    for i in range(offset, offset + n):
+        lacarte = rng.random() < 0.06
+        paris = lacarte or rng.random() < 0.35
+        size = None if rng.random() < 0.05 else rng.randint(9, 120)
+        price = None if rng.random() < 0.02 else round(rng.uniform(300, 2500))
+        lat = rng.uniform(48.82, 48.90) if lacarte or rng.random() < 0.3 else None
+        yield (
+            f"{i:012x}", "lacartedescolocs" if lacarte else "studapart",
+            f"https://example.org/{i}", f"Logement {i}", price,
+            rng.choice(ARRONDISSEMENTS) if paris else None,
+            size, round(price / size, 2) if price and size else None,
+            None if rng.random() < 0.3 else rng.randint(1, 5), rng.choice(RENTAL_TYPES),
+            None if rng.random() < 0.2 else "Meublé",
+            lat, None if lat is None else rng.uniform(2.25, 2.42), int(rng.random() < 0.01),
+        )
+
+
+INSERT_SQL = f"""
+    INSERT INTO {TABLE} (id, source, url, title, price_eur, arrondissement, size_m2,
+                         price_per_m2, rooms, rental_type, furnished, latitude, longitude,
+                         is_outlier)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def time_query(conn: sqlite3.Connection, query: WorkloadQuery, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(query.sql, query.params).fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def time_insert(conn: sqlite3.Connection, n: int, seed: int, offset: int) -> float:
+    start = time.perf_counter()
+    conn.executemany(INSERT_SQL, synthetic_rows(n, seed, offset))
+    conn.commit()
+    return (time.perf_counter() - start) * 1000
+
+
+def db_size(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0]
+
+
+def bench(rows: int, repeat: int, seed: int, db_path: str):
+    from create_database import create_tables
+
+    path = Path(db_path)
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+    conn = connect_writer(str(path))
+    create_tables(conn)
+    start = time.perf_counter()
+    conn.executemany(INSERT_SQL, synthetic_rows(rows, seed))
+    conn.execute("ANALYZE")
+    conn.commit()
+    print(f"Synthetic {TABLE}: {rows:,} rows in {time.perf_counter() - start:.1f} s")
+
+    queries = workload()
+    before = {q.name: time_query(conn, q, repeat) for q in queries}
+    insert_before = time_insert(conn, 10_000, seed + 1, rows)
+    size_before = db_size(conn)
+
+    audit, proposals = advise(conn, queries)
+    start = time.perf_counter()
+    apply(conn, proposals)
+    build = time.perf_counter() - start
+    print_report(audit, proposals)
+
+    after = {q.name: time_query(conn, q, repeat) for q in queries}
+    insert_after = time_insert(conn, 10_000, seed + 2, rows + 10_000)
+    size_after = db_size(conn)
+    conn.close()
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+    print(f"\n{'query':42s} {'before ms':>10s} {'after ms':>10s} {'speedup':>8s}")
+    for name in before:
+        print(f"{name:42s} {before[name]:10.1f} {after[name]:10.1f} {before[name] / after[name]:7.1f}x")
+    total_before, total_after = sum(before.values()), sum(after.values())
+    print(f"{'workload':42s} {total_before:10.1f} {total_after:10.1f} {total_before / total_after:7.1f}x")
+    print(f"\nIndexes built in {build:.1f} s; database {size_before / 1e6:.0f} MB -> "
+          f"{size_after / 1e6:.0f} MB; inserting 10,000 rows {insert_before:.0f} ms -> {insert_after:.0f} ms")
+
+
+def main(argv: list[str] = None):
+    import argparse
+
+    configure()
+    parser = argparse.ArgumentParser(description="Query-plan audit and index advisor")
+    sub = parser.add_subparsers(dest="command", required=True)
+    a = sub.add_parser("audit", help="Explain the workload queries and propose indexes")
+    a.add_argument("--db", default="paris_rentals.db")
+    a.add_argument("--apply", action="store_true", help="Create the proposed indexes")
+    b = sub.add_parser("bench", help="Workload latency before / after on a synthetic table")
+    b.add_argument("--rows", type=int, default=1_000_000)
+    b.add_argument("--repeat", type=int, default=3)
+    b.add_argument("--seed", type=int, default=42)
+    b.add_argument("--db", default="bench_index_advisor.db", help="Scratch database (deleted)")
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        bench(args.rows, args.repeat, args.seed, args.db)
+        return
+
+    try:
+        connect_reader(args.db).close()
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        exit(1)
+    conn = connect_writer(args.db) if args.apply else connect_reader(args.db)
+    audit, proposals = advise(conn)
+    print_report(audit, proposals)
+    if args.apply and proposals:
+        apply(conn, proposals)
+        print(f"\nCreated {len(proposals)} index(es) in {args.db}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Opt-in stage instrumentation shared by the analysis scripts and the spiders.
+
+Disabled by default, where stage() costs one attribute lookup. When enabled,
+every stage records wall time, CPU time, tracemalloc peak and a record count,
+optionally under cProfile, and a consolidated per-stage report is printed and
+written to JSON at exit.
+
+Enable with the RENTALS_PROFILE environment variable or a --profile flag:
+    RENTALS_PROFILE=1          timing, CPU time and tracemalloc peaks
+    RENTALS_PROFILE=cprofile   same, plus one .prof file per top-level stage
+    RENTALS_PROFILE_DIR=...    report directory (default: profiles)
+
+Usage:
+    from instrumentation import configure, stage
+
+    configure()                          # reads the env var and strips --profile
+    with stage("insert_data") as s:
+        insert_data(conn, data)
+        s.records = len(data)
+
+    python create_database.py --profile=cprofile
+    scrapy crawl studapart_spider -s RENTALS_PROFILE=1
+"""
+
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+
+ENV_VAR = "RENTALS_PROFILE"
+DIR_ENV_VAR = "RENTALS_PROFILE_DIR"
+DEFAULT_DIR = "profiles"
+
+
+class _State:
+    enabled = False
+    cprofile = False
+    report_dir = DEFAULT_DIR
+    registered = False
+    profiling = False
+
+
+_state = _State()
+# Stages open in the current thread or asyncio task, innermost last; stages
+# run concurrently in threads and the async spider middleware
+_open_stages = ContextVar("open_stages", default=())
+# Every running stage, in start order (tracemalloc peaks are process-wide)
+_running = {}
+_lock = threading.Lock()
+_totals = {}
+_profiles = {}
+
+
+def parse_mode(value: str) -> tuple[bool, bool]:
+    """(enabled, cprofile) for an env var or flag value."""
+    value = (value or "").strip().lower()
+    if value in ("", "0", "false", "no", "off"):
+        return False, False
+    return True, value in ("cprofile", "profile", "2")
+
+
+def enable(cprofile: bool = False, report_dir: str = None):
+    """Switch instrumentation on for the rest of the process."""
+    _state.enabled = True
+    _state.cprofile = _state.cprofile or cprofile
+    _state.report_dir = report_dir or os.environ.get(DIR_ENV_VAR, DEFAULT_DIR)
+    # Imported here so that disabled instrumentation adds nothing to start-up time
+    import tracemalloc
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if not _state.registered:
+        atexit.register(write_report)
+        _state.registered = True
+
+
+def configure(argv: list[str] = None) -> bool:
+    """
+    Enable from RENTALS_PROFILE or a --profile[=cprofile] argument, which is
+    removed from argv (sys.argv by default) so argparse never sees it.
+    Returns whether instrumentation is on.
+    """
+    argv = sys.argv if argv is None else argv
+    enabled, cprofile = parse_mode(os.environ.get(ENV_VAR))
+    for arg in list(argv[1:]):
+        if arg == "--profile" or arg.startswith("--profile="):
+            flag_enabled, flag_cprofile = parse_mode(arg.partition("=")[2] or "1")
+            enabled, cprofile = enabled or flag_enabled, cprofile or flag_cprofile
+            argv.remove(arg)
+    if enabled:
+        enable(cprofile)
+    return _state.enabled
+
+
+def is_enabled() -> bool:
+    return _state.enabled
+
+
+class Stage:
+    """One timed run of a named stage; set or add to .records while it runs."""
+
+    __slots__ = ("name", "records", "peak", "_wall", "_cpu", "_profile")
+
+    def __init__(self, name: str, records: int = None):
+        self.name = name
+        self.records = records
+        self.peak = 0
+        self._profile = None
+
+    def start(self) -> "Stage":
+        if not _state.enabled:
+            return self
+        import tracemalloc
+        with _lock:
+            # Starting a stage resets the tracemalloc peak; fold it into the running ones first
+            current, peak = tracemalloc.get_traced_memory()
+            for other in _running:
+                other.peak = max(other.peak, peak)
+            tracemalloc.reset_peak()
+            self.peak = current
+            # Only one profiler can be active, so only the outermost stage of
+            # a thread or task is profiled, and only if no other one is
+            if _state.cprofile and not _open_stages.get() and not _state.profiling:
+                import cProfile
+                self._profile = cProfile.Profile()
+                self._profile.enable()
+                _state.profiling = True
+            _running[self] = None
+        _open_stages.set(_open_stages.get() + (self,))
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def stop(self):
+        if not _state.enabled or self not in _running:
+            return
+        import tracemalloc
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        # Stopped from another context (e.g. a Scrapy signal), it stays in the
+        # starting context's stack, where only its presence is ever checked
+        stack = _open_stages.get()
+        if self in stack:
+            _open_stages.set(tuple(s for s in stack if s is not self))
+        with _lock:
+            if self._profile:
+                self._profile.disable()
+                _profiles.setdefault(self.name, []).append(self._profile)
+                _state.profiling = False
+            peak = tracemalloc.get_traced_memory()[1]
+            for s in _running:
+                s.peak = max(s.peak, peak)
+            del _running[self]
+            self._record(wall, cpu)
+
+    def _record(self, wall: float, cpu: float):
+        total = _totals.setdefault(self.name, {
+            "calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_mb": 0.0, "records": None,
+        })
+        total["calls"] += 1
+        total["wall_s"] += wall
+        total["cpu_s"] += cpu
+        total["peak_mb"] = max(total["peak_mb"], self.peak / 1e6)
+        if self.records is not None:
+            total["records"] = (total["records"] or 0) + self.records
+
+
+@contextmanager
+def stage(name: str, records: int = None):
+    """Time a block as the stage `name` (a no-op unless enabled)."""
+    s = Stage(name, records)
+    if not _state.enabled:
+        yield s
+        return
+    s.start()
+    try:
+        yield s
+    finally:
+        s.stop()
+
+
+def instrumented(name: str = None, records=None):
+    """
+    Decorator form of stage(). records, if given, maps the return value to
+    a record count (e.g. len).
+    """
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return func(*args, **kwargs)
+            with stage(label) as s:
+                result = func(*args, **kwargs)
+                if records is not None:
+                    s.records = records(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def report() -> dict:
+    """Per-stage totals gathered so far."""
+    stages = {}
+    for name, total in _totals.items():
+        entry = {key: round(value, 4) if isinstance(value, float) else value
+                 for key, value in total.items()}
+        if total["records"] and total["wall_s"] > 0:
+            entry["records_per_s"] = round(total["records"] / total["wall_s"], 1)
+        stages[name] = entry
+    return stages
+
+
+def write_report(path: str = None) -> str:
+    """Print the per-stage table and write it (and any profiles) to disk."""
+    from datetime import datetime
+
+    for s in reversed(list(_running)):
+        s.stop()
+    stages = report()
+    if not stages:
+        return None
+
+    script = Path(sys.argv[0]).stem or "python"
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    out = Path(_state.report_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    path = Path(path) if path else out / f"{script}_{stamp}_{os.getpid()}.json"
+
+    import pstats
+    profile_files = {}
+    for name, profiles in _profiles.items():
+        prof_path = out / f"{script}_{stamp}_{os.getpid()}_{name.replace('/', '_')}.prof"
+        profiles[0].create_stats()
+        stats = pstats.Stats(profiles[0])
+        for extra in profiles[1:]:
+            extra.create_stats()
+            stats.add(extra)
+        stats.dump_stats(prof_path)
+        profile_files[name] = str(prof_path)
+
+    payload = {
+        "script": script,
+        "argv": sys.argv[1:],
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "stages": stages,
+        "profiles": profile_files,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+
+    print(f"\n{'stage':32s} {'calls':>6s} {'wall s':>9s} {'cpu s':>9s} {'peak MB':>9s} {'records':>10s}",
+          file=sys.stderr)
+    for name, s in stages.items():
+        records = "" if s["records"] is None else str(s["records"])
+        print(f"{name:32s} {s['calls']:6d} {s['wall_s']:9.3f} {s['cpu_s']:9.3f} "
+              f"{s['peak_mb']:9.1f} {records:>10s}", file=sys.stderr)
+    print(f"Stage report written to {path}", file=sys.stderr)
+    return str(path)
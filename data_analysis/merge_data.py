@@ -1,18 +1,42 @@
 """
 Merge JSON data from multiple rental scrapers into a single dataset.
+
+Inputs are the spiders' JSON arrays or shard feeds (shard_feed.py, written
+by `-O shards://...:jsonl` crawls); with --follow, shards are merged as the
+crawls publish them. --shards also writes the merged records as a feed, shard
+by shard, for create_database.py --follow. Each merge is also kept as the
+partition of its date in the snapshot store (snapshot_store.py).
+
+Usage:
+    python merge_data.py
+    python merge_data.py --input ../output_all=studapart --follow --shards merged_rentals
 """
 
 import json
 import hashlib
 from pathlib import Path
+from typing import Iterator
 
+from change_feed import CHANGES_DIR, write_change_feed
+from instrumentation import configure, instrumented
+from shard_feed import ShardWriter, is_shard_feed, iter_records
+from snapshot_store import SNAPSHOT_DIR, SnapshotStore
 
+
+@instrumented(records=len)
 def load_json(path: str) -> list:
     """Load JSON file and return list of records."""
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
+def load_records(path: str, follow: bool = False):
+    """Records of a JSON array file or of a shard feed directory (streamed)."""
+    if is_shard_feed(path):
+        return iter_records(path, follow)
+    return load_json(path)
+
+
 def generate_id(record: dict) -> str:
     """Generate a unique ID based on URL hash."""
     url = record.get("AdUrl", "")
@@ -35,26 +59,21 @@ def normalize_record(record: dict, source: str) -> dict:
         "furnished": record.get("Furnished"),
         "latitude": record.get("Lat"),
         "longitude": record.get("Lon"),
+        "amenities": record.get("Amenities"),
+        "roommates": record.get("Roommates"),
+        "bedrooms": record.get("Bedrooms"),
+        "bathrooms": record.get("Bathrooms"),
     }
     return normalized
 
 
-def merge_datasets(files: list[tuple[str, str]]) -> list[dict]:
-    """
-    Merge multiple JSON files into one dataset.
-    
-    Args:
-        files: List of tuples (file_path, source_name)
-    
-    Returns:
-        List of normalized and merged records
-    """
-    merged = []
+def iter_merged(files: list[tuple[str, str]], follow: bool = False) -> Iterator[dict]:
+    """Normalized records of all files, first occurrence of each ID only."""
     seen_ids = set()
     
     for file_path, source in files:
         print(f"Loading {file_path}...")
-        data = load_json(file_path)
+        data = load_records(file_path, follow)
         
         for record in data:
             normalized = normalize_record(record, source)
@@ -62,12 +81,37 @@ def merge_datasets(files: list[tuple[str, str]]) -> list[dict]:
             # Skip duplicates based on ID (URL hash)
             if normalized["id"] not in seen_ids:
                 seen_ids.add(normalized["id"])
-                merged.append(normalized)
+                yield normalized
+
+
+@instrumented(records=len)
+def merge_datasets(files: list[tuple[str, str]], follow: bool = False,
+                   shards: str = None) -> list[dict]:
+    """
+    Merge multiple JSON files (or shard feeds) into one dataset.
+    
+    Args:
+        files: List of tuples (file_path, source_name)
+        follow: Wait for shard feeds that are still being written
+        shards: Also stream the merged records to this shard feed directory
+    
+    Returns:
+        List of normalized and merged records
+    """
+    if shards is None:
+        merged = list(iter_merged(files, follow))
+    else:
+        merged = []
+        with ShardWriter(shards) as writer:
+            for record in iter_merged(files, follow):
+                writer.write_record(record)
+                merged.append(record)
     
     print(f"Total records after merge: {len(merged)}")
     return merged
 
 
+@instrumented()
 def save_merged(data: list[dict], output_path: str):
     """Save merged data to JSON file."""
     with open(output_path, "w", encoding="utf-8") as f:
@@ -75,12 +119,32 @@ def save_merged(data: list[dict], output_path: str):
     print(f"Saved to {output_path}")
 
 
-if __name__ == "__main__":
+def main(argv: list[str] = None):
+    import argparse
+
+    configure()
+    parser = argparse.ArgumentParser(description="Merge the spiders' JSON outputs")
+    parser.add_argument("--output", default="merged_rentals.json")
+    parser.add_argument("--changes-dir", default=CHANGES_DIR,
+                        help="Where the per-crawl change feed is written (change_feed.py)")
+    parser.add_argument("--no-changes", action="store_true", help="Skip the change feed")
+    parser.add_argument("--snapshots", default=SNAPSHOT_DIR,
+                        help="Snapshot store receiving today's partition (snapshot_store.py)")
+    parser.add_argument("--no-snapshot", action="store_true", help="Do not keep a snapshot")
+    parser.add_argument("--input", action="append", metavar="PATH=SOURCE",
+                        help="JSON file or shard feed and its source (repeatable)")
+    parser.add_argument("--follow", action="store_true",
+                        help="Wait for shard feeds still being written by a crawl")
+    parser.add_argument("--shards", help="Also write the merged records as a shard feed here")
+    args = parser.parse_args(argv)
+
     # Define input files and their sources
     input_files = [
         ("../output_all.json", "studapart"),
         ("../data_paris.json", "lacartedescolocs"),
     ]
+    if args.input:
+        input_files = [tuple(spec.rsplit("=", 1)) for spec in args.input]
     
     # Filter existing files
     existing_files = [(f, s) for f, s in input_files if Path(f).exists()]
@@ -89,5 +153,13 @@ if __name__ == "__main__":
         print("No input files found. Please run the spiders first.")
         print("Expected files: output_studapart.json, output_lacartedescolocs.json")
     else:
-        merged_data = merge_datasets(existing_files)
-        save_merged(merged_data, "merged_rentals.json")
+        merged_data = merge_datasets(existing_files, args.follow, args.shards)
+        save_merged(merged_data, args.output)
+        if not args.no_changes:
+            write_change_feed(merged_data, args.changes_dir)
+        if not args.no_snapshot:
+            SnapshotStore(args.snapshots).write(merged_data)
+
+
+if __name__ == "__main__":
+    main()
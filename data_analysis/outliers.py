@@ -0,0 +1,274 @@
+"""
+Data-driven outlier flagging for the rentals table.
+
+Replaces the hard-coded cleaning thresholds (price < 5000, size < 500,
+price_per_m2 < 100, ...) with robust per-segment bounds. For each
+(arrondissement, rental_type) segment, bounds are median ± MAD_THRESHOLD
+robust standard deviations on the log scale. The result is stored in the
+indexed rentals.is_outlier column, so plots and queries simply filter on
+`is_outlier = 0`. Room counts are small integers whose MAD is usually 0, so
+they keep an explicit bound instead (MAX_ROOMS).
+
+Medians and MADs are computed inside SQLite, one segment at a time. At
+ingest only the segments that received rows are considered, and their bounds
+are recomputed once they have grown by REFRESH_GROWTH since the last
+computation; until then new rows are flagged against the stored bounds.
+Only the new rows and the rows of refreshed segments are re-flagged.
+
+Usage:
+    python outliers.py            # recompute every bound and flag, print the bounds
+"""
+
+import math
+import sqlite3
+from collections import Counter
+
+from instrumentation import configure, instrumented
+
+
+# Modified z-score cut-off (Iglewicz & Hoaglin)
+MAD_THRESHOLD = 3.5
+
+# Scale factor turning a MAD into a normal-consistent standard deviation
+MAD_TO_SIGMA = 1.4826
+
+# Segments smaller than this fall back to the rental-type-wide, then global, bounds
+SEGMENT_MIN_SIZE = 8
+
+# Lower bound on the log-scale spread, so near-constant segments (MAD = 0)
+# do not flag every slightly different price
+MIN_LOG_SIGMA = 0.05
+
+# Rows a segment may receive, relative to the values its bounds were computed
+# from, before they are recomputed (robust bounds move little as a segment grows)
+REFRESH_GROWTH = 0.5
+
+METRICS = ("price_eur", "size_m2", "price_per_m2")
+
+# Listings with this many rooms or more are outliers (rooms < 10 before)
+MAX_ROOMS = 10
+
+GLOBAL = ('*', '*')
+
+# Median and MAD of ln(x) for the positive values of one metric in one scope.
+# SQLite has no portable ln(), so the MAD ranks y = max(x²/M², M²/x²), where
+# M² = a·b is the product of the middle values: ln y = 2·|ln x - median|.
+# Returns the value count and the middle values of x (a, b) and of y.
+MEDIAN_MAD_SQL = """
+    WITH v AS MATERIALIZED (SELECT {metric} AS x FROM rentals WHERE {scope} AND {metric} > 0),
+    c AS (SELECT COUNT(*) AS n FROM v),
+    mid AS (SELECT (SELECT n FROM c) AS n, MIN(x) AS a, MAX(x) AS b FROM (
+        SELECT x FROM v ORDER BY x
+        LIMIT 2 - (SELECT n FROM c) % 2 OFFSET ((SELECT n FROM c) - 1) / 2)),
+    d AS (SELECT MAX(x * x / (a * b), (a * b) / (x * x)) AS y FROM v, mid)
+    SELECT mid.n, mid.a, mid.b, MIN(y), MAX(y) FROM mid, (
+        SELECT y FROM d ORDER BY y
+        LIMIT 2 - (SELECT n FROM c) % 2 OFFSET ((SELECT n FROM c) - 1) / 2)
+"""
+
+
+def create_outlier_schema(conn: sqlite3.Connection):
+    """Add rentals.is_outlier, the segment indexes and the outlier_bounds table."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(rentals)")}
+    if "is_outlier" not in columns:
+        conn.execute("ALTER TABLE rentals ADD COLUMN is_outlier INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_is_outlier ON rentals(is_outlier)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_segment ON rentals(arrondissement, rental_type)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS outlier_bounds (
+            arrondissement TEXT NOT NULL,
+            rental_type TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            lower REAL NOT NULL,
+            upper REAL NOT NULL,
+            added INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (arrondissement, rental_type, metric)
+        )
+    """)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(outlier_bounds)")}
+    if "added" not in columns:
+        conn.execute("ALTER TABLE outlier_bounds ADD COLUMN added INTEGER NOT NULL DEFAULT 0")
+
+
+def key_scope(arrondissement: str, rental_type: str) -> tuple[str, list]:
+    """WHERE clause selecting the rows of a bounds key ('' is NULL, '*' any)."""
+    if (arrondissement, rental_type) == GLOBAL:
+        return "1 = 1", []
+    if arrondissement == '*':
+        return "rentals.rental_type IS ?", [rental_type or None]
+    return "rentals.arrondissement IS ? AND rentals.rental_type IS ?", [arrondissement or None, rental_type or None]
+
+
+def segment_bounds(conn: sqlite3.Connection, key: tuple, metric: str):
+    """(n, lower, upper) of one key and metric, or None without values."""
+    scope, params = key_scope(*key)
+    n, a, b, y_low, y_high = conn.execute(
+        MEDIAN_MAD_SQL.format(metric=metric, scope=scope), params
+    ).fetchone()
+    if not n:
+        return None
+    median = (math.log(a) + math.log(b)) / 2
+    mad = (math.log(y_low) + math.log(y_high)) / 4
+    sigma = max(mad * MAD_TO_SIGMA, MIN_LOG_SIGMA)
+    return n, math.exp(median - MAD_THRESHOLD * sigma), math.exp(median + MAD_THRESHOLD * sigma)
+
+
+def refresh_bounds(conn: sqlite3.Connection, keys) -> None:
+    """Recompute the stored bounds of the given keys."""
+    for key in keys:
+        conn.execute("DELETE FROM outlier_bounds WHERE arrondissement = ? AND rental_type = ?", key)
+        for metric in METRICS:
+            bounds = segment_bounds(conn, key, metric)
+            if bounds and (bounds[0] >= SEGMENT_MIN_SIZE or key == GLOBAL):
+                conn.execute(
+                    "INSERT INTO outlier_bounds (arrondissement, rental_type, metric, n, lower, upper) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", (*key, metric, *bounds))
+
+
+def stale_keys(conn: sqlite3.Connection, incoming: Counter) -> set:
+    """
+    Keys whose bounds must be recomputed for `incoming` rows per key: those
+    without bounds or grown by REFRESH_GROWTH. The others count the rows.
+    """
+    stale = set()
+    for key, count in incoming.items():
+        row = conn.execute(
+            "SELECT MAX(n), MAX(added) FROM outlier_bounds WHERE arrondissement = ? AND rental_type = ?",
+            key).fetchone()
+        if row[0] is None or row[1] + count >= REFRESH_GROWTH * row[0]:
+            stale.add(key)
+        else:
+            conn.execute("UPDATE outlier_bounds SET added = added + ? "
+                         "WHERE arrondissement = ? AND rental_type = ?", (count, *key))
+    return stale
+
+
+def load_effective_bounds(conn: sqlite3.Connection, segments) -> None:
+    """
+    temp.effective_bounds: per (arrondissement, rental_type) segment, the
+    bounds of every metric after the ('*', type) and global fallbacks.
+    """
+    conn.execute("DROP TABLE IF EXISTS temp.effective_bounds")
+    conn.execute(f"""
+        CREATE TEMP TABLE effective_bounds (
+            arrondissement TEXT NOT NULL,
+            rental_type TEXT NOT NULL,
+            {', '.join(f'{m}_lower REAL, {m}_upper REAL' for m in METRICS)},
+            PRIMARY KEY (arrondissement, rental_type)
+        )
+    """)
+
+    def lookup(metric, column):
+        keys = [("s.a", "s.t"), ("'*'", "s.t"), ("'*'", "'*'")]
+        return "COALESCE(" + ", ".join(
+            f"(SELECT {column} FROM outlier_bounds WHERE arrondissement = {a} "
+            f"AND rental_type = {t} AND metric = '{metric}')" for a, t in keys) + ")"
+
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS flag_segments (a TEXT, t TEXT)")
+    conn.execute("DELETE FROM temp.flag_segments")
+    conn.executemany("INSERT INTO temp.flag_segments VALUES (?, ?)", segments)
+    conn.execute(f"""
+        INSERT INTO temp.effective_bounds
+        SELECT s.a, s.t, {', '.join(f"{lookup(m, 'lower')}, {lookup(m, 'upper')}" for m in METRICS)}
+        FROM (SELECT DISTINCT a, t FROM temp.flag_segments) s
+    """)
+
+
+# A row is an outlier if its price is missing or not positive, if it has
+# MAX_ROOMS rooms or more, or if any known metric falls outside its segment's
+# effective bounds
+FLAG_EXPR = ("CASE WHEN rentals.price_eur IS NULL OR rentals.price_eur <= 0 THEN 1 "
+             f"WHEN rentals.rooms >= {MAX_ROOMS} THEN 1 ") + " ".join(
+    f"WHEN rentals.{m} NOT BETWEEN e.{m}_lower AND e.{m}_upper THEN 1" for m in METRICS
+) + " ELSE 0 END"
+
+FLAG_SQL = f"""
+    UPDATE rentals SET is_outlier = {FLAG_EXPR}
+    FROM temp.effective_bounds e
+    WHERE e.arrondissement = COALESCE(rentals.arrondissement, '')
+      AND e.rental_type = COALESCE(rentals.rental_type, '')
+      AND rentals.is_outlier IS NOT {FLAG_EXPR}
+      AND {{scope}}
+    RETURNING rentals.id
+"""
+
+
+@instrumented()
+def flag_outliers(conn: sqlite3.Connection, rows=None) -> set:
+    """
+    Update bounds and is_outlier for new or changed listings, given as
+    (id, arrondissement, rental_type) rows; rows=None recomputes every bound
+    and flag. Returns the ids whose flag changed. Does not commit.
+    """
+    create_outlier_schema(conn)
+    if rows is None:
+        segments = {(a or '', t or '') for a, t in conn.execute(
+            "SELECT DISTINCT arrondissement, rental_type FROM rentals")}
+        conn.execute("DELETE FROM outlier_bounds")
+        stale = segments | {('*', t) for _, t in segments} | {GLOBAL}
+        ids = []
+    else:
+        rows = list(rows)
+        if not rows:
+            return set()
+        incoming = Counter()
+        for _, arrondissement, rental_type in rows:
+            segment = (arrondissement or '', rental_type or '')
+            incoming.update([segment, ('*', segment[1]), GLOBAL])
+        stale = stale_keys(conn, incoming)
+        segments = {key for key in incoming if key[0] != '*'}
+        ids = [row[0] for row in rows]
+    refresh_bounds(conn, stale)
+
+    # Rows to re-flag: the given ones, and all rows under a refreshed key
+    scopes = []
+    if GLOBAL in stale:
+        segments |= {(a or '', t or '') for a, t in conn.execute(
+            "SELECT DISTINCT arrondissement, rental_type FROM rentals")}
+        scopes.append(("1 = 1", []))
+    else:
+        for a, t in stale:
+            if a == '*':
+                segments |= {(arr or '', t) for (arr,) in conn.execute(
+                    "SELECT DISTINCT arrondissement FROM rentals WHERE rental_type IS ?", (t or None,))}
+            scopes.append(key_scope(a, t))
+        if ids:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS flag_ids (id TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM temp.flag_ids")
+            conn.executemany("INSERT OR IGNORE INTO temp.flag_ids VALUES (?)", [(i,) for i in ids])
+            scopes.append(("rentals.id IN (SELECT id FROM temp.flag_ids)", []))
+
+    load_effective_bounds(conn, segments)
+    changed = set()
+    for scope, params in scopes:
+        changed.update(row[0] for row in conn.execute(FLAG_SQL.format(scope=scope), params))
+    return changed
+
+
+def main(argv: list[str] = None):
+    import argparse
+    from database import connect_writer
+
+    configure()
+    parser = argparse.ArgumentParser(description="Recompute outlier flags and print the bounds")
+    parser.add_argument("--db", default="paris_rentals.db")
+    args = parser.parse_args(argv)
+
+    conn = connect_writer(args.db)
+    changed = flag_outliers(conn)
+    conn.commit()
+
+    total, flagged = conn.execute("SELECT COUNT(*), SUM(is_outlier) FROM rentals").fetchone()
+    print(f"Flagged {flagged} of {total} listings as outliers ({len(changed)} flags changed).")
+    print("\nGlobal bounds:")
+    for metric, n, lower, upper in conn.execute("""
+        SELECT metric, n, lower, upper FROM outlier_bounds
+        WHERE arrondissement = '*' AND rental_type = '*'
+    """):
+        print(f"  {metric:14s} n={n:6d}  [{lower:10.2f}, {upper:10.2f}]")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
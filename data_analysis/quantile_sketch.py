@@ -0,0 +1,300 @@
+"""
+Mergeable quantile sketches (KLL) for per-group price percentiles.
+
+SQLite has no median, so percentile questions used to mean pulling every
+raw price into pandas. Instead, one KLL sketch is kept per
+(source, arrondissement, size bucket) in the price_sketches table. Sketches
+are updated on ingest and merged at query time, so medians, p10/p90 and
+boxplot statistics never touch the raw rows.
+
+Usage:
+    python quantile_sketch.py rebuild
+    python quantile_sketch.py query --source lacartedescolocs --by size_bucket
+"""
+
+import argparse
+import json
+import math
+import random
+import sqlite3
+
+from instrumentation import configure, instrumented
+
+
+# Accuracy parameter: rank error is roughly 1.7 / K (about 1% for K = 200)
+K = 200
+
+# Size buckets of the size-category SQL; '' stands for unknown
+SIZE_BUCKETS = ['< 20 m²', '20-30 m²', '31-50 m²', '51-80 m²', '> 80 m²']
+
+BOXPLOT_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang & Liberty, 2016).
+    Level h holds items of weight 2**h; a full level is sorted and every
+    other item is promoted to the next level.
+    """
+
+    def __init__(self, k: int = K, c: float = 2 / 3, seed: int = 0):
+        self.k = k
+        self.c = c
+        self.n = 0
+        self.levels = []
+        self.size = 0
+        self.max_size = 0
+        self._rng = random.Random(seed)
+        self._grow()
+
+    def _grow(self):
+        self.levels.append([])
+        self.max_size = sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def _capacity(self, height: int) -> int:
+        depth = len(self.levels) - height - 1
+        return int(math.ceil(self.k * self.c ** depth)) + 1
+
+    def update(self, value: float):
+        self.levels[0].append(value)
+        self.size += 1
+        self.n += 1
+        if self.size >= self.max_size:
+            self._compress()
+
+    def _compress(self):
+        for h in range(len(self.levels)):
+            if len(self.levels[h]) >= self._capacity(h):
+                if h + 1 >= len(self.levels):
+                    self._grow()
+                level = sorted(self.levels[h])
+                # Keep an odd leftover at this level
+                leftover = [level.pop()] if len(level) % 2 else []
+                offset = self._rng.randint(0, 1)
+                self.levels[h + 1].extend(level[offset::2])
+                self.levels[h] = leftover
+                self.size = sum(len(lv) for lv in self.levels)
+                if self.size < self.max_size:
+                    break
+
+    def merge(self, other: "KLLSketch"):
+        """Merge another sketch into this one."""
+        while len(self.levels) < len(other.levels):
+            self._grow()
+        for h, items in enumerate(other.levels):
+            self.levels[h].extend(items)
+        self.n += other.n
+        self.size = sum(len(lv) for lv in self.levels)
+        while self.size >= self.max_size:
+            self._compress()
+
+    def quantiles(self, qs) -> list[float]:
+        """Approximate values at the given ranks (0 <= q <= 1)."""
+        weighted = sorted((v, 1 << h) for h, lv in enumerate(self.levels) for v in lv)
+        if not weighted:
+            return [None for _ in qs]
+        total = sum(w for _, w in weighted)
+
+        results = []
+        for q in qs:
+            target = q * total
+            cumulative = 0
+            value = weighted[-1][0]
+            for v, w in weighted:
+                cumulative += w
+                if cumulative >= target:
+                    value = v
+                    break
+            results.append(value)
+        return results
+
+    def to_json(self) -> str:
+        return json.dumps({"k": self.k, "c": self.c, "n": self.n, "levels": self.levels},
+                          separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, payload: str) -> "KLLSketch":
+        data = json.loads(payload)
+        sketch = cls(k=data["k"], c=data["c"])
+        sketch.levels = data["levels"]
+        sketch.max_size = sum(sketch._capacity(h) for h in range(len(sketch.levels)))
+        sketch.size = sum(len(lv) for lv in sketch.levels)
+        sketch.n = data["n"]
+        return sketch
+
+
+def size_bucket(size: float) -> str:
+    """Python mirror of the size-category CASE expression ('' if unknown)."""
+    if size is None or size <= 0:
+        return ''
+    if size < 20:
+        return '< 20 m²'
+    if 20 <= size <= 30:
+        return '20-30 m²'
+    if 31 <= size <= 50:
+        return '31-50 m²'
+    if 51 <= size <= 80:
+        return '51-80 m²'
+    if size > 80:
+        return '> 80 m²'
+    return ''
+
+
+def create_sketch_table(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS price_sketches (
+            source TEXT NOT NULL,
+            arrondissement TEXT NOT NULL,
+            size_bucket TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            sketch TEXT NOT NULL,
+            PRIMARY KEY (source, arrondissement, size_bucket)
+        )
+    """)
+
+
+def sketch_key(source: str, arrondissement: str, size_m2: float) -> tuple:
+    return (source or '', arrondissement or '', size_bucket(size_m2))
+
+
+@instrumented(records=int)
+def update_sketches(conn: sqlite3.Connection, rows) -> int:
+    """
+    Add (source, arrondissement, size_m2, price_eur) rows to their group
+    sketches. Callers pass non-outlier rows only (see outliers.py).
+    Returns the number of prices added. Does not commit.
+    """
+    batches = {}
+    for source, arrondissement, size_m2, price in rows:
+        if price is None or price <= 0:
+            continue
+        batches.setdefault(sketch_key(source, arrondissement, size_m2), []).append(price)
+
+    added = 0
+    for key, prices in batches.items():
+        row = conn.execute("""
+            SELECT sketch FROM price_sketches
+            WHERE source = ? AND arrondissement = ? AND size_bucket = ?
+        """, key).fetchone()
+        sketch = KLLSketch.from_json(row[0]) if row else KLLSketch()
+        for price in prices:
+            sketch.update(price)
+        conn.execute("""
+            INSERT OR REPLACE INTO price_sketches
+            (source, arrondissement, size_bucket, n, sketch)
+            VALUES (?, ?, ?, ?, ?)
+        """, (*key, sketch.n, sketch.to_json()))
+        added += len(prices)
+    return added
+
+
+@instrumented(records=int)
+def rebuild_sketches(conn: sqlite3.Connection, strata=None) -> int:
+    """
+    Recompute the sketches from the rentals table: all of them in one pass,
+    or those of the given (source, arrondissement) strata ('' for NULL).
+    Does not commit.
+    """
+    create_sketch_table(conn)
+    if strata is None:
+        conn.execute("DELETE FROM price_sketches")
+        rows = conn.execute("""
+            SELECT source, arrondissement, size_m2, price_eur
+            FROM rentals
+            WHERE is_outlier = 0
+        """)
+        return update_sketches(conn, rows)
+
+    added = 0
+    for source, arrondissement in strata:
+        conn.execute("DELETE FROM price_sketches WHERE source = ? AND arrondissement = ?",
+                     (source, arrondissement))
+        rows = conn.execute("""
+            SELECT source, arrondissement, size_m2, price_eur
+            FROM rentals
+            WHERE is_outlier = 0 AND source IS ? AND arrondissement IS ?
+        """, (source or None, arrondissement or None)).fetchall()
+        added += update_sketches(conn, rows)
+    return added
+
+
+def merged_sketch(conn: sqlite3.Connection, source: str = None, arrondissement: str = None,
+                  bucket: str = None, paris_only: bool = False) -> KLLSketch:
+    """Merge every stored sketch matching the filters."""
+    query = "SELECT sketch FROM price_sketches WHERE 1 = 1"
+    params = []
+    if source is not None:
+        query += " AND source = ?"
+        params.append(source)
+    if arrondissement is not None:
+        query += " AND arrondissement = ?"
+        params.append(arrondissement)
+    if bucket is not None:
+        query += " AND size_bucket = ?"
+        params.append(bucket)
+    if paris_only:
+        query += " AND arrondissement != ''"
+
+    merged = KLLSketch()
+    for (payload,) in conn.execute(query, params):
+        merged.merge(KLLSketch.from_json(payload))
+    return merged
+
+
+def quantiles_by(conn: sqlite3.Connection, group: str, qs=BOXPLOT_QUANTILES,
+                 source: str = None, paris_only: bool = False) -> dict:
+    """
+    Quantiles per value of `group` ('size_bucket', 'arrondissement' or 'source').
+    Returns {group value: {'n': count, q: value, ...}} for non-empty groups.
+    """
+    if group not in ("size_bucket", "arrondissement", "source"):
+        raise ValueError(f"Cannot group sketches by {group}")
+
+    query = f"SELECT DISTINCT {group} FROM price_sketches WHERE {group} != ''"
+    values = [row[0] for row in conn.execute(query)]
+
+    results = {}
+    for value in values:
+        filters = {"source": source, "arrondissement": None, "bucket": None}
+        if group == "size_bucket":
+            filters["bucket"] = value
+        elif group == "arrondissement":
+            filters["arrondissement"] = value
+        else:
+            filters["source"] = value
+        sketch = merged_sketch(conn, paris_only=paris_only, **filters)
+        if sketch.n:
+            results[value] = {"n": sketch.n, **dict(zip(qs, sketch.quantiles(qs)))}
+    return results
+
+
+def main(argv: list[str] = None):
+    from database import connect_reader, connect_writer
+
+    configure()
+    parser = argparse.ArgumentParser(description="Per-group price quantile sketches")
+    parser.add_argument("--db", default="paris_rentals.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="Recompute all sketches from the rentals table")
+    q = sub.add_parser("query", help="Print p10 / median / p90 per group")
+    q.add_argument("--by", choices=["size_bucket", "arrondissement", "source"], default="size_bucket")
+    q.add_argument("--source")
+    q.add_argument("--paris-only", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.command == "rebuild":
+        conn = connect_writer(args.db)
+        added = rebuild_sketches(conn)
+        conn.commit()
+        print(f"Rebuilt sketches from {added} prices.")
+    else:
+        conn = connect_reader(args.db)
+        stats = quantiles_by(conn, args.by, (0.1, 0.5, 0.9), args.source, args.paris_only)
+        print(f"{args.by:16s} {'n':>7s} {'p10':>8s} {'median':>8s} {'p90':>8s}")
+        for value, s in stats.items():
+            print(f"{value:16s} {s['n']:7d} {s[0.1]:8.0f} {s[0.5]:8.0f} {s[0.9]:8.0f}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""
+Local query service for the analysis SQL (see sql_queries.sql).
+
+Exposes the analysis queries as named, parameterized endpoints from the
+command line or over a localhost HTTP server. Results are cached and keyed
+on SQLite's data_version counter, so any commit by an ingest process
+invalidates them automatically.
+
+Usage:
+    python query_service.py list
+    python query_service.py run price_by_arrondissement --param source=studapart --format csv
+    python query_service.py serve --port 8765
+"""
+
+import argparse
+import csv
+import io
+import json
+import statistics
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from urllib.parse import parse_qsl, urlparse
+
+from database import Database, connect_reader
+from instrumentation import configure, instrumented
+
+
+# Named queries from sql_queries.sql. Every parameter has a default; a default
+# of None means "no filter" and the SQL handles it with `:param IS NULL OR ...`.
+QUERIES = {
+    "price_by_arrondissement": {
+        "description": "Average price by arrondissement",
+        "params": {"source": None},
+        "sql": """
+            SELECT
+                arrondissement,
+                COUNT(*) as listing_count,
+                ROUND(AVG(price_eur), 2) as avg_price,
+                ROUND(MIN(price_eur), 2) as min_price,
+                ROUND(MAX(price_eur), 2) as max_price,
+                ROUND(AVG(price_per_m2), 2) as avg_price_per_m2
+            FROM rentals
+            WHERE arrondissement IS NOT NULL
+              AND price_eur IS NOT NULL
+              AND price_eur > 0
+              AND (:source IS NULL OR source = :source)
+            GROUP BY arrondissement
+            ORDER BY CAST(arrondissement AS INTEGER)
+        """,
+    },
+    "size_categories": {
+        "description": "Price distribution by size category",
+        "params": {"source": None},
+        "sql": """
+            SELECT
+                CASE
+                    WHEN size_m2 < 20 THEN '< 20 m²'
+                    WHEN size_m2 BETWEEN 20 AND 30 THEN '20-30 m²'
+                    WHEN size_m2 BETWEEN 31 AND 50 THEN '31-50 m²'
+                    WHEN size_m2 BETWEEN 51 AND 80 THEN '51-80 m²'
+                    WHEN size_m2 > 80 THEN '> 80 m²'
+                    ELSE 'Unknown'
+                END as size_category,
+                COUNT(*) as listing_count,
+                ROUND(AVG(price_eur), 2) as avg_price,
+                ROUND(AVG(price_per_m2), 2) as avg_price_per_m2
+            FROM rentals
+            WHERE size_m2 IS NOT NULL
+              AND price_eur IS NOT NULL
+              AND size_m2 > 0
+              AND (:source IS NULL OR source = :source)
+            GROUP BY size_category
+            ORDER BY
+                CASE size_category
+                    WHEN '< 20 m²' THEN 1
+                    WHEN '20-30 m²' THEN 2
+                    WHEN '31-50 m²' THEN 3
+                    WHEN '51-80 m²' THEN 4
+                    WHEN '> 80 m²' THEN 5
+                    ELSE 6
+                END
+        """,
+    },
+    "rental_types": {
+        "description": "Rental type distribution",
+        "params": {},
+        "sql": """
+            SELECT
+                COALESCE(rental_type, 'Non spécifié') as rental_type,
+                COUNT(*) as count,
+                ROUND(100.0 * COUNT(*) / (SELECT COUNT(*) FROM rentals), 2) as percentage
+            FROM rentals
+            GROUP BY rental_type
+            ORDER BY count DESC
+        """,
+    },
+    "source_comparison": {
+        "description": "Studapart vs La Carte des Colocs",
+        "params": {},
+        "sql": """
+            SELECT
+                source,
+                COUNT(*) as total_listings,
+                ROUND(AVG(price_eur), 2) as avg_price,
+                ROUND(AVG(size_m2), 2) as avg_size,
+                ROUND(AVG(price_per_m2), 2) as avg_price_per_m2,
+                SUM(CASE WHEN furnished IS NOT NULL THEN 1 ELSE 0 END) as furnished_count
+            FROM rentals
+            WHERE price_eur IS NOT NULL
+            GROUP BY source
+        """,
+    },
+    "price_per_m2_by_arrondissement": {
+        "description": "Price per m² points by arrondissement",
+        "params": {"include_outliers": 0},
+        "sql": """
+            SELECT
+                arrondissement,
+                price_per_m2,
+                size_m2,
+                price_eur
+            FROM rentals
+            WHERE arrondissement IS NOT NULL
+              AND price_per_m2 IS NOT NULL
+              AND price_per_m2 > 0
+              AND (:include_outliers OR is_outlier = 0)
+            ORDER BY CAST(arrondissement AS INTEGER)
+        """,
+    },
+    "top_listings": {
+        "description": "Most expensive listings",
+        "params": {"limit": 10, "source": None},
+        "sql": """
+            SELECT
+                title,
+                arrondissement,
+                price_eur,
+                size_m2,
+                price_per_m2,
+                rooms,
+                source
+            FROM rentals
+            WHERE price_eur IS NOT NULL
+              AND (:source IS NULL OR source = :source)
+            ORDER BY price_eur DESC
+            LIMIT :limit
+        """,
+    },
+    "furnished_comparison": {
+        "description": "Furnished vs unfurnished prices",
+        "params": {},
+        "sql": """
+            SELECT
+                CASE
+                    WHEN furnished IS NOT NULL THEN 'Meublé'
+                    ELSE 'Non meublé / Non spécifié'
+                END as furnished_status,
+                COUNT(*) as count,
+                ROUND(AVG(price_eur), 2) as avg_price,
+                ROUND(AVG(price_per_m2), 2) as avg_price_per_m2
+            FROM rentals
+            WHERE price_eur IS NOT NULL
+            GROUP BY furnished_status
+        """,
+    },
+}
+
+
+def bind_params(name: str, raw: dict) -> dict:
+    """
+    Merge user-supplied parameters with the query defaults.
+    String values (from the CLI or a query string) are cast to the type of
+    the default. Raises KeyError / ValueError on unknown names or bad values.
+    """
+    if name not in QUERIES:
+        raise KeyError(f"Unknown query: {name}")
+
+    defaults = QUERIES[name]["params"]
+    unknown = set(raw) - set(defaults)
+    if unknown:
+        raise ValueError(f"Unknown parameter(s) for {name}: {', '.join(sorted(unknown))}")
+
+    params = dict(defaults)
+    for key, value in raw.items():
+        default = defaults[key]
+        if isinstance(value, str) and default is not None:
+            value = type(default)(value)
+        params[key] = value
+    return params
+
+
+class QueryStats:
+    """Per-query latency statistics (milliseconds)."""
+
+    def __init__(self, window: int = 1000):
+        self.calls = 0
+        self.cache_hits = 0
+        self.latencies = deque(maxlen=window)
+
+    def record(self, elapsed_ms: float, cache_hit: bool):
+        self.calls += 1
+        if cache_hit:
+            self.cache_hits += 1
+        self.latencies.append(elapsed_ms)
+
+    def as_dict(self) -> dict:
+        samples = sorted(self.latencies)
+        if not samples:
+            return {"calls": 0, "cache_hits": 0}
+        return {
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "mean_ms": round(statistics.fmean(samples), 3),
+            "p50_ms": round(samples[len(samples) // 2], 3),
+            "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+            "max_ms": round(samples[-1], 3),
+        }
+
+
+class QueryService:
+    """
+    Runs named queries with a result cache keyed on PRAGMA data_version.
+    Cache misses run on a pool of read-only connections, outside the cache
+    lock, so concurrent HTTP requests do not queue behind one slow query.
+    """
+
+    def __init__(self, db_path: str = "paris_rentals.db", max_entries: int = 256,
+                 pool_size: int = 4):
+        # data_version changes whenever *another* connection commits, which is
+        # exactly what we want: the service never writes, ingest does. The
+        # counter is per connection, so it is always read from this one.
+        self.conn = connect_reader(db_path)
+        self.db = Database(db_path, pool_size=pool_size)
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.cache = OrderedDict()
+        self.cache_version = None
+        self.stats = {name: QueryStats() for name in QUERIES}
+
+    def data_version(self) -> int:
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    @instrumented("query_service.execute")
+    def execute(self, name: str, raw_params: dict = None) -> tuple[list[str], list[tuple]]:
+        """Return (columns, rows) for a named query, from cache when possible."""
+        params = bind_params(name, raw_params or {})
+        key = (name, tuple(sorted(params.items())))
+
+        start = time.perf_counter()
+        with self.lock:
+            version = self.data_version()
+            if version != self.cache_version:
+                self.cache.clear()
+                self.cache_version = version
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.move_to_end(key)
+
+        if cached is not None:
+            result = cached
+        else:
+            with self.db.reader() as conn:
+                cursor = conn.execute(QUERIES[name]["sql"], params)
+                columns = [col[0] for col in cursor.description]
+                result = (columns, cursor.fetchall())
+            with self.lock:
+                # Only cache if no commit landed while the query ran
+                if version == self.cache_version:
+                    self.cache[key] = result
+                    if len(self.cache) > self.max_entries:
+                        self.cache.popitem(last=False)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.stats[name].record(elapsed_ms, cache_hit=cached is not None)
+        return result
+
+    def stream(self, name: str, raw_params: dict = None, fmt: str = "json"):
+        """Yield the result of a named query as JSON or CSV text chunks."""
+        columns, rows = self.execute(name, raw_params)
+
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(row)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        elif fmt == "json":
+            yield "["
+            for i, row in enumerate(rows):
+                prefix = "," if i else ""
+                yield prefix + json.dumps(dict(zip(columns, row)), ensure_ascii=False)
+            yield "]\n"
+        else:
+            raise ValueError(f"Unsupported format: {fmt}")
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {name: s.as_dict() for name, s in self.stats.items() if s.calls}
+
+    def close(self):
+        self.db.close()
+        self.conn.close()
+
+
+def make_handler(service: QueryService):
+    """Build an HTTP request handler bound to a QueryService."""
+    # Imported here: only `serve` needs it, and it is slow to import
+    from http.server import BaseHTTPRequestHandler
+
+    class QueryHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, payload):
+            body = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [p for p in url.path.split("/") if p]
+            params = dict(parse_qsl(url.query))
+
+            if parts == ["queries"]:
+                self._send_json(200, {
+                    name: {"description": q["description"], "params": q["params"]}
+                    for name, q in QUERIES.items()
+                })
+            elif parts == ["stats"]:
+                self._send_json(200, service.get_stats())
+            elif len(parts) == 2 and parts[0] == "query":
+                fmt = params.pop("format", "json")
+                try:
+                    chunks = service.stream(parts[1], params, fmt)
+                    first = next(chunks)
+                except KeyError as e:
+                    self._send_json(404, {"error": str(e)})
+                    return
+                except ValueError as e:
+                    self._send_json(400, {"error": str(e)})
+                    return
+
+                content_type = "text/csv" if fmt == "csv" else "application/json"
+                self.send_response(200)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                self.end_headers()
+                self.wfile.write(first.encode("utf-8"))
+                for chunk in chunks:
+                    self.wfile.write(chunk.encode("utf-8"))
+            else:
+                self._send_json(404, {"error": f"Unknown path: {url.path}"})
+
+        def log_message(self, format, *args):
+            pass
+
+    return QueryHandler
+
+
+def serve(service: QueryService, port: int = 8765):
+    """Serve queries on localhost until interrupted."""
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(service))
+    print(f"Serving {len(QUERIES)} queries on http://127.0.0.1:{port}/ (Ctrl+C to stop)")
+    print("  GET /queries, GET /query/<name>?format=json|csv&<param>=<value>, GET /stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def parse_param_args(values: list[str]) -> dict:
+    """Turn ['key=value', ...] into a dict."""
+    params = {}
+    for item in values or []:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"Expected key=value, got: {item}")
+        params[key] = value
+    return params
+
+
+def main(argv: list[str] = None):
+    argv = [sys.argv[0]] + (sys.argv[1:] if argv is None else list(argv))
+    configure(argv)
+    parser = argparse.ArgumentParser(description="Cached query service for paris_rentals.db")
+    parser.add_argument("--db", default="paris_rentals.db", help="SQLite database path")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("list", help="List available queries")
+
+    run_p = sub.add_parser("run", help="Run a named query and print the result")
+    run_p.add_argument("name", choices=sorted(QUERIES))
+    run_p.add_argument("--param", action="append", metavar="KEY=VALUE", help="Query parameter")
+    run_p.add_argument("--format", choices=["json", "csv"], default="json")
+    run_p.add_argument("--stats", action="store_true", help="Print latency stats to stderr")
+
+    serve_p = sub.add_parser("serve", help="Serve queries over HTTP on localhost")
+    serve_p.add_argument("--port", type=int, default=8765)
+
+    args = parser.parse_args(argv[1:])
+
+    if args.command == "list":
+        for name, q in QUERIES.items():
+            params = ", ".join(f"{k}={v}" for k, v in q["params"].items()) or "-"
+            print(f"{name:32s} {q['description']}  [{params}]")
+        return 0
+
+    try:
+        service = QueryService(args.db)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return 1
+
+    try:
+        if args.command == "run":
+            for chunk in service.stream(args.name, parse_param_args(args.param), args.format):
+                sys.stdout.write(chunk)
+            if args.stats:
+                print(json.dumps(service.get_stats(), indent=2), file=sys.stderr)
+        elif args.command == "serve":
+            serve(service, args.port)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
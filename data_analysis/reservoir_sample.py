@@ -0,0 +1,307 @@
+"""
+Stratified reservoir sample of the listings, for approximate previews.
+
+One uniform reservoir of up to SAMPLE_SIZE listings is kept per
+(source, arrondissement) stratum in the rental_sample table, next to the
+number of listings the stratum has seen (sample_strata). Like the price
+sketches (quantile_sketch.py) it holds non-outlier listings with a price, is
+updated on ingest, and a stratum is redrawn when one of its rows changes.
+
+Previews (`--approx` in visualizations.py, data_analysis.py and
+`cli.py summary`) read the sample instead of the rentals table, so their
+cost depends on the number of strata, not on the size of the corpus. Each
+sampled row stands for seen / sampled listings of its stratum; means and
+totals are stratified estimates with a 95% confidence interval:
+
+    mean = sum_h W_h * mean_h,   W_h = N_h / N
+    var  = sum_h W_h^2 * (1 - n_h / N_h) * s_h^2 / n_h
+
+Listing counts per source and arrondissement are exact (N_h).
+
+Usage:
+    python reservoir_sample.py rebuild
+    python reservoir_sample.py query --by arrondissement --metric price_eur [--source studapart]
+"""
+
+import argparse
+import math
+import random
+import sqlite3
+from dataclasses import dataclass
+
+from instrumentation import configure, instrumented
+
+
+# Reservoir size per (source, arrondissement); a few dozen strata
+SAMPLE_SIZE = 200
+
+# Two-sided 95% normal quantile
+Z_95 = 1.96
+
+# Columns copied into the sample, after the stratum key
+SAMPLE_COLUMNS = ("id", "price_eur", "size_m2", "price_per_m2", "rooms", "rental_type", "furnished")
+METRICS = ("price_eur", "size_m2", "price_per_m2", "rooms")
+
+
+@dataclass
+class Estimate:
+    population: float   # listings the estimate stands for
+    sample: int         # sampled listings it is computed from
+    mean: float
+    ci: float           # half-width of the 95% confidence interval
+
+    @property
+    def low(self) -> float:
+        return self.mean - self.ci
+
+    @property
+    def high(self) -> float:
+        return self.mean + self.ci
+
+
+def create_sample_schema(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sample_strata (
+            source TEXT NOT NULL,
+            arrondissement TEXT NOT NULL,
+            seen INTEGER NOT NULL,
+            sampled INTEGER NOT NULL,
+            PRIMARY KEY (source, arrondissement)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rental_sample (
+            source TEXT NOT NULL,
+            arrondissement TEXT NOT NULL,
+            slot INTEGER NOT NULL,
+            id TEXT NOT NULL,
+            price_eur REAL,
+            size_m2 REAL,
+            price_per_m2 REAL,
+            rooms INTEGER,
+            rental_type TEXT,
+            furnished TEXT,
+            PRIMARY KEY (source, arrondissement, slot)
+        )
+    """)
+
+
+@instrumented(records=int)
+def update_sample(conn: sqlite3.Connection, rows, rng: random.Random = None) -> int:
+    """
+    Offer (source, arrondissement, *SAMPLE_COLUMNS) rows to their stratum's
+    reservoir (Algorithm R). Callers pass non-outlier rows only, as for the
+    sketches. Returns the number of rows offered. Does not commit.
+    """
+    rng = rng or random.Random()
+    batches = {}
+    for source, arrondissement, *values in rows:
+        price = values[SAMPLE_COLUMNS.index("price_eur")]
+        if price is None or price <= 0:
+            continue
+        batches.setdefault((source or '', arrondissement or ''), []).append(values)
+
+    offered = 0
+    for key, batch in batches.items():
+        row = conn.execute(
+            "SELECT seen FROM sample_strata WHERE source = ? AND arrondissement = ?", key
+        ).fetchone()
+        seen = row[0] if row else 0
+        writes = {}
+        for values in batch:
+            seen += 1
+            slot = seen - 1 if seen <= SAMPLE_SIZE else rng.randrange(seen)
+            if slot < SAMPLE_SIZE:
+                writes[slot] = values
+        conn.executemany(f"""
+            INSERT OR REPLACE INTO rental_sample
+            (source, arrondissement, slot, {', '.join(SAMPLE_COLUMNS)})
+            VALUES (?, ?, ?, {', '.join('?' * len(SAMPLE_COLUMNS))})
+        """, [(*key, slot, *values) for slot, values in writes.items()])
+        conn.execute("""
+            INSERT OR REPLACE INTO sample_strata (source, arrondissement, seen, sampled)
+            VALUES (?, ?, ?, ?)
+        """, (*key, seen, min(seen, SAMPLE_SIZE)))
+        offered += len(batch)
+    return offered
+
+
+@instrumented(records=int)
+def rebuild_sample(conn: sqlite3.Connection, seed: int = None, strata=None) -> int:
+    """
+    Redraw the reservoirs from the rentals table: all of them in one pass,
+    or those of the given (source, arrondissement) strata ('' for NULL).
+    Does not commit.
+    """
+    create_sample_schema(conn)
+    rng = random.Random(seed)
+    query = f"""
+        SELECT source, arrondissement, {', '.join(SAMPLE_COLUMNS)}
+        FROM rentals
+        WHERE is_outlier = 0
+    """
+    if strata is None:
+        conn.execute("DELETE FROM rental_sample")
+        conn.execute("DELETE FROM sample_strata")
+        return update_sample(conn, conn.execute(query), rng)
+
+    offered = 0
+    for key in strata:
+        for table in ("rental_sample", "sample_strata"):
+            conn.execute(f"DELETE FROM {table} WHERE source = ? AND arrondissement = ?", key)
+        rows = conn.execute(query + " AND source IS ? AND arrondissement IS ?",
+                            (key[0] or None, key[1] or None)).fetchall()
+        offered += update_sample(conn, rows, rng)
+    return offered
+
+
+def sample_query(columns: list[str], source: str = None) -> tuple[str, list]:
+    """
+    SQL and parameters returning `columns` of the sampled rows plus their
+    `weight` (listings each row stands for); '' strata keys come back as NULL.
+    """
+    select = [f"NULLIF(s.{c}, '') AS {c}" if c in ("source", "arrondissement") else f"s.{c}"
+              for c in columns]
+    query = f"""
+        SELECT {', '.join(select)}, 1.0 * st.seen / st.sampled AS weight
+        FROM rental_sample s
+        JOIN sample_strata st USING (source, arrondissement)
+    """
+    params = []
+    if source is not None:
+        query += " WHERE s.source = ?"
+        params.append(source)
+    return query, params
+
+
+def stratified_mean(strata) -> Estimate:
+    """
+    Estimate from (N_h, n_h, values) per stratum: N_h listings seen, n_h
+    sampled, values = the non-null metric values among the n_h sampled.
+    A metric missing on some rows is estimated over the listings that have
+    it (domain N_h * len(values) / n_h).
+    """
+    parts = []
+    for seen, sampled, values in strata:
+        if not values:
+            continue
+        k = len(values)
+        domain = seen * k / sampled
+        mean = sum(values) / k
+        var = sum((v - mean) ** 2 for v in values) / (k - 1) if k > 1 else 0.0
+        fpc = max(0.0, 1 - k / domain)
+        parts.append((domain, k, mean, var * fpc / k))
+
+    population = sum(p[0] for p in parts)
+    if not population:
+        return Estimate(0, 0, math.nan, math.nan)
+    mean = sum(d * m for d, _, m, _ in parts) / population
+    variance = sum((d / population) ** 2 * v for d, _, _, v in parts)
+    return Estimate(population, sum(p[1] for p in parts), mean, Z_95 * math.sqrt(variance))
+
+
+def load_strata(conn: sqlite3.Connection, metric: str, source: str = None) -> dict:
+    """{(source, arrondissement): (seen, sampled, [metric values])}."""
+    if metric not in METRICS:
+        raise ValueError(f"Cannot estimate {metric}")
+    query = f"""
+        SELECT st.source, st.arrondissement, st.seen, st.sampled, s.{metric}
+        FROM sample_strata st
+        JOIN rental_sample s USING (source, arrondissement)
+    """
+    params = []
+    if source is not None:
+        query += " WHERE st.source = ?"
+        params.append(source)
+    strata = {}
+    for src, arrondissement, seen, sampled, value in conn.execute(query, params):
+        entry = strata.setdefault((src, arrondissement), (seen, sampled, []))
+        if value is not None:
+            entry[2].append(value)
+    return strata
+
+
+def estimate_by(conn: sqlite3.Connection, group: str = None, metric: str = "price_eur",
+                source: str = None, paris_only: bool = False) -> dict:
+    """
+    {group value: Estimate} per 'arrondissement' or 'source' (None: one
+    overall estimate under the key None). Empty arrondissements are left
+    out of the arrondissement grouping, or of everything with paris_only.
+    """
+    if group not in (None, "arrondissement", "source"):
+        raise ValueError(f"Cannot group the sample by {group}")
+    groups = {}
+    for (src, arrondissement), stratum in load_strata(conn, metric, source).items():
+        if (paris_only or group == "arrondissement") and not arrondissement:
+            continue
+        value = {"arrondissement": arrondissement, "source": src, None: None}[group]
+        groups.setdefault(value, []).append(stratum)
+    return {value: stratified_mean(strata) for value, strata in sorted(groups.items(), key=str)}
+
+
+def print_sample_summary(conn: sqlite3.Connection):
+    """print_summary() from the sample: exact counts, estimated prices with 95% CIs."""
+    print("\n" + "="*50)
+    print("DATABASE SUMMARY (preview: stratified sample)")
+    print("="*50)
+
+    strata = conn.execute("SELECT source, arrondissement, seen, sampled FROM sample_strata").fetchall()
+    total = sum(row[2] for row in strata)
+    print(f"Non-outlier listings with a price: {total} "
+          f"({sum(row[3] for row in strata)} sampled in {len(strata)} strata)")
+
+    print("\nBy source:")
+    by_source = {}
+    for source, _, seen, _ in strata:
+        by_source[source] = by_source.get(source, 0) + seen
+    for source, count in sorted(by_source.items()):
+        print(f"  - {source}: {count}")
+
+    by_arrondissement = {}
+    for _, arrondissement, seen, _ in strata:
+        if arrondissement:
+            by_arrondissement[arrondissement] = by_arrondissement.get(arrondissement, 0) + seen
+    print("\nTop 5 arrondissements:")
+    for arrondissement, count in sorted(by_arrondissement.items(), key=lambda kv: -kv[1])[:5]:
+        print(f"  - {arrondissement}e: {count} listings")
+
+    overall = estimate_by(conn)[None] if strata else None
+    if overall:
+        print(f"\nPrice (EUR): Avg={overall.mean:.2f} ± {overall.ci:.2f} (95% CI)")
+    for source, estimate in estimate_by(conn, "source").items():
+        print(f"  - {source}: {estimate.mean:.2f} ± {estimate.ci:.2f}")
+
+
+def main(argv: list[str] = None):
+    from database import connect_reader, connect_writer
+
+    configure()
+    parser = argparse.ArgumentParser(description="Stratified reservoir sample for previews")
+    parser.add_argument("--db", default="paris_rentals.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("rebuild", help="Redraw the sample from the rentals table")
+    r.add_argument("--seed", type=int)
+    q = sub.add_parser("query", help="Estimated mean per group with 95%% CIs")
+    q.add_argument("--by", choices=["arrondissement", "source"], default="arrondissement")
+    q.add_argument("--metric", choices=METRICS, default="price_eur")
+    q.add_argument("--source")
+    args = parser.parse_args(argv)
+
+    if args.command == "rebuild":
+        conn = connect_writer(args.db)
+        offered = rebuild_sample(conn, args.seed)
+        conn.commit()
+        sampled = conn.execute("SELECT COUNT(*) FROM rental_sample").fetchone()[0]
+        print(f"Sampled {sampled} of {offered} listings.")
+    else:
+        conn = connect_reader(args.db)
+        estimates = estimate_by(conn, args.by, args.metric, args.source)
+        print(f"{args.by:16s} {'listings':>9s} {'sampled':>8s} {'mean':>9s} {'95% CI':>19s}")
+        for value, e in estimates.items():
+            print(f"{value or '?':16s} {e.population:9.0f} {e.sample:8d} {e.mean:9.1f} "
+                  f"[{e.low:8.1f}, {e.high:8.1f}]")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
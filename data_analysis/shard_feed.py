@@ -0,0 +1,241 @@
+"""
+Compressed, rotating JSON Lines feeds: gzip shards plus a manifest.
+
+A feed is a directory:
+
+    part-00000.jsonl.gz     one JSON record per line
+    part-00001.jsonl.gz
+    manifest.json           {"complete": false, "items": n, "shards": [{"name", "items",
+                             "bytes", "compressed_bytes"}, ...]}
+
+A shard is written as part-NNNNN.jsonl.gz.tmp and renamed once it holds
+max_items records or max_bytes of uncompressed JSON; only then is it listed
+in the manifest (replaced atomically). Readers therefore only ever see
+finished shards, and can consume them while the writer (a crawl, see
+French_Rentals/feedstorage.py, or merge_data.py) is still running;
+"complete" turns true when the writer is closed.
+
+Usage:
+    python shard_feed.py info ../output_all
+    python shard_feed.py convert ../output_all.json ../output_all   # JSON array -> feed
+"""
+
+import gzip
+import json
+import os
+import time
+from pathlib import Path
+from typing import Iterator
+
+
+MANIFEST_NAME = "manifest.json"
+SHARD_PATTERN = "part-{:05d}.jsonl.gz"
+
+# Rotation thresholds (uncompressed); the first one reached closes the shard
+MAX_ITEMS = 10_000
+MAX_BYTES = 64 * 1024 * 1024
+COMPRESS_LEVEL = 6
+
+POLL_SECONDS = 1.0
+
+# Lines are handed to gzip in chunks of this size rather than one by one
+WRITE_CHUNK = 1024 * 1024
+
+
+def is_shard_feed(path) -> bool:
+    return (Path(path) / MANIFEST_NAME).exists()
+
+
+def read_manifest(directory) -> dict:
+    with open(Path(directory) / MANIFEST_NAME, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ShardWriter:
+    """
+    Binary file-like sink that splits JSON Lines into rotating gzip shards.
+
+    write() accepts arbitrary byte chunks (a Scrapy exporter writes one line
+    per item); records are cut at newlines, so a shard never splits one.
+    """
+
+    def __init__(self, directory, max_items: int = MAX_ITEMS, max_bytes: int = MAX_BYTES,
+                 overwrite: bool = True):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.closed = False
+        self.pending = b""
+        self.shard = None
+        self.shard_items = self.shard_bytes = 0
+        self.buffer = []
+        self.buffered = 0
+
+        if not overwrite and is_shard_feed(self.directory):
+            self.manifest = read_manifest(self.directory)
+            self.manifest["complete"] = False
+        else:
+            for old in self.directory.glob("part-*.jsonl.gz*"):
+                old.unlink()
+            self.manifest = {"format": "jsonl.gz", "complete": False, "items": 0, "shards": [],
+                             "started": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        self._write_manifest()
+
+    def _write_manifest(self):
+        tmp = self.directory / (MANIFEST_NAME + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp, self.directory / MANIFEST_NAME)
+
+    def _shard_path(self) -> Path:
+        return self.directory / SHARD_PATTERN.format(len(self.manifest["shards"]))
+
+    def _flush_buffer(self):
+        self.shard.write(b"".join(self.buffer))
+        self.buffer = []
+        self.buffered = 0
+
+    def _rotate(self):
+        """Finish the current shard and publish it in the manifest."""
+        self._flush_buffer()
+        self.shard.close()
+        self.shard_file.close()
+        path = self._shard_path()
+        tmp = path.with_name(path.name + ".tmp")
+        os.replace(tmp, path)
+        self.manifest["shards"].append({
+            "name": path.name, "items": self.shard_items, "bytes": self.shard_bytes,
+            "compressed_bytes": path.stat().st_size,
+        })
+        self.manifest["items"] += self.shard_items
+        self._write_manifest()
+        self.shard = None
+
+    def _write_line(self, line: bytes):
+        if self.shard is None:
+            path = self._shard_path()
+            self.shard_file = open(path.with_name(path.name + ".tmp"), "wb")
+            self.shard = gzip.GzipFile(fileobj=self.shard_file, mode="wb", mtime=0,
+                                       compresslevel=COMPRESS_LEVEL)
+            self.shard_items = self.shard_bytes = 0
+        self.buffer.append(line)
+        self.buffered += len(line)
+        self.shard_items += 1
+        self.shard_bytes += len(line)
+        if self.buffered >= WRITE_CHUNK:
+            self._flush_buffer()
+        if self.shard_items >= self.max_items or self.shard_bytes >= self.max_bytes:
+            self._rotate()
+
+    def write(self, data: bytes) -> int:
+        lines = (self.pending + data).split(b"\n")
+        self.pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                self._write_line(line + b"\n")
+        return len(data)
+
+    def write_record(self, record: dict):
+        self._write_line(json.dumps(record, ensure_ascii=False).encode() + b"\n")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.closed:
+            return
+        if self.pending.strip():
+            self._write_line(self.pending + b"\n")
+        self.pending = b""
+        if self.shard is not None:
+            self._rotate()
+        self.manifest["complete"] = True
+        self._write_manifest()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_shards(directory, follow: bool = False, poll: float = POLL_SECONDS,
+                timeout: float = None) -> Iterator[list[dict]]:
+    """
+    Yield the records of each finished shard, in order. With follow=True,
+    wait for further shards until the manifest is complete (or `timeout`
+    seconds pass without a new one); otherwise stop at the last finished one.
+    """
+    directory = Path(directory)
+    done = 0
+    idle_since = time.monotonic()
+    while True:
+        manifest = read_manifest(directory)
+        shards = manifest["shards"]
+        for entry in shards[done:]:
+            with gzip.open(directory / entry["name"], "rb") as f:
+                text = f.read().decode("utf-8").rstrip("\n")
+            # JSON escapes newlines inside strings, so the raw ones only separate
+            # records: one json.loads per shard instead of one per line
+            yield json.loads(f"[{text.replace(chr(10), ',')}]") if text else []
+            done += 1
+            idle_since = time.monotonic()
+        if manifest["complete"] or not follow:
+            return
+        if timeout is not None and time.monotonic() - idle_since > timeout:
+            raise TimeoutError(f"No new shard in {directory} for {timeout:.0f} s")
+        time.sleep(poll)
+
+
+def iter_records(directory, follow: bool = False, **kwargs) -> Iterator[dict]:
+    for records in iter_shards(directory, follow, **kwargs):
+        yield from records
+
+
+def convert(json_path: str, directory: str, max_items: int = MAX_ITEMS) -> dict:
+    """Rewrite a JSON array file (the spiders' -O output) as a shard feed."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    with ShardWriter(directory, max_items) as writer:
+        for record in records:
+            writer.write_record(record)
+    return writer.manifest
+
+
+def main(argv: list[str] = None):
+    import argparse
+
+    # Imported here: the Scrapy feed storage imports this module as
+    # data_analysis.shard_feed, where bare sibling imports do not resolve
+    from instrumentation import configure
+
+    configure()
+    parser = argparse.ArgumentParser(description="Inspect or create compressed JSON Lines feeds")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("info", help="Shards, items and sizes of a feed")
+    p.add_argument("directory")
+    p = sub.add_parser("convert", help="JSON array file -> shard feed")
+    p.add_argument("json")
+    p.add_argument("directory")
+    p.add_argument("--max-items", type=int, default=MAX_ITEMS)
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        manifest = convert(args.json, args.directory, args.max_items)
+    else:
+        if not is_shard_feed(args.directory):
+            print(f"Error: {args.directory} has no {MANIFEST_NAME}")
+            exit(1)
+        manifest = read_manifest(args.directory)
+
+    raw = sum(s["bytes"] for s in manifest["shards"])
+    packed = sum(s["compressed_bytes"] for s in manifest["shards"])
+    state = "complete" if manifest["complete"] else "in progress"
+    print(f"{args.directory}: {manifest['items']} items in {len(manifest['shards'])} shards "
+          f"({state}), {raw / 1e6:.1f} MB JSON -> {packed / 1e6:.1f} MB gzip")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Date-partitioned columnar store of crawl snapshots, for trends over time.
+
+Every merge overwrites merged_rentals.json and paris_rentals.db; the store
+keeps each crawl's normalized records in one partition per crawl date
+(a later crawl on the same day replaces it):
+
+    snapshots/date=2026-03-02/_partition.json    rows, column kinds and dtypes
+                              price_eur.npy       float32, NaN = missing
+                              rooms.npy           int16, -1 = missing
+                              arrondissement.npy  uint8/16/32 codes into
+                              arrondissement.dict.json.gz   [null, "01", ...]
+
+Numbers are narrowed to float32 / int16 and strings dictionary-encoded, so
+partitions are a fraction of the JSON size, while the .npy files stay
+uncompressed for memory mapping (only the gzipped dictionaries are read
+whole). arrondissement and price_per_m2 are derived as in create_database.py
+(create_database.paris_arrondissement over geo_index.resolve_addresses).
+
+Reads prune partitions by date (and by dictionary, for `where` equality
+filters on string columns) and only map the columns a query names, e.g. the
+weekly median price per arrondissement over a year opens three small files
+per partition:
+
+    store = SnapshotStore("snapshots")
+    trend = weekly_medians(store, "price_eur", "arrondissement", start=datetime.date(2025, 10, 1))
+
+Usage:
+    python snapshot_store.py write [--merged merged_rentals.json] [--date 2026-03-02]
+    python snapshot_store.py list
+    python snapshot_store.py trend [--metric price_eur] [--by arrondissement] [--start 2025-10-01]
+"""
+
+import datetime
+import gzip
+import json
+import shutil
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from create_database import paris_arrondissement, safe_float, safe_int
+from geo_index import NO_PLACE, Place, resolve_addresses
+from instrumentation import configure, instrumented
+
+
+SNAPSHOT_DIR = "snapshots"
+PARTITION_PREFIX = "date="
+META_NAME = "_partition.json"
+
+# column: kind; "str" columns are dictionary-encoded
+SCHEMA = {
+    "id": "str",
+    "source": "str",
+    "url": "str",
+    "title": "str",
+    "price_eur": "float",
+    "address": "str",
+    "arrondissement": "str",
+    "size_m2": "float",
+    "price_per_m2": "float",
+    "rooms": "int",
+    "floor": "str",
+    "rental_type": "str",
+    "furnished": "str",
+    "latitude": "float",
+    "longitude": "float",
+    "amenities": "str",
+    "roommates": "int",
+    "bedrooms": "int",
+    "bathrooms": "int",
+}
+FLOAT_DTYPE = np.float32
+INT_DTYPE = np.int16
+INT_MISSING = -1
+
+
+def snapshot_row(record: dict, place: Place = NO_PLACE) -> dict:
+    """
+    Typed column values of a merge_data.normalize_record() record; place is
+    its resolved address (geo_index.resolve_addresses).
+    """
+    price = safe_float(record.get("price_eur"))
+    size = safe_float(record.get("size_m2"))
+    lat = safe_float(record.get("latitude"))
+    lon = safe_float(record.get("longitude"))
+    arrondissement, _ = paris_arrondissement(record.get("address"), lat, lon, place.city)
+    amenities = record.get("amenities")
+    if isinstance(amenities, list):
+        amenities = ",".join(sorted(amenities)) or None
+    return {
+        **{name: record.get(name) for name in SCHEMA},
+        "price_eur": price,
+        "size_m2": size,
+        "price_per_m2": round(price / size, 2) if price and size and size > 0 else None,
+        "latitude": lat,
+        "longitude": lon,
+        "arrondissement": arrondissement,
+        "amenities": amenities,
+        **{name: safe_int(record.get(name)) for name in ("rooms", "roommates", "bedrooms", "bathrooms")},
+    }
+
+
+def code_dtype(size: int):
+    """Smallest unsigned type for dictionary codes 0..size-1."""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if size <= np.iinfo(dtype).max + 1:
+            return dtype
+    return np.uint64
+
+
+def encode_strings(values: list) -> tuple[np.ndarray, list]:
+    """Codes into a dictionary whose entry 0 is None."""
+    index = {None: 0}
+    codes = [index.setdefault(v if v is None else str(v), len(index)) for v in values]
+    dictionary = list(index)
+    return np.array(codes, dtype=code_dtype(len(dictionary))), dictionary
+
+
+def encode_column(kind: str, values: list) -> tuple[np.ndarray, list]:
+    if kind == "str":
+        return encode_strings(values)
+    if kind == "float":
+        return np.array([np.nan if v is None else v for v in values], dtype=FLOAT_DTYPE), None
+    return np.array([INT_MISSING if v is None else v for v in values], dtype=INT_DTYPE), None
+
+
+class Partition:
+    """One crawl date; columns are memory-mapped on first use."""
+
+    def __init__(self, path: Path, files_read: list = None):
+        self.path = path
+        self.date = datetime.date.fromisoformat(path.name[len(PARTITION_PREFIX):])
+        with open(path / META_NAME, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.rows = self.meta["rows"]
+        self._dictionaries = {}
+        self.files_read = [] if files_read is None else files_read
+
+    def __repr__(self) -> str:
+        return f"Partition({self.date}, rows={self.rows})"
+
+    def kind(self, column: str) -> str:
+        return self.meta["columns"][column]["kind"]
+
+    def raw(self, column: str) -> np.ndarray:
+        """Stored array (codes for string columns), memory-mapped."""
+        path = self.path / f"{column}.npy"
+        self.files_read.append(path)
+        return np.load(path, mmap_mode="r")
+
+    def dictionary(self, column: str) -> list:
+        if column not in self._dictionaries:
+            path = self.path / f"{column}.dict.json.gz"
+            self.files_read.append(path)
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                self._dictionaries[column] = json.load(f)
+        return self._dictionaries[column]
+
+    def code_of(self, column: str, value) -> int:
+        """Dictionary code of value, or -1 when the partition never holds it."""
+        try:
+            return self.dictionary(column).index(value)
+        except ValueError:
+            return -1
+
+    def column(self, column: str) -> np.ndarray:
+        """Values: floats with NaN, ints with -1, strings decoded to an object array."""
+        data = self.raw(column)
+        if self.kind(column) == "str":
+            return np.array(self.dictionary(column), dtype=object)[data]
+        return data
+
+
+class SnapshotStore:
+    def __init__(self, root: str = SNAPSHOT_DIR):
+        self.root = Path(root)
+        # Column and dictionary files opened by reads, for I/O accounting
+        self.files_read = []
+
+    def partition_path(self, date: datetime.date) -> Path:
+        return self.root / f"{PARTITION_PREFIX}{date.isoformat()}"
+
+    @instrumented(name="snapshot_write")
+    def write(self, records: Iterable[dict], date: datetime.date = None) -> Path:
+        """Write records as the partition of `date` (default today), replacing it."""
+        date = date or datetime.date.today()
+        records = list(records)
+        places = resolve_addresses([record.get("address") for record in records])
+        rows = [snapshot_row(record, place) for record, place in zip(records, places)]
+        final = self.partition_path(date)
+        tmp = final.with_name(final.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+
+        columns = {}
+        for name, kind in SCHEMA.items():
+            data, dictionary = encode_column(kind, [row[name] for row in rows])
+            np.save(tmp / f"{name}.npy", data)
+            columns[name] = {"kind": kind, "dtype": data.dtype.str}
+            if dictionary is not None:
+                with gzip.open(tmp / f"{name}.dict.json.gz", "wt", encoding="utf-8") as f:
+                    json.dump(dictionary, f, ensure_ascii=False)
+                columns[name]["distinct"] = len(dictionary) - 1
+        meta = {"date": date.isoformat(), "rows": len(rows), "columns": columns,
+                "written": datetime.datetime.now().isoformat(timespec="seconds")}
+        with open(tmp / META_NAME, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=1)
+
+        # Swap in the finished partition; readers never see a partial one
+        if final.exists():
+            old = final.with_name(final.name + ".old")
+            final.rename(old)
+            tmp.rename(final)
+            shutil.rmtree(old)
+        else:
+            tmp.rename(final)
+        print(f"Snapshot {final}: {len(rows)} listings, {dir_size(final) / 1e6:.2f} MB")
+        return final
+
+    def partitions(self, start: datetime.date = None, end: datetime.date = None) -> list[Partition]:
+        """Partitions with start <= date <= end, oldest first; others are not opened."""
+        if not self.root.is_dir():
+            return []
+        selected = []
+        for path in sorted(self.root.glob(f"{PARTITION_PREFIX}*")):
+            if path.suffix in (".tmp", ".old") or not (path / META_NAME).exists():
+                continue
+            date = datetime.date.fromisoformat(path.name[len(PARTITION_PREFIX):])
+            if (start and date < start) or (end and date > end):
+                continue
+            selected.append(Partition(path, self.files_read))
+        return selected
+
+    def scan(self, columns: list[str], start: datetime.date = None, end: datetime.date = None,
+             where: dict = None, decode: bool = True) -> Iterator[tuple[Partition, dict]]:
+        """
+        (partition, {column: array}) for the partitions in [start, end], only
+        mapping `columns`. `where` keeps rows whose string columns equal the
+        given values; partitions whose dictionaries lack a value are skipped
+        without reading any column. With decode=False string columns are
+        returned as codes (see Partition.dictionary).
+        """
+        where = where or {}
+        for partition in self.partitions(start, end):
+            mask = None
+            for column, value in where.items():
+                code = partition.code_of(column, value)
+                if code < 0:
+                    mask = False
+                    break
+                hit = partition.raw(column) == code
+                mask = hit if mask is None else mask & hit
+            if mask is False:
+                continue
+            read = partition.column if decode else partition.raw
+            data = {column: read(column) for column in columns}
+            if mask is not None:
+                data = {column: values[mask] for column, values in data.items()}
+            yield partition, data
+
+
+def dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def iso_week(date: datetime.date) -> str:
+    year, week, _ = date.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+@instrumented()
+def weekly_medians(store: SnapshotStore, metric: str = "price_eur", by: str = "arrondissement",
+                   start: datetime.date = None, end: datetime.date = None,
+                   where: dict = None) -> dict:
+    """
+    {week: {group: median metric}} over [start, end]. A snapshot holds every
+    listing online at crawl time, so each week uses its last partition only;
+    earlier ones of the same week are not read.
+    """
+    last_of_week = {}
+    for partition in store.partitions(start, end):
+        last_of_week[iso_week(partition.date)] = partition.date
+
+    trend = {}
+    for week, date in sorted(last_of_week.items()):
+        for partition, data in store.scan([metric, by], date, date, where, decode=False):
+            values, codes = np.asarray(data[metric]), np.asarray(data[by])
+            keep = (codes != 0) & ~np.isnan(values) if values.dtype.kind == "f" else codes != 0
+            values, codes = values[keep], codes[keep]
+            dictionary = partition.dictionary(by)
+            order = np.argsort(codes, kind="stable")
+            codes, values = codes[order], values[order]
+            bounds = np.flatnonzero(np.diff(codes)) + 1
+            trend[week] = {dictionary[group[0]]: float(np.median(vals))
+                           for group, vals in zip(np.split(codes, bounds), np.split(values, bounds))
+                           if len(group)}
+    return trend
+
+
+def print_trend(trend: dict):
+    groups = sorted({group for row in trend.values() for group in row})
+    print(f"{'week':9s} " + " ".join(f"{g:>7s}" for g in groups))
+    for week, row in trend.items():
+        print(f"{week:9s} " + " ".join(f"{row[g]:7.0f}" if g in row else f"{'':>7s}" for g in groups))
+
+
+def main(argv: list[str] = None):
+    import argparse
+
+    configure()
+    parser = argparse.ArgumentParser(description="Date-partitioned columnar snapshot store")
+    parser.add_argument("--dir", default=SNAPSHOT_DIR, help="Store directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+    write = sub.add_parser("write", help="Store a merged snapshot as the partition of a date")
+    write.add_argument("--merged", default="merged_rentals.json", help="merge_data.py output")
+    write.add_argument("--date", type=datetime.date.fromisoformat, help="Crawl date (default today)")
+    sub.add_parser("list", help="List the partitions")
+    trend = sub.add_parser("trend", help="Weekly median of a metric per group")
+    trend.add_argument("--metric", default="price_eur", choices=[c for c, k in SCHEMA.items() if k != "str"])
+    trend.add_argument("--by", default="arrondissement", choices=[c for c, k in SCHEMA.items() if k == "str"])
+    trend.add_argument("--start", type=datetime.date.fromisoformat)
+    trend.add_argument("--end", type=datetime.date.fromisoformat)
+    trend.add_argument("--source", help="Only listings of this source")
+    args = parser.parse_args(argv)
+
+    store = SnapshotStore(args.dir)
+    if args.command == "write":
+        if not Path(args.merged).exists():
+            print(f"Error: {args.merged} not found. Run merge_data.py first.")
+            exit(1)
+        with open(args.merged, "r", encoding="utf-8") as f:
+            store.write(json.load(f), args.date)
+    elif args.command == "list":
+        partitions = store.partitions()
+        for partition in partitions:
+            print(f"{partition.date}  {partition.rows:8d} rows  {dir_size(partition.path) / 1e6:7.2f} MB")
+        print(f"{len(partitions)} partitions in {store.root}")
+    else:
+        where = {"source": args.source} if args.source else None
+        result = weekly_medians(store, args.metric, args.by, args.start, args.end, where)
+        print_trend(result)
+
+
+if __name__ == "__main__":
+    main()
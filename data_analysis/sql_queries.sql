@@ -95,7 +95,7 @@ FROM rentals
 WHERE arrondissement IS NOT NULL 
   AND price_per_m2 IS NOT NULL
   AND price_per_m2 > 0
-  AND price_per_m2 < 100  -- Filter outliers
+  AND is_outlier = 0  -- Robust per-segment bounds, see outliers.py
 ORDER BY CAST(arrondissement AS INTEGER);
 
 
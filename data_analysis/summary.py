@@ -0,0 +1,102 @@
+"""
+Database summary: listing counts per source, arrondissement and city, and
+price statistics.
+
+Kept apart from create_database.py so that `cli.py summary` imports only
+sqlite3 and the connection helpers; --approx reads the stratified preview
+sample instead (reservoir_sample.py).
+
+Usage:
+    python summary.py [--db paris_rentals.db] [--approx]
+"""
+
+import sqlite3
+
+from database import connect_reader
+from instrumentation import configure
+
+
+def print_summary(conn: sqlite3.Connection):
+    """Print database summary statistics."""
+    cursor = conn.cursor()
+    
+    print("\n" + "="*50)
+    print("DATABASE SUMMARY")
+    print("="*50)
+    
+    # Total records
+    cursor.execute("SELECT COUNT(*) FROM rentals")
+    print(f"Total rentals: {cursor.fetchone()[0]}")
+    
+    # By source
+    cursor.execute("SELECT source, COUNT(*) FROM rentals GROUP BY source")
+    print("\nBy source:")
+    for row in cursor.fetchall():
+        print(f"  - {row[0]}: {row[1]}")
+    
+    # By arrondissement (top 5)
+    cursor.execute("""
+        SELECT arrondissement, COUNT(*) as cnt 
+        FROM rentals 
+        WHERE arrondissement IS NOT NULL 
+        GROUP BY arrondissement 
+        ORDER BY cnt DESC 
+        LIMIT 5
+    """)
+    print("\nTop 5 arrondissements:")
+    for row in cursor.fetchall():
+        print(f"  - {row[0]}e: {row[1]} listings")
+    
+    # By city (top 5); databases built before geo_index.py have no city column
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(rentals)")}
+    if "city" in columns:
+        cursor.execute("""
+            SELECT city, departement, COUNT(*) as cnt 
+            FROM rentals 
+            WHERE city IS NOT NULL 
+            GROUP BY city, departement 
+            ORDER BY cnt DESC 
+            LIMIT 5
+        """)
+        print("\nTop 5 cities:")
+        for row in cursor.fetchall():
+            print(f"  - {row[0]} ({row[1] or '?'}): {row[2]} listings")
+    
+    # Price stats
+    cursor.execute("""
+        SELECT 
+            ROUND(AVG(price_eur), 2),
+            ROUND(MIN(price_eur), 2),
+            ROUND(MAX(price_eur), 2)
+        FROM rentals 
+        WHERE price_eur IS NOT NULL
+    """)
+    avg, min_p, max_p = cursor.fetchone()
+    print(f"\nPrice stats (EUR): Avg={avg}, Min={min_p}, Max={max_p}")
+
+
+def main(argv: list[str] = None) -> int:
+    import argparse
+
+    configure()
+    parser = argparse.ArgumentParser(description="Print database summary statistics")
+    parser.add_argument("--db", default="paris_rentals.db")
+    parser.add_argument("--approx", action="store_true",
+                        help="Estimate from the stratified preview sample, with 95%% CIs")
+    args = parser.parse_args(argv)
+    try:
+        conn = connect_reader(args.db)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return 1
+    if args.approx:
+        from reservoir_sample import print_sample_summary
+        print_sample_summary(conn)
+    else:
+        print_summary(conn)
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Seeded synthetic listings in the raw output format of both spiders.
+
+studapart records cover all of France (about a third in Paris, with a 750XX
+postcode in the address); lacartedescolocs records are Paris-only and carry
+Lat/Lon. Field names, string formats, missing-value rates and a small share
+of duplicate URLs and price outliers follow the real crawls, so the output
+can be fed to merge_datasets() unchanged.
+
+Usage:
+    python synthetic_data.py 10000 --out synthetic_10k
+"""
+
+import argparse
+import json
+import math
+import random
+from pathlib import Path
+from typing import Iterator
+
+from create_database import ARRONDISSEMENT_CENTERS
+
+
+DEFAULT_SEED = 42
+
+# Share of records coming from lacartedescolocs (about 6% in the real crawls)
+LACARTE_SHARE = 0.06
+
+STUDAPART_PARIS_SHARE = 0.35
+DUPLICATE_SHARE = 0.01
+OUTLIER_SHARE = 0.005
+
+# (city, postcode, base €/m²)
+CITIES = [
+    ("Lyon", "69003", 17.0), ("Lille", "59000", 16.0), ("Marseille", "13001", 15.0),
+    ("Toulouse", "31000", 15.5), ("Bordeaux", "33000", 16.5), ("Nantes", "44000", 15.0),
+    ("Rennes", "35000", 14.5), ("Montpellier", "34000", 16.0), ("Strasbourg", "67000", 14.0),
+    ("Grenoble", "38000", 14.0), ("Vitry-sur-Seine", "94400", 20.0), ("Saint-Denis", "93200", 21.0),
+    ("Nanterre", "92000", 23.0), ("Caen", "14000", 13.0), ("Antibes", "06600", 19.0),
+]
+
+# Base €/m² per arrondissement, roughly the real ordering
+PARIS_BASE = {
+    "01": 38, "02": 37, "03": 38, "04": 39, "05": 36, "06": 40, "07": 40, "08": 37,
+    "09": 34, "10": 31, "11": 32, "12": 30, "13": 28, "14": 30, "15": 31, "16": 35,
+    "17": 32, "18": 29, "19": 27, "20": 28,
+}
+
+STREETS = [
+    "Rue de la République", "Avenue Jean Jaurès", "Boulevard Voltaire", "Rue Oberkampf",
+    "Rue du Faubourg Saint-Antoine", "Avenue Simon Bolivar", "Rue Oscar Roty",
+    "Boulevard Exelmans", "Rue de l'Eglise", "Rue Spontini", "Rue Victor Hugo",
+    "Cours Masséna", "Rue des Ardennes", "Rue Aristide Briand", "Place de la Nation",
+]
+
+STUDAPART_TYPES = [
+    ("Logement en colocation", 0.49), ("Logement entier", 0.335),
+    ("Logement en résidence", 0.13), ("Logement chez l'habitant", 0.045),
+]
+LACARTE_TYPES = [
+    ("Appartement", 0.96), ("Maison", 0.015), ("Immeuble", 0.01), ("Duplex", 0.01),
+    ("Loft/atelier", 0.005),
+]
+
+FLOORS = ["Rez-de-chaussée", "1er étage", "2ème étage", "3ème étage", "4ème étage",
+          "5ème étage", "6ème étage"]
+
+
+def _weighted(rng: random.Random, choices: list[tuple]) -> str:
+    return rng.choices([c[0] for c in choices], weights=[c[1] for c in choices])[0]
+
+
+def _size_and_rooms(rng: random.Random, rental_type: str) -> tuple[int, int]:
+    size = max(9, min(400, int(rng.lognormvariate(3.9, 0.55))))
+    rooms = max(1, min(9, round(size / 20 + rng.gauss(0, 0.8))))
+    if rental_type in ("Logement en résidence", "Logement chez l'habitant"):
+        size = max(9, min(size, 35))
+        rooms = 1
+    return size, rooms
+
+
+def _price(rng: random.Random, size: int, base: float, shared: bool) -> int:
+    price = size * base * rng.lognormvariate(0, 0.18) * (0.45 if shared else 1.0)
+    if rng.random() < OUTLIER_SHARE:
+        price *= rng.choice([0.05, 12.0])
+    return max(1, int(price))
+
+
+def _floor(rng: random.Random, missing: float) -> str:
+    return None if rng.random() < missing else rng.choice(FLOORS)
+
+
+def studapart_record(rng: random.Random, i: int) -> dict:
+    rental_type = _weighted(rng, STUDAPART_TYPES)
+    size, rooms = _size_and_rooms(rng, rental_type)
+
+    if rng.random() < STUDAPART_PARIS_SHARE:
+        arrondissement = rng.choice(list(PARIS_BASE))
+        city, postcode, base = "Paris", f"750{arrondissement}", PARIS_BASE[arrondissement]
+    else:
+        city, postcode, base = rng.choice(CITIES)
+
+    shared = rental_type == "Logement en colocation"
+    if shared:
+        title = f"Logement en colocation pour {rng.randint(1, 3)} personne de {size}m²"
+    elif rooms == 1:
+        title = f"Studio de {size}m²"
+    else:
+        title = f"T{rooms} de {size}m²"
+
+    slug = title.replace(" ", "-").replace("²", "2")
+    uid = f"{rng.getrandbits(128):032x}"
+    uuid = f"{uid[:8]}-{uid[8:12]}-{uid[12:16]}-{uid[16:20]}-{uid[20:]}"
+    return {
+        "AdUrl": f"https://www.studapart.com/fr/logement-{city}/{slug}/property/{uuid}",
+        "AdTitle": title,
+        "RentalPrice_EUR": str(_price(rng, size, base, shared)),
+        "RentalAddrese": f"{rng.randint(1, 180)} {rng.choice(STREETS)}, {postcode} {city}, France",
+        "RentalSize_m2": str(size),
+        "RentalRooms": None if rng.random() < 0.29 else str(rooms),
+        "RentalFloor": _floor(rng, 0.26),
+        "RentalType": rental_type,
+        "Furnished": None if rng.random() < 0.013 else "Meublé",
+    }
+
+
+def lacarte_record(rng: random.Random, i: int) -> dict:
+    rental_type = _weighted(rng, LACARTE_TYPES)
+    size, rooms = _size_and_rooms(rng, rental_type)
+    arrondissement = rng.choice(list(PARIS_BASE))
+    lat, lon = ARRONDISSEMENT_CENTERS[arrondissement]
+
+    record = {
+        "AdUrl": "https://www.lacartedescolocs.fr/colocations/fr/ile-de-france/paris/a/"
+                 + "".join(rng.choices("abcdefghijklmnopqrstuvwxyz0123456789", k=6)) + f"{i:x}",
+        "AdTitle": f"{rental_type} {rooms} pièces de {size} m²",
+        "RentalPrice_EUR": str(_price(rng, size, PARIS_BASE[arrondissement], True)),
+        "RentalAddrese": f"{rng.choice(STREETS)}, Paris",
+        "RentalSize_m2": str(size),
+        "RentalRooms": None if rng.random() < 0.06 else str(rooms),
+        "RentalType": rental_type,
+        "Lat": f"{lat + rng.gauss(0, 0.006):.5f}",
+        "Lon": f"{lon + rng.gauss(0, 0.008):.5f}",
+    }
+    if rng.random() < 0.8:
+        record["Furnished"] = "Meublé"
+    if rng.random() < 0.14:
+        record["RentalFloor"] = _floor(rng, 0.0)
+    return record
+
+
+def generate(n: int, make_record, seed: int) -> Iterator[dict]:
+    """n raw records; DUPLICATE_SHARE of them re-list an earlier URL."""
+    rng = random.Random(seed)
+    recent = []
+    for i in range(n):
+        if recent and rng.random() < DUPLICATE_SHARE:
+            record = dict(rng.choice(recent))
+            record["RentalPrice_EUR"] = str(int(int(record["RentalPrice_EUR"]) * rng.uniform(0.95, 1.05)) or 1)
+        else:
+            record = make_record(rng, i)
+            if len(recent) < 1000:
+                recent.append(record)
+            else:
+                recent[rng.randrange(1000)] = record
+        yield record
+
+
+def write_json_array(path: Path, records: Iterator[dict]) -> int:
+    """Stream records to a JSON array file without holding them in memory."""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for record in records:
+            f.write(",\n" if count else "\n")
+            f.write(json.dumps(record, ensure_ascii=False))
+            count += 1
+        f.write("\n]\n")
+    return count
+
+
+def generate_dataset(n: int, out_dir: str, seed: int = DEFAULT_SEED,
+                     lacarte_share: float = LACARTE_SHARE) -> list[tuple[str, str]]:
+    """
+    Write output_all.json (studapart) and data_paris.json (lacartedescolocs)
+    with n records in total. Returns the (path, source) list for merge_datasets().
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    n_lacarte = int(math.floor(n * lacarte_share))
+
+    files = [
+        (out / "output_all.json", "studapart", n - n_lacarte, studapart_record),
+        (out / "data_paris.json", "lacartedescolocs", n_lacarte, lacarte_record),
+    ]
+    for offset, (path, _, count, make_record) in enumerate(files):
+        write_json_array(path, generate(count, make_record, seed + offset))
+    return [(str(path), source) for path, source, _, _ in files]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seeded synthetic spider output")
+    parser.add_argument("records", type=int, help="Total number of raw records")
+    parser.add_argument("--out", default="synthetic")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--lacarte-share", type=float, default=LACARTE_SHARE)
+    args = parser.parse_args()
+
+    for path, source in generate_dataset(args.records, args.out, args.seed, args.lacarte_share):
+        print(f"{source:18s} -> {path} ({Path(path).stat().st_size / 1e6:.1f} MB)")
@@ -1,158 +1,249 @@
 """
 Visualizations for Paris Rental Data Analysis.
+
+Plots are described by PlotSpec entries. A run fetches the needed columns
+once into a shared frame, derives each plot's input data from it, skips plots
+whose input fingerprint matches the last rendered PNG, and renders the rest
+in a process pool of at most os.cpu_count() workers (inline with one).
+Distribution plots read their percentiles from the stored price sketches
+(see quantile_sketch.py) instead of raw rows.
+
+With --approx the shared frame is read from the stratified preview sample
+(see reservoir_sample.py) instead of the rentals table: bars show estimated
+averages with 95% confidence intervals, and the charts go to plots/preview/.
 """
 
+import hashlib
+import json
+import os
 import sqlite3
-import matplotlib
-matplotlib.use('Agg')  # Non-interactive backend - prevents blocking
-import matplotlib.pyplot as plt
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
-# Set style for better looking plots
-plt.style.use('seaborn-v0_8-whitegrid')
-plt.rcParams['figure.figsize'] = (12, 7)
-plt.rcParams['font.size'] = 11
-plt.rcParams['axes.titlesize'] = 14
-plt.rcParams['axes.labelsize'] = 12
+from database import connect_reader
+from instrumentation import configure, instrumented, stage
+from quantile_sketch import BOXPLOT_QUANTILES, SIZE_BUCKETS, quantiles_by
+from reservoir_sample import sample_query, stratified_mean
+
+# Plot style, applied when matplotlib is first needed (see pyplot())
+STYLE = 'seaborn-v0_8-whitegrid'
+RC_PARAMS = {
+    'figure.figsize': (12, 7),
+    'font.size': 11,
+    'axes.titlesize': 14,
+    'axes.labelsize': 12,
+}
 
 COLORS = {
-    'primary': '#1a365d',    
-    'secondary': '#c53030',    
-    'accent': '#2c5282',       
-    'light': '#bee3f8',       
-    'gradient': plt.cm.Blues, 
+    'primary': '#1a365d',
+    'secondary': '#c53030',
+    'accent': '#2c5282',
+    'light': '#bee3f8',
+    'gradient': 'Blues',
 }
 
+# Columns needed by every plot spec, fetched once per run
+FRAME_QUERY = """
+    SELECT source, arrondissement, price_eur, price_per_m2
+    FROM rentals
+    WHERE is_outlier = 0
+      AND price_eur IS NOT NULL
+      AND price_eur > 0
+"""
+FRAME_COLUMNS = ['source', 'arrondissement', 'price_eur', 'price_per_m2']
 
-def get_connection(db_path: str = "paris_rentals.db") -> sqlite3.Connection:
-    """Get database connection."""
-    if not Path(db_path).exists():
-        raise FileNotFoundError(f"Database {db_path} not found. Run create_database.py first.")
-    return sqlite3.connect(db_path)
+SIZE_ORDER = SIZE_BUCKETS
 
+FINGERPRINT_FILE = ".fingerprints.json"
 
 
-# Average Price by Arrondissement
-def plot_price_by_arrondissement(conn: sqlite3.Connection, save_path: str = None):
+@dataclass(frozen=True)
+class PlotSpec:
+    """Parameters of one chart. `kind` selects the data preparation and renderer."""
+    name: str
+    kind: str                       # 'arrondissement' or 'size'
+    title: str
+    label: str                      # progress label printed while generating
+    source: str = None              # restrict to one source, None = all
+    cmap: str = 'RdYlGn_r'
+    cmap_range: tuple = (0.2, 0.8)
+    title_size: int = 16
+    title_pad: int = 20
+    avg_label: str = 'Paris Average'
+
+
+PLOT_SPECS = [
+    PlotSpec(
+        name="price_by_arrondissement",
+        kind="arrondissement",
+        title='Average Rental Prices by Paris Arrondissement',
+        label="Price by Arrondissement chart (ALL)",
+    ),
+    PlotSpec(
+        name="price_by_arrondissement_shared",
+        kind="arrondissement",
+        title='Shared Accommodation Prices by Paris Arrondissement\n'
+              '(La Carte des Colocs - Room in shared housing)',
+        label="Price by Arrondissement chart (SHARED ONLY)",
+        source='lacartedescolocs',
+        cmap='Oranges',
+        cmap_range=(0.3, 0.8),
+        title_size=14,
+        title_pad=15,
+        avg_label='Shared Average',
+    ),
+    PlotSpec(
+        name="price_by_size_shared",
+        kind="size",
+        title='Shared Accommodation Prices by Size\n'
+              '(La Carte des Colocs - Price per room in shared housing)',
+        label="Price by Size chart (SHARED ONLY)",
+        source='lacartedescolocs',
+        cmap='Oranges',
+        cmap_range=(0.3, 0.8),
+        title_size=14,
+        title_pad=15,
+    ),
+]
+
+
+_style_applied = False
+
+
+def pyplot():
     """
-    Bar chart showing average rental prices by Paris arrondissement.
+    Import pyplot with the non-interactive backend and the plot style applied.
+    Deferred to the renderers, which usually run in worker processes, so
+    importing this module (or preparing data) does not pay for matplotlib.
     """
-    query = """
-        SELECT 
-            arrondissement,
-            COUNT(*) as listing_count,
-            ROUND(AVG(price_eur), 2) as avg_price,
-            ROUND(AVG(price_per_m2), 2) as avg_price_per_m2
-        FROM rentals
-        WHERE arrondissement IS NOT NULL 
-          AND price_eur IS NOT NULL
-          AND price_eur > 0
-        GROUP BY arrondissement
-        ORDER BY CAST(arrondissement AS INTEGER)
+    import matplotlib
+    matplotlib.use('Agg')  # Non-interactive backend - prevents blocking
+    import matplotlib.pyplot as plt
+
+    global _style_applied
+    if not _style_applied:
+        plt.style.use(STYLE)
+        plt.rcParams.update(RC_PARAMS)
+        _style_applied = True
+    return plt
+
+
+def get_connection(db_path: str = "paris_rentals.db") -> sqlite3.Connection:
+    """Get a read-only database connection."""
+    return connect_reader(db_path)
+
+
+@instrumented(records=len)
+def load_frame(conn: sqlite3.Connection, approx: bool = False) -> pd.DataFrame:
     """
-    
-    df = pd.read_sql_query(query, conn)
-    
-    if df.empty:
-        print("No data available for arrondissement visualization.")
-        return
-    
-    fig, ax = plt.subplots(figsize=(14, 7))
-    
-    # Create bar positions
-    x = np.arange(len(df))
-    width = 0.6
-    
-    # Color bars by price (gradient)
-    colors = plt.cm.RdYlGn_r(np.linspace(0.2, 0.8, len(df)))
-    
-    bars = ax.bar(x, df['avg_price'], width, color=colors, edgecolor='white', linewidth=0.7)
-    
-    # Add value labels on bars
-    for bar, count in zip(bars, df['listing_count']):
-        height = bar.get_height()
-        ax.annotate(f'€{int(height)}',
-                    xy=(bar.get_x() + bar.get_width() / 2, height),
-                    xytext=(0, 3),
-                    textcoords="offset points",
-                    ha='center', va='bottom', fontsize=9, fontweight='bold')
-        # Add listing count at bottom
-        ax.annotate(f'n={count}',
-                    xy=(bar.get_x() + bar.get_width() / 2, 0),
-                    xytext=(0, 5),
-                    textcoords="offset points",
-                    ha='center', va='bottom', fontsize=8, color='gray')
-    
-    # Customize axes
-    ax.set_xlabel('Arrondissement', fontweight='bold')
-    ax.set_ylabel('Average Monthly Rent (€)', fontweight='bold')
-    ax.set_title('Average Rental Prices by Paris Arrondissement', fontsize=16, fontweight='bold', pad=20)
-    ax.set_xticks(x)
-    ax.set_xticklabels([f"{arr}e" for arr in df['arrondissement']], rotation=45, ha='right')
-    
-    # Add average line
-    avg_all = df['avg_price'].mean()
-    ax.axhline(y=avg_all, color=COLORS['secondary'], linestyle='--', linewidth=2, label=f'Paris Average: €{avg_all:.0f}')
-    ax.legend(loc='upper right')
-    
-    # Remove top and right spines
-    ax.spines['top'].set_visible(False)
-    ax.spines['right'].set_visible(False)
-    
-    plt.tight_layout()
-    
-    if save_path:
-        plt.savefig(save_path, dpi=150, bbox_inches='tight', facecolor='white')
-        print(f"Saved: {save_path}")
-    
-    plt.close()  # Close figure to free memory
+    Fetch the columns shared by all plots in a single query; with approx, the
+    sampled rows instead, plus the `weight` (listings each row stands for).
+    """
+    if approx:
+        query, params = sample_query(FRAME_COLUMNS)
+        return pd.read_sql_query(query, conn, params=params)
+    return pd.read_sql_query(FRAME_QUERY, conn)
 
 
-# Average Price by Arrondissement (SHARED ONLY)
-def plot_price_by_arrondissement_shared(conn: sqlite3.Connection, save_path: str = None):
+def estimate_by_arrondissement(df: pd.DataFrame) -> pd.DataFrame:
+    """Per-arrondissement estimates from sampled rows, one stratum per source."""
+    rows = []
+    for arrondissement, group in df.groupby('arrondissement'):
+        strata = {col: [] for col in ('price_eur', 'price_per_m2')}
+        for _, stratum in group.groupby('source', dropna=False):
+            seen = stratum['weight'].iloc[0] * len(stratum)
+            for col, parts in strata.items():
+                parts.append((seen, len(stratum), stratum[col].dropna().tolist()))
+        price, per_m2 = (stratified_mean(parts) for parts in strata.values())
+        rows.append({'arrondissement': arrondissement,
+                     'listing_count': int(round(price.population)),
+                     'avg_price': price.mean, 'avg_price_ci': price.ci,
+                     'avg_price_per_m2': per_m2.mean, 'avg_price_per_m2_ci': per_m2.ci})
+    return pd.DataFrame(rows, columns=['arrondissement', 'listing_count', 'avg_price', 'avg_price_ci',
+                                       'avg_price_per_m2', 'avg_price_per_m2_ci']).round(2)
+
+
+@instrumented()
+def prepare_data(frame: pd.DataFrame, spec: PlotSpec, conn: sqlite3.Connection = None) -> pd.DataFrame:
     """
-    Bar chart showing average rental prices by Paris arrondissement.
-    SHARED ACCOMMODATIONS ONLY (La Carte des Colocs).
+    Derive a spec's input data: aggregates from the shared frame (estimates
+    with confidence intervals if it is a sampled frame), or per-size-bucket
+    boxplot statistics from the price sketches (needs conn).
+    """
+    if spec.kind == "arrondissement":
+        df = frame
+        if spec.source:
+            df = df[df['source'] == spec.source]
+        df = df.dropna(subset=['arrondissement'])
+        if 'weight' in df:
+            grouped = estimate_by_arrondissement(df)
+        else:
+            grouped = df.groupby('arrondissement').agg(
+                listing_count=('price_eur', 'size'),
+                avg_price=('price_eur', 'mean'),
+                avg_price_per_m2=('price_per_m2', 'mean'),
+            ).round(2).reset_index()
+        order = grouped['arrondissement'].astype(int).argsort()
+        return grouped.iloc[order].reset_index(drop=True)
+
+    if spec.kind == "size":
+        stats = quantiles_by(conn, "size_bucket", BOXPLOT_QUANTILES,
+                             source=spec.source, paris_only=True)
+        rows = [
+            {'size_category': cat, 'n': stats[cat]['n'],
+             'whislo': stats[cat][0.1], 'q1': stats[cat][0.25], 'med': stats[cat][0.5],
+             'q3': stats[cat][0.75], 'whishi': stats[cat][0.9]}
+            for cat in SIZE_ORDER if cat in stats
+        ]
+        return pd.DataFrame(rows, columns=['size_category', 'n', 'whislo', 'q1',
+                                           'med', 'q3', 'whishi'])
+
+    raise ValueError(f"Unknown plot kind: {spec.kind}")
+
+
+def fingerprint(df: pd.DataFrame, spec: PlotSpec) -> str:
+    """Hash of the spec parameters and its input data."""
+    h = hashlib.sha256(json.dumps(asdict(spec), sort_keys=True, default=str).encode())
+    h.update(df.to_csv(index=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+# Average Price by Arrondissement (bar chart, any source)
+def render_arrondissement(df: pd.DataFrame, spec: PlotSpec, save_path: str = None):
     """
-    query = """
-        SELECT 
-            arrondissement,
-            COUNT(*) as listing_count,
-            ROUND(AVG(price_eur), 2) as avg_price,
-            ROUND(AVG(price_per_m2), 2) as avg_price_per_m2
-        FROM rentals
-        WHERE arrondissement IS NOT NULL 
-          AND price_eur IS NOT NULL
-          AND price_eur > 0
-          AND source = 'lacartedescolocs'  -- SHARED ONLY
-        GROUP BY arrondissement
-        ORDER BY CAST(arrondissement AS INTEGER)
+    Bar chart showing average rental prices by Paris arrondissement, with
+    95% confidence intervals when the averages are estimates.
     """
-    
-    df = pd.read_sql_query(query, conn)
-    
+    plt = pyplot()
     if df.empty:
-        print("No data available for shared arrondissement visualization.")
+        print(f"No data available for {spec.name} visualization.")
         return
-    
+
     fig, ax = plt.subplots(figsize=(14, 7))
-    
+
     # Create bar positions
     x = np.arange(len(df))
     width = 0.6
-    
-    # Color bars with orange gradient (shared = orange theme)
-    colors = plt.cm.Oranges(np.linspace(0.3, 0.8, len(df)))
-    
-    bars = ax.bar(x, df['avg_price'], width, color=colors, edgecolor='white', linewidth=0.7)
-    
-    # Add value labels on bars
-    for bar, count in zip(bars, df['listing_count']):
+
+    # Color bars with the spec's gradient
+    colors = plt.get_cmap(spec.cmap)(np.linspace(*spec.cmap_range, len(df)))
+
+    approx = 'avg_price_ci' in df
+    bars = ax.bar(x, df['avg_price'], width, color=colors, edgecolor='white', linewidth=0.7,
+                  yerr=df['avg_price_ci'] if approx else None,
+                  error_kw={'ecolor': COLORS['primary'], 'capsize': 3, 'linewidth': 1})
+
+    # Add value labels on bars (above the error bar for estimates)
+    for i, (bar, count) in enumerate(zip(bars, df['listing_count'])):
         height = bar.get_height()
-        ax.annotate(f'€{int(height)}',
-                    xy=(bar.get_x() + bar.get_width() / 2, height),
+        top = height + (df['avg_price_ci'].iloc[i] if approx else 0)
+        ax.annotate(f'≈€{int(height)}' if approx else f'€{int(height)}',
+                    xy=(bar.get_x() + bar.get_width() / 2, top),
                     xytext=(0, 3),
                     textcoords="offset points",
                     ha='center', va='bottom', fontsize=9, fontweight='bold')
@@ -162,159 +253,264 @@ def plot_price_by_arrondissement_shared(conn: sqlite3.Connection, save_path: str
                     xytext=(0, 5),
                     textcoords="offset points",
                     ha='center', va='bottom', fontsize=8, color='gray')
-    
+
     # Customize axes
     ax.set_xlabel('Arrondissement', fontweight='bold')
     ax.set_ylabel('Average Monthly Rent (€)', fontweight='bold')
-    ax.set_title('Shared Accommodation Prices by Paris Arrondissement\n(La Carte des Colocs - Room in shared housing)', 
-                 fontsize=14, fontweight='bold', pad=15)
+    title = f"{spec.title}\n(preview: stratified sample, 95% CI)" if approx else spec.title
+    ax.set_title(title, fontsize=spec.title_size, fontweight='bold', pad=spec.title_pad)
     ax.set_xticks(x)
     ax.set_xticklabels([f"{arr}e" for arr in df['arrondissement']], rotation=45, ha='right')
-    
+
     # Add average line
     avg_all = df['avg_price'].mean()
-    ax.axhline(y=avg_all, color=COLORS['secondary'], linestyle='--', linewidth=2, label=f'Shared Average: €{avg_all:.0f}')
+    ax.axhline(y=avg_all, color=COLORS['secondary'], linestyle='--', linewidth=2, label=f'{spec.avg_label}: €{avg_all:.0f}')
     ax.legend(loc='upper right')
-    
+
     # Remove top and right spines
     ax.spines['top'].set_visible(False)
     ax.spines['right'].set_visible(False)
-    
+
     plt.tight_layout()
-    
+
     if save_path:
         plt.savefig(save_path, dpi=150, bbox_inches='tight', facecolor='white')
         print(f"Saved: {save_path}")
-    
+
     plt.close()  # Close figure to free memory
 
 
-# Price Distribution by Size - SHARED ONLY (PARIS ONLY)
-def plot_price_by_size_comparison(conn: sqlite3.Connection, save_path_shared: str = None):
+# Price Distribution by Size (box plot from sketch percentiles, PARIS ONLY)
+def render_size(df: pd.DataFrame, spec: PlotSpec, save_path: str = None):
     """
-    Box plot showing price distribution by size for shared accommodations (PARIS ONLY).
+    Box plot showing price distribution by size (PARIS ONLY).
+    Boxes span p25-p75 and whiskers p10-p90, all read from the price sketches.
     """
-    query = """
-        SELECT 
-            CASE 
-                WHEN size_m2 < 20 THEN '< 20 m²'
-                WHEN size_m2 BETWEEN 20 AND 30 THEN '20-30 m²'
-                WHEN size_m2 BETWEEN 31 AND 50 THEN '31-50 m²'
-                WHEN size_m2 BETWEEN 51 AND 80 THEN '51-80 m²'
-                WHEN size_m2 > 80 THEN '> 80 m²'
-            END as size_category,
-            price_eur
-        FROM rentals
-        WHERE size_m2 IS NOT NULL 
-          AND price_eur IS NOT NULL
-          AND size_m2 > 0
-          AND price_eur > 0
-          AND price_eur < 5000  -- Filter extreme outliers
-          AND arrondissement IS NOT NULL  -- PARIS ONLY
-          AND source = 'lacartedescolocs'  -- SHARED ONLY
-    """
-    
-    df = pd.read_sql_query(query, conn)
-    
+    plt = pyplot()
     if df.empty:
         print("No data available for size category visualization.")
         return
-    
-    # Define category order
-    size_order = ['< 20 m²', '20-30 m²', '31-50 m²', '51-80 m²', '> 80 m²']
-    df['size_category'] = pd.Categorical(df['size_category'], categories=size_order, ordered=True)
-    df = df.dropna(subset=['size_category'])
-    
+
     fig, ax = plt.subplots(figsize=(12, 7))
-    
-    categories = [cat for cat in size_order if cat in df['size_category'].values]
-    data = [df[df['size_category'] == cat]['price_eur'].values for cat in categories]
-    
-    # Filter out empty categories
-    non_empty = [(cat, d) for cat, d in zip(categories, data) if len(d) > 0]
-    if not non_empty:
-        print("No data points for shared size visualization")
-        plt.close()
-        return
-    categories, data = zip(*non_empty)
-    
-    bp = ax.boxplot(data, patch_artist=True, labels=categories)
-    
-    colors = plt.cm.Oranges(np.linspace(0.3, 0.8, len(categories)))
+
+    categories = list(df['size_category'])
+    stats = [
+        {'label': row.size_category, 'whislo': row.whislo, 'q1': row.q1, 'med': row.med,
+         'q3': row.q3, 'whishi': row.whishi, 'fliers': []}
+        for row in df.itertuples()
+    ]
+
+    bp = ax.bxp(stats, patch_artist=True, showfliers=False)
+
+    colors = plt.get_cmap(spec.cmap)(np.linspace(*spec.cmap_range, len(categories)))
     for patch, color in zip(bp['boxes'], colors):
         patch.set_facecolor(color)
         patch.set_alpha(0.8)
-    
+
     for whisker in bp['whiskers']:
         whisker.set(color=COLORS['primary'], linewidth=1.5)
     for cap in bp['caps']:
         cap.set(color=COLORS['primary'], linewidth=1.5)
     for median in bp['medians']:
         median.set(color=COLORS['secondary'], linewidth=2)
-    
+
     # Add count and median annotations
-    for i, cat in enumerate(categories):
-        count = len(df[df['size_category'] == cat])
-        median_val = df[df['size_category'] == cat]['price_eur'].median()
-        ax.annotate(f'n={count}', xy=(i + 1, ax.get_ylim()[0]), 
+    for i, row in enumerate(df.itertuples()):
+        ax.annotate(f'n={row.n}', xy=(i + 1, ax.get_ylim()[0]),
                     xytext=(0, 10), textcoords='offset points',
                     ha='center', fontsize=9, color='gray')
-        ax.annotate(f'€{median_val:.0f}', xy=(i + 1, median_val), 
+        ax.annotate(f'€{row.med:.0f}', xy=(i + 1, row.med),
                     xytext=(0, 5), textcoords='offset points',
                     ha='center', fontsize=8, color=COLORS['secondary'], fontweight='bold')
-    
+
     ax.set_xlabel('Apartment Size (Total)', fontweight='bold')
     ax.set_ylabel('Monthly Rent (€)', fontweight='bold')
-    ax.set_title('Shared Accommodation Prices by Size\n(La Carte des Colocs - Price per room in shared housing)', 
-                 fontsize=14, fontweight='bold', pad=15)
-    
+    ax.set_title(spec.title, fontsize=spec.title_size, fontweight='bold', pad=spec.title_pad)
+
     ax.spines['top'].set_visible(False)
     ax.spines['right'].set_visible(False)
-    
+
     plt.tight_layout()
-    
-    if save_path_shared:
-        plt.savefig(save_path_shared, dpi=150, bbox_inches='tight', facecolor='white')
-        print(f"Saved: {save_path_shared}")
-    
+
+    if save_path:
+        plt.savefig(save_path, dpi=150, bbox_inches='tight', facecolor='white')
+        print(f"Saved: {save_path}")
+
     plt.close()
 
 
+RENDERERS = {
+    "arrondissement": render_arrondissement,
+    "size": render_size,
+}
+
+
+def render_spec(spec: PlotSpec, df: pd.DataFrame, save_path: str) -> float:
+    """Render one spec (in a worker process, or inline); returns render seconds."""
+    start = time.perf_counter()
+    RENDERERS[spec.kind](df, spec, save_path)
+    return time.perf_counter() - start
+
+
+def render_jobs(jobs: list, workers: int):
+    """
+    Yield (job, render seconds or the exception) in job order. With a single
+    worker the plots are rendered inline: a one-process pool only adds the
+    spawn and the pickling of every frame.
+    """
+    if workers <= 1:
+        for job in jobs:
+            try:
+                yield job, render_spec(*job[:3])
+            except Exception as e:
+                yield job, e
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [(job, pool.submit(render_spec, *job[:3])) for job in jobs]
+        for job, future in futures:
+            try:
+                yield job, future.result()
+            except Exception as e:
+                yield job, e
+
+
+def get_spec(name: str) -> PlotSpec:
+    return next(spec for spec in PLOT_SPECS if spec.name == name)
+
+
+# Single-plot entry points, kept for scripts that call them directly
+def plot_price_by_arrondissement(conn: sqlite3.Connection, save_path: str = None):
+    """Bar chart of average prices by arrondissement (all sources)."""
+    spec = get_spec("price_by_arrondissement")
+    render_arrondissement(prepare_data(load_frame(conn), spec), spec, save_path)
+
+
+def plot_price_by_arrondissement_shared(conn: sqlite3.Connection, save_path: str = None):
+    """Bar chart of average prices by arrondissement (La Carte des Colocs only)."""
+    spec = get_spec("price_by_arrondissement_shared")
+    render_arrondissement(prepare_data(load_frame(conn), spec), spec, save_path)
+
+
+def plot_price_by_size_comparison(conn: sqlite3.Connection, save_path_shared: str = None):
+    """Box plot of shared-accommodation prices by size (Paris only)."""
+    spec = get_spec("price_by_size_shared")
+    render_size(prepare_data(None, spec, conn), spec, save_path_shared)
+
+
+def load_fingerprints(output_dir: Path) -> dict:
+    path = output_dir / FINGERPRINT_FILE
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+_fingerprint_lock = threading.Lock()
+
+
+def save_fingerprints(output_dir: Path, updates: dict):
+    """Merge updated entries into the fingerprint file, so concurrent runs on
+    different specs (e.g. from pipeline.py) do not drop each other's entries."""
+    with _fingerprint_lock:
+        fingerprints = load_fingerprints(output_dir)
+        fingerprints.update(updates)
+        tmp = output_dir / f"{FINGERPRINT_FILE}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(fingerprints, f, indent=2, sort_keys=True)
+        os.replace(tmp, output_dir / FINGERPRINT_FILE)
+
+
 # main to generate all
-def generate_all_visualizations():
-    """Generate and save all visualizations."""
+@instrumented()
+def generate_all_visualizations(db_path: str = "paris_rentals.db", output_dir: str = "plots",
+                                specs: list[PlotSpec] = None, workers: int = None,
+                                force: bool = False, approx: bool = False) -> dict:
+    """
+    Generate and save all visualizations (from the preview sample with approx).
+    Returns {plot name: 'rendered' | 'skipped' | 'empty'}.
+    """
     print("="*60)
     print("GENERATING PARIS RENTAL VISUALIZATIONS")
     print("="*60)
-    
+
     try:
-        conn = get_connection()
+        conn = get_connection(db_path)
     except FileNotFoundError as e:
         print(f"Error: {e}")
-        return
-    
+        return {}
+
     # Create output directory
-    output_dir = Path("plots")
-    output_dir.mkdir(exist_ok=True)
-    
-    print("\n1. Generating Price by Arrondissement chart (ALL)...")
-    plot_price_by_arrondissement(conn, str(output_dir / "price_by_arrondissement.png"))
-    
-    print("\n2. Generating Price by Arrondissement chart (SHARED ONLY)...")
-    plot_price_by_arrondissement_shared(conn, str(output_dir / "price_by_arrondissement_shared.png"))
-    
-    print("\n3. Generating Price by Size chart (SHARED ONLY)...")
-    plot_price_by_size_comparison(
-        conn, 
-        save_path_shared=str(output_dir / "price_by_size_shared.png")
-    )
-    
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    specs = specs or PLOT_SPECS
+
+    start = time.perf_counter()
+    frame = load_frame(conn, approx)
+    print(f"\nLoaded shared frame{' (sample)' if approx else ''}: {len(frame)} rows "
+          f"in {time.perf_counter() - start:.3f}s")
+
+    previous = load_fingerprints(output_dir)
+    updates = {}
+    status = {}
+    jobs = []
+
+    for i, spec in enumerate(specs, 1):
+        prep_start = time.perf_counter()
+        df = prepare_data(frame, spec, conn)
+        prep_time = time.perf_counter() - prep_start
+        save_path = output_dir / f"{spec.name}.png"
+        fp = fingerprint(df, spec)
+
+        print(f"\n{i}. {spec.label}...")
+        if df.empty:
+            print("   No data available, skipped")
+            status[spec.name] = "empty"
+        elif not force and previous.get(spec.name) == fp and save_path.exists():
+            print(f"   Unchanged since last render, skipped (prepare {prep_time:.3f}s)")
+            status[spec.name] = "skipped"
+        else:
+            jobs.append((spec, df, str(save_path), fp, prep_time))
+
     conn.close()
-    
+
+    if jobs:
+        workers = min(workers or 4, len(jobs), os.cpu_count() or 1)
+        with stage("render_plots", records=len(jobs)):
+            print("\nPer-plot timings:")
+            for (spec, _, save_path, fp, prep_time), render_time in render_jobs(jobs, workers):
+                if isinstance(render_time, Exception):
+                    print(f"   {spec.name:34s} FAILED: {render_time}")
+                    status[spec.name] = "failed"
+                    continue
+                updates[spec.name] = fp
+                status[spec.name] = "rendered"
+                print(f"   {spec.name:34s} prepare {prep_time:.3f}s  render {render_time:.3f}s")
+
+    save_fingerprints(output_dir, updates)
+
     print("\n" + "="*60)
-    print("All visualizations saved to 'plots/' directory")
+    print(f"All visualizations saved to '{output_dir}/' directory "
+          f"({time.perf_counter() - start:.2f}s total)")
     print("="*60)
+    return status
+
+
+def main(argv: list[str] = None):
+    import argparse
+
+    configure()
+    parser = argparse.ArgumentParser(description="Render the Paris rental charts")
+    parser.add_argument("--db", default="paris_rentals.db")
+    parser.add_argument("--output", default=None, help="Output directory (plots, or plots/preview)")
+    parser.add_argument("--workers", type=int, default=None, help="Render processes")
+    parser.add_argument("--force", action="store_true", help="Re-render unchanged plots")
+    parser.add_argument("--approx", action="store_true",
+                        help="Preview from the stratified sample, with confidence intervals")
+    args = parser.parse_args(argv)
+    output = args.output or ("plots/preview" if args.approx else "plots")
+    generate_all_visualizations(args.db, output, workers=args.workers, force=args.force,
+                                approx=args.approx)
 
 
 if __name__ == "__main__":
-    generate_all_visualizations()
+    main()
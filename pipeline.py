@@ -0,0 +1,342 @@
+"""
+Pipeline orchestrator: crawl -> merge -> database -> plots.
+
+Stages declare their input and output files; dependencies are derived from
+them (a stage depends on whichever stage produces one of its inputs). A
+stage re-runs only when it is stale: an output is missing or was modified,
+or the content of an input (data or the code that processes it) changed
+since its last successful run. Independent stages run in parallel, e.g. the
+two spiders or the per-plot renders.
+
+Crawls fetch live data, so they only run when their output is missing, when
+named explicitly or with --recrawl.
+
+Usage:
+    python pipeline.py status
+    python pipeline.py run                      # everything that is stale
+    python pipeline.py run plot:price_by_size_shared --jobs 4
+    python pipeline.py run --recrawl --force
+"""
+
+import argparse
+import hashlib
+import json
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+ROOT = Path(__file__).resolve().parent
+ANALYSIS_DIR = ROOT / "data_analysis"
+SPIDERS_DIR = ROOT / "French_Rentals" / "spiders"
+STATE_FILE = ROOT / ".pipeline_state.json"
+
+# The analysis scripts import their siblings by bare name
+sys.path.insert(0, str(ANALYSIS_DIR))
+
+from instrumentation import configure, stage as instrument  # noqa: E402
+
+
+RAW_FILES = {
+    "studapart": ROOT / "output_all.json",
+    "lacartedescolocs": ROOT / "data_paris.json",
+}
+MERGED_JSON = ANALYSIS_DIR / "merged_rentals.json"
+CHANGES_DIR = ANALYSIS_DIR / "changes"
+SNAPSHOT_DIR = ANALYSIS_DIR / "snapshots"
+DB_PATH = ANALYSIS_DIR / "paris_rentals.db"
+PLOTS_DIR = ANALYSIS_DIR / "plots"
+OVERVIEW_PNG = ANALYSIS_DIR / "rental_analysis_log.png"
+
+# Chart names of visualizations.PLOT_SPECS (kept here so `status` needs no pandas)
+PLOT_NAMES = ["price_by_arrondissement", "price_by_arrondissement_shared", "price_by_size_shared"]
+
+
+@dataclass
+class Stage:
+    name: str
+    inputs: list[Path]
+    outputs: list[Path]
+    action: Callable[[], None]
+    volatile: bool = False
+    deps: list[str] = field(default_factory=list)
+
+
+# -- stage actions -----------------------------------------------------------
+
+def crawl(spider: str, output: Path):
+    subprocess.run([sys.executable, "-m", "scrapy", "crawl", spider, "-O", str(output)],
+                   cwd=ROOT, check=True)
+
+
+def merge():
+    from change_feed import write_change_feed
+    from merge_data import merge_datasets, save_merged
+    from snapshot_store import SnapshotStore
+
+    merged = merge_datasets([(str(path), source) for source, path in RAW_FILES.items()])
+    save_merged(merged, str(MERGED_JSON))
+    write_change_feed(merged, str(CHANGES_DIR))
+    SnapshotStore(str(SNAPSHOT_DIR)).write(merged)
+
+
+def build_database():
+    from create_database import create_tables, insert_data
+    from database import connect_writer
+
+    with open(MERGED_JSON, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    conn = connect_writer(str(DB_PATH))
+    try:
+        create_tables(conn)
+        insert_data(conn, data)
+    finally:
+        conn.close()
+
+
+def render_plot(name: str):
+    from visualizations import generate_all_visualizations, get_spec
+
+    status = generate_all_visualizations(str(DB_PATH), str(PLOTS_DIR), specs=[get_spec(name)], workers=1)
+    if status.get(name) == "failed":
+        raise RuntimeError(f"rendering {name} failed")
+
+
+def render_overview():
+    import matplotlib
+    matplotlib.use("Agg")
+    from data_analysis import load_clean_data, render_analysis
+
+    render_analysis(load_clean_data(str(DB_PATH)), str(OVERVIEW_PNG))
+
+
+def build_stages() -> dict[str, Stage]:
+    code = lambda *names: [ANALYSIS_DIR / n for n in names]  # noqa: E731
+    db_code = code("create_database.py", "database.py", "outliers.py", "quantile_sketch.py",
+                   "geo_index.py", "communes_fr.db", "geocoding.py")
+
+    stages = [
+        Stage("crawl:studapart", [SPIDERS_DIR / "studapart_spider.py"], [RAW_FILES["studapart"]],
+              lambda: crawl("studapart_spider", RAW_FILES["studapart"]), volatile=True),
+        Stage("crawl:lacartedescolocs", [SPIDERS_DIR / "lacartedescolocs_spider.py"],
+              [RAW_FILES["lacartedescolocs"]],
+              lambda: crawl("lacartedescolocs_spider", RAW_FILES["lacartedescolocs"]), volatile=True),
+        Stage("merge", [*RAW_FILES.values(), *code("merge_data.py", "change_feed.py", "snapshot_store.py")],
+              [MERGED_JSON], merge),
+        Stage("database", [MERGED_JSON, *db_code], [DB_PATH], build_database),
+        Stage("overview", [DB_PATH, *code("data_analysis.py")], [OVERVIEW_PNG], render_overview),
+    ]
+    for name in PLOT_NAMES:
+        stages.append(Stage(f"plot:{name}", [DB_PATH, *code("visualizations.py", "quantile_sketch.py")],
+                            [PLOTS_DIR / f"{name}.png"], lambda name=name: render_plot(name)))
+
+    producers = {out: s.name for s in stages for out in s.outputs}
+    for s in stages:
+        s.deps = sorted({producers[i] for i in s.inputs if i in producers})
+    return {s.name: s for s in stages}
+
+
+# -- fingerprints ------------------------------------------------------------
+
+class Hasher:
+    """sha256 of file contents, cached by (size, mtime) across runs."""
+
+    def __init__(self, cache: dict):
+        self.cache = cache
+        self.lock = threading.Lock()
+
+    def __call__(self, path: Path) -> str:
+        if not path.exists():
+            return None
+        st = path.stat()
+        key = str(path.relative_to(ROOT))
+        with self.lock:
+            cached = self.cache.get(key)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        with self.lock:
+            self.cache[key] = [st.st_size, st.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+
+def load_state() -> dict:
+    if STATE_FILE.exists():
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"stages": {}, "hashes": {}}
+
+
+def save_state(state: dict):
+    tmp = STATE_FILE.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    tmp.replace(STATE_FILE)
+
+
+def rel(path: Path) -> str:
+    return str(path.relative_to(ROOT))
+
+
+def stale_reason(s: Stage, state: dict, hasher: Hasher, recrawl: bool) -> str:
+    """Why the stage must run, or None if it is fresh."""
+    missing = [rel(o) for o in s.outputs if not o.exists()]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    if s.volatile:
+        return "recrawl requested" if recrawl else None
+
+    record = state["stages"].get(s.name)
+    if record is None:
+        return "never run by the pipeline"
+    for path in s.inputs:
+        if hasher(path) != record["inputs"].get(rel(path)):
+            return f"input changed: {rel(path)}"
+    for path in s.outputs:
+        if hasher(path) != record["outputs"].get(rel(path)):
+            return f"output modified: {rel(path)}"
+    return None
+
+
+# -- scheduling --------------------------------------------------------------
+
+def select(stages: dict, targets: list[str]) -> list[str]:
+    """Targets plus everything upstream of them (all stages if no targets)."""
+    if not targets:
+        return list(stages)
+    selected, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in stages:
+            raise SystemExit(f"Unknown stage '{name}'. Known: {', '.join(stages)}")
+        if name not in selected:
+            selected.add(name)
+            todo.extend(stages[name].deps)
+    return [name for name in stages if name in selected]
+
+
+def run(stages: dict, names: list[str], explicit: set, force: bool, recrawl: bool,
+        jobs: int, dry_run: bool) -> dict:
+    """Run stale stages in dependency order, independent ones concurrently."""
+    state = load_state()
+    hasher = Hasher(state.setdefault("hashes", {}))
+    results = {}
+    pending = list(names)
+    running = {}
+    wall_start = time.perf_counter()
+
+    def execute(s: Stage):
+        start = time.perf_counter()
+        with instrument(f"pipeline.{s.name}"):
+            s.action()
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for name in list(pending):
+                s = stages[name]
+                dep_status = [results.get(d, {}).get("status") for d in s.deps if d in names]
+                if any(st in (None, "running") for st in dep_status):
+                    continue
+                pending.remove(name)
+                if any(st in ("failed", "blocked") for st in dep_status):
+                    results[name] = {"status": "blocked", "seconds": 0.0}
+                    continue
+
+                if force and (not s.volatile or recrawl) or name in explicit:
+                    reason = "forced" if force else "requested"
+                else:
+                    reason = stale_reason(s, state, hasher, recrawl)
+                if reason is None:
+                    results[name] = {"status": "fresh", "seconds": 0.0}
+                    continue
+                if dry_run:
+                    results[name] = {"status": "would run", "seconds": 0.0, "reason": reason}
+                    continue
+
+                print(f"[pipeline] {name}: running ({reason})", flush=True)
+                results[name] = {"status": "running", "reason": reason}
+                running[pool.submit(execute, s)] = name
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                s = stages[name]
+                try:
+                    seconds = future.result()
+                except BaseException as e:  # CalledProcessError, SystemExit from scripts, ...
+                    results[name].update(status="failed", seconds=0.0, error=str(e) or type(e).__name__)
+                    print(f"[pipeline] {name}: FAILED ({results[name]['error']})", flush=True)
+                    continue
+                results[name].update(status="ran", seconds=seconds)
+                state["stages"][name] = {
+                    "inputs": {rel(p): hasher(p) for p in s.inputs},
+                    "outputs": {rel(p): hasher(p) for p in s.outputs},
+                    "seconds": round(seconds, 3),
+                    "finished": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }
+                save_state(state)
+                print(f"[pipeline] {name}: done in {seconds:.2f}s", flush=True)
+
+    if not dry_run:
+        save_state(state)
+    results["_wall"] = time.perf_counter() - wall_start
+    return results
+
+
+def print_summary(results: dict):
+    wall = results.pop("_wall")
+    print(f"\n{'stage':40s} {'status':10s} {'seconds':>8s}")
+    for name, r in results.items():
+        note = f"  ({r['reason']})" if r.get("reason") and r["status"] != "ran" else ""
+        print(f"{name:40s} {r['status']:10s} {r['seconds']:8.2f}{note}")
+    busy = sum(r["seconds"] for r in results.values())
+    print(f"\nStage time {busy:.2f}s, wall time {wall:.2f}s")
+
+
+def status(stages: dict, recrawl: bool):
+    state = load_state()
+    hasher = Hasher(state.setdefault("hashes", {}))
+    print(f"{'stage':40s} {'depends on':40s} state")
+    for name, s in stages.items():
+        reason = stale_reason(s, state, hasher, recrawl)
+        print(f"{name:40s} {', '.join(s.deps) or '-':40s} {'stale: ' + reason if reason else 'fresh'}")
+
+
+def main():
+    configure()
+    parser = argparse.ArgumentParser(description="Run the crawl -> merge -> database -> plots pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("run", help="Run stale stages (and their stale upstream stages)")
+    r.add_argument("targets", nargs="*", help="Stages to bring up to date (default: all)")
+    r.add_argument("--force", action="store_true", help="Re-run selected stages even if fresh")
+    r.add_argument("--recrawl", action="store_true", help="Re-run the spiders")
+    r.add_argument("--jobs", type=int, default=4, help="Stages run concurrently")
+    r.add_argument("--dry-run", action="store_true", help="Only show what would run")
+    s = sub.add_parser("status", help="Show which stages are stale and why")
+    s.add_argument("--recrawl", action="store_true")
+    args = parser.parse_args()
+
+    stages = build_stages()
+    if args.command == "status":
+        status(stages, args.recrawl)
+        return
+
+    names = select(stages, args.targets)
+    results = run(stages, names, set(args.targets), args.force, args.recrawl, args.jobs, args.dry_run)
+    print_summary(results)
+    if any(r["status"] in ("failed", "blocked") for r in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
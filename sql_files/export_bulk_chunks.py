@@ -0,0 +1,351 @@
+"""
+Export scraped JSON as size-bounded, typed, tab-delimited chunk files for
+SQL Server BULK INSERT, plus a manifest and matching batched load script.
+
+This replaces loading a whole feed through one NVARCHAR(MAX) variable with
+OPENROWSET(... SINGLE_CLOB) + OPENJSON: every chunk is loaded independently
+(and can be loaded in parallel sessions) into a staging heap, then moved into
+the Studapart / LaCarteDesColocs tables.
+
+Usage:
+    python export_bulk_chunks.py export --studapart ../output_all.json \
+        --lacartedescolocs ../data_paris.json --out bulk_export
+    python export_bulk_chunks.py verify bulk_export
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+
+# Column layout of each target table (see french_rentals_sql.sql), without the
+# identity and computed columns. Types are the SQL Server types of the table.
+TABLES = {
+    "Studapart": [
+        ("AdUrl", "NVARCHAR(MAX)"),
+        ("AdTitle", "NVARCHAR(255)"),
+        ("RentalPrice_EUR", "INT"),
+        ("RentalAddrese", "NVARCHAR(1000)"),
+        ("RentalSize_m2", "INT"),
+        ("RentalRooms", "INT"),
+        ("RentalFloor", "NVARCHAR(25)"),
+        ("RentalType", "NVARCHAR(100)"),
+        ("Furnished", "NVARCHAR(25)"),
+    ],
+    "LaCarteDesColocs": [
+        ("AdUrl", "NVARCHAR(MAX)"),
+        ("AdTitle", "NVARCHAR(255)"),
+        ("RentalPrice_EUR", "INT"),
+        ("RentalAddrese", "NVARCHAR(1000)"),
+        ("RentalSize_m2", "INT"),
+        ("RentalRooms", "INT"),
+        ("RentalFloor", "NVARCHAR(25)"),
+        ("RentalType", "NVARCHAR(100)"),
+        ("Furnished", "NVARCHAR(25)"),
+        ("Latitude", "FLOAT"),
+        ("Longitude", "FLOAT"),
+    ],
+}
+
+# JSON key for columns whose name differs from the spider field
+SOURCE_KEYS = {"Latitude": "Lat", "Longitude": "Lon"}
+
+# Columns where the load script replaces NULL / '' with '-'
+DASH_DEFAULT = {"RentalAddrese", "RentalFloor", "RentalType", "Furnished"}
+
+FIELD_SEP = "\t"
+ROW_SEP = "\n"
+DEFAULT_CHUNK_BYTES = 64 * 1024 * 1024
+BATCH_SIZE = 50000
+
+
+def to_int(value):
+    """TRY_CAST(NULLIF(value, '') AS INT)."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return int(value) if re.fullmatch(r"-?\d+", value) else None
+
+
+def to_float(value):
+    """TRY_CAST(value AS FLOAT)."""
+    try:
+        return float(value) if value not in (None, "") else None
+    except (ValueError, TypeError):
+        return None
+
+
+def to_furnished(value) -> str:
+    """Map 'Meublé' / 'Non meublé' to 'True' / 'False', empty to '-'."""
+    if not value:
+        return "-"
+    lowered = str(value).strip().lower()
+    if lowered == "meublé":
+        return "True"
+    if lowered == "non meublé":
+        return "False"
+    return str(value)
+
+
+def normalize_row(record: dict, table: str) -> tuple:
+    """Apply the load script's casts and NULL handling to one spider record."""
+    row = []
+    for column, sql_type in TABLES[table]:
+        value = record.get(SOURCE_KEYS.get(column, column))
+        if column == "Furnished":
+            value = to_furnished(value)
+        elif sql_type == "INT":
+            value = to_int(value)
+        elif sql_type == "FLOAT":
+            value = to_float(value)
+        elif column in DASH_DEFAULT:
+            value = str(value) if value not in (None, "") else "-"
+        else:
+            value = str(value) if value is not None else None
+        row.append(value)
+    return tuple(row)
+
+
+def encode_field(value) -> str:
+    """
+    Render one field for BULK INSERT. Empty means NULL (KEEPNULLS); tabs and
+    line breaks are flattened because BULK INSERT has no escape character.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return repr(value)
+    return re.sub(r"[\t\r\n]+", " ", str(value))
+
+
+def decode_field(text: str, sql_type: str):
+    """Inverse of encode_field for a given SQL type."""
+    if text == "":
+        return None
+    if sql_type == "INT":
+        return int(text)
+    if sql_type == "FLOAT":
+        return float(text)
+    return text
+
+
+def row_digest(row: tuple) -> int:
+    """Order-independent row checksum component (64-bit)."""
+    canonical = json.dumps(list(row), ensure_ascii=False, separators=(",", ":"))
+    return int.from_bytes(hashlib.sha256(canonical.encode("utf-8")).digest()[:8], "big")
+
+
+def combine_digests(total: int, digest: int) -> int:
+    return (total + digest) % (1 << 64)
+
+
+def export_table(records: list[dict], table: str, out_dir: Path, chunk_bytes: int) -> dict:
+    """Write one table's rows as chunk files; return its manifest entry."""
+    chunks = []
+    seen_urls = set()
+    current = None
+
+    def close_chunk():
+        if current is None:
+            return
+        current["handle"].close()
+        chunks.append({
+            "file": current["path"].name,
+            "rows": current["rows"],
+            "bytes": current["bytes"],
+            "sha256": current["sha"].hexdigest(),
+            "checksum": str(current["checksum"]),
+        })
+
+    for record in records:
+        row = normalize_row(record, table)
+        # AdUrlHash is UNIQUE in the target tables
+        if not row[0] or row[0] in seen_urls:
+            continue
+        seen_urls.add(row[0])
+
+        line = (FIELD_SEP.join(encode_field(v) for v in row) + ROW_SEP).encode("utf-8")
+        if current is None or (current["rows"] and current["bytes"] + len(line) > chunk_bytes):
+            close_chunk()
+            path = out_dir / f"{table.lower()}_{len(chunks):05d}.tsv"
+            current = {"path": path, "handle": open(path, "wb"), "rows": 0,
+                       "bytes": 0, "sha": hashlib.sha256(), "checksum": 0}
+
+        current["handle"].write(line)
+        current["sha"].update(line)
+        current["rows"] += 1
+        current["bytes"] += len(line)
+        current["checksum"] = combine_digests(current["checksum"], row_digest(row))
+
+    close_chunk()
+    return {
+        "columns": [{"name": c, "type": t} for c, t in TABLES[table]],
+        "rows": sum(c["rows"] for c in chunks),
+        "chunks": chunks,
+    }
+
+
+def build_load_script(manifest: dict, data_dir: str) -> str:
+    """Generate staging tables, one BULK INSERT per chunk, and the final move."""
+    lines = [
+        "-- Generated by export_bulk_chunks.py.",
+        f"-- Chunk directory as seen by the SQL Server instance: {data_dir}",
+        "-- Each BULK INSERT is independent and may run in a separate session.",
+        "USE french_rentals;",
+        "",
+    ]
+    for table, entry in manifest["tables"].items():
+        staging = f"{table}_Staging"
+        columns = ",\n    ".join(f"{c['name']} {c['type']} NULL" for c in entry["columns"])
+        names = ", ".join(c["name"] for c in entry["columns"])
+
+        lines += [
+            f"IF OBJECT_ID('{staging}') IS NOT NULL DROP TABLE {staging};",
+            f"CREATE TABLE {staging}(\n    {columns}\n);",
+            "",
+        ]
+        for chunk in entry["chunks"]:
+            path = f"{data_dir}\\{chunk['file']}"
+            lines += [
+                f"-- {chunk['file']}: {chunk['rows']} rows, sha256 {chunk['sha256']}",
+                f"BULK INSERT {staging}",
+                f"FROM '{path}'",
+                "WITH (",
+                "    CODEPAGE = '65001',",
+                "    FIELDTERMINATOR = '\\t',",
+                "    ROWTERMINATOR = '0x0a',",
+                "    KEEPNULLS,",
+                "    TABLOCK,",
+                f"    BATCHSIZE = {BATCH_SIZE}",
+                ");",
+                "",
+            ]
+        lines += [
+            f"INSERT INTO {table}({names})",
+            f"SELECT {names} FROM {staging} s",
+            f"WHERE NOT EXISTS (SELECT 1 FROM {table} t",
+            "                  WHERE t.AdUrlHash = CAST(HASHBYTES('SHA2_256', s.AdUrl) AS BINARY(32)));",
+            f"-- expected rows: {entry['rows']}",
+            f"DROP TABLE {staging};",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def export(sources: dict, out_dir: str, chunk_bytes: int, data_dir: str) -> dict:
+    """Export every available source and write manifest.json and load_chunks.sql."""
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+
+    manifest = {"format": {"field_terminator": "\\t", "row_terminator": "\\n",
+                           "encoding": "utf-8", "null": "empty field"},
+                "chunk_bytes": chunk_bytes, "tables": {}}
+
+    for table, json_path in sources.items():
+        if not json_path:
+            continue
+        print(f"Loading {json_path}...")
+        with open(json_path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        entry = export_table(records, table, out, chunk_bytes)
+        manifest["tables"][table] = entry
+        print(f"  {table}: {entry['rows']} rows in {len(entry['chunks'])} chunk(s)")
+
+    with open(out / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    with open(out / "load_chunks.sql", "w", encoding="utf-8") as f:
+        f.write(build_load_script(manifest, data_dir))
+
+    print(f"Wrote manifest and load script to {out}")
+    return manifest
+
+
+def verify(out_dir: str) -> bool:
+    """
+    Round-trip every chunk into an in-memory SQLite table and compare row
+    counts, file hashes and row checksums against the manifest.
+    """
+    out = Path(out_dir)
+    with open(out / "manifest.json", "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    conn = sqlite3.connect(":memory:")
+    ok = True
+
+    for table, entry in manifest["tables"].items():
+        columns = [(c["name"], c["type"]) for c in entry["columns"]]
+        conn.execute(f"CREATE TABLE {table} ({', '.join(name for name, _ in columns)})")
+        placeholders = ", ".join("?" * len(columns))
+
+        for chunk in entry["chunks"]:
+            path = out / chunk["file"]
+            sha = hashlib.sha256(path.read_bytes()).hexdigest()
+
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                reader = csv.reader(f, delimiter=FIELD_SEP, quoting=csv.QUOTE_NONE)
+                rows = [tuple(decode_field(v, t) for v, (_, t) in zip(line, columns))
+                        for line in reader]
+            conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+
+            checksum = 0
+            for row in rows:
+                checksum = combine_digests(checksum, row_digest(row))
+
+            chunk_ok = (sha == chunk["sha256"] and len(rows) == chunk["rows"]
+                        and str(checksum) == chunk["checksum"])
+            ok &= chunk_ok
+            print(f"  {chunk['file']}: rows={len(rows)} {'OK' if chunk_ok else 'MISMATCH'}")
+
+        loaded = conn.execute(f"SELECT * FROM {table}").fetchall()
+        table_checksum = 0
+        for row in loaded:
+            table_checksum = combine_digests(table_checksum, row_digest(row))
+        expected = 0
+        for chunk in entry["chunks"]:
+            expected = combine_digests(expected, int(chunk["checksum"]))
+
+        table_ok = len(loaded) == entry["rows"] and table_checksum == expected
+        ok &= table_ok
+        print(f"{table}: {len(loaded)}/{entry['rows']} rows, checksum "
+              f"{'OK' if table_ok else 'MISMATCH'}")
+
+    conn.close()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunked bulk export for SQL Server")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    exp = sub.add_parser("export", help="Write chunk files, manifest and load script")
+    exp.add_argument("--studapart", help="Studapart spider JSON output")
+    exp.add_argument("--lacartedescolocs", help="La Carte des Colocs spider JSON output")
+    exp.add_argument("--out", default="bulk_export", help="Output directory")
+    exp.add_argument("--chunk-mb", type=float, default=DEFAULT_CHUNK_BYTES / (1024 * 1024),
+                     help="Maximum chunk size in MiB")
+    exp.add_argument("--data-dir", default="I:\\m2\\data acquistion\\bulk_export",
+                     help="Chunk directory as seen by SQL Server (used in load_chunks.sql)")
+
+    ver = sub.add_parser("verify", help="Round-trip chunks into SQLite and check the manifest")
+    ver.add_argument("out", help="Export directory")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        sources = {"Studapart": args.studapart, "LaCarteDesColocs": args.lacartedescolocs}
+        if not any(sources.values()):
+            print("Error: pass --studapart and/or --lacartedescolocs.")
+            return 1
+        export(sources, args.out, int(args.chunk_mb * 1024 * 1024), args.data_dir)
+        return 0
+
+    return 0 if verify(args.out) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The tests import French_Rentals from the repository root, as `python -m` does
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
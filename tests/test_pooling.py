@@ -0,0 +1,59 @@
+"""
+Pooled impersonation handler vs scrapy_impersonate's stock handler, crawling a
+local TLS stand-in server (French_Rentals/check_pooling.py). Set
+POOLING_REQUESTS to change the number of requests per crawl.
+"""
+
+import os
+
+import pytest
+
+pytest.importorskip("scrapy_impersonate")
+
+from French_Rentals.check_pooling import REQUESTS, compare, print_comparison  # noqa: E402
+
+
+N = int(os.environ.get("POOLING_REQUESTS", REQUESTS))
+
+
+@pytest.fixture(scope="module")
+def runs():
+    runs = compare(N)
+    print_comparison(runs, N)
+    return runs
+
+
+@pytest.fixture(scope="module")
+def pooled(runs):
+    return runs["pooled"]
+
+
+def test_baseline_opens_one_connection_per_request(runs):
+    assert runs["baseline"]["connections"] == N
+
+
+def test_pooled_opens_a_single_connection(pooled):
+    assert pooled["connections"] == 1
+
+
+def test_pooled_returns_the_same_pages(runs, pooled):
+    assert len(pooled["pages"]) == N
+    assert sorted(pooled["pages"]) == sorted(runs["baseline"]["pages"])
+
+
+def test_every_later_request_is_reported_as_reused(pooled):
+    assert sum(bool(t and t["reused"]) for t in pooled["timings"]) == N - 1
+
+
+def test_reused_requests_skip_the_handshake(pooled):
+    timings = [t for t in pooled["timings"] if t]
+    first = next(t for t in timings if not t["reused"])
+    assert all(t["handshake_ms"] < first["handshake_ms"] for t in timings if t["reused"])
+
+
+def test_no_cookies_replayed_from_the_session_jar(pooled):
+    assert pooled["cookies"] == 0
+
+
+def test_connection_stats_recorded(pooled):
+    assert pooled["stats"].get("impersonate/connections_new") == 1